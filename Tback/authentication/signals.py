@@ -0,0 +1,31 @@
+"""
+Signals keeping cached token authentication in step with tokens and users.
+
+Cached snapshots are dropped once the change commits; dropping them earlier
+would let a concurrent request cache the old row again before the new one
+is visible.
+"""
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .models import User
+from .token_cache import forget_token, forget_user_tokens
+
+# Saves that touch only these fields leave cached snapshots valid
+AUTH_IRRELEVANT_FIELDS = frozenset({'last_login'})
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Stop authenticating with a token once it is deleted, e.g. on logout"""
+    transaction.on_commit(partial(forget_token, instance.key))
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Refresh cached snapshots of a user after any change, including password and is_active"""
+    if created or raw:
+        return
+    if update_fields and set(update_fields) <= AUTH_IRRELEVANT_FIELDS:
+        return
+    transaction.on_commit(partial(forget_user_tokens, instance.pk))
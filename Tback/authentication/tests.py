@@ -1,3 +1,101 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from .models import User
+from .token_cache import clear_local_tokens
 
-# Create your tests here.
+
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_tokens()
+        self.addCleanup(clear_local_tokens)
+        self.user = User.objects.create_user(
+            username='cached', email='cached@example.com', password='cachedpass123',
+            first_name='Cached', last_name='User'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('profile')
+    
+    def _get_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, len(queries)
+    
+    def test_repeat_requests_skip_the_token_query(self):
+        response, first = self._get_profile()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The Token JOIN User lookup
+        self.assertEqual(first, 1)
+        
+        response, repeat = self._get_profile()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], 'cached@example.com')
+        self.assertEqual(repeat, 0)
+        
+        # The shared cache serves processes whose LRU has not seen the token
+        clear_local_tokens()
+        self.assertEqual(self._get_profile()[1], 0)
+    
+    def test_logout_password_change_and_deactivation_invalidate(self):
+        self._get_profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('changedpass456')
+            self.user.save()
+        self.assertEqual(self._get_profile()[1], 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self._get_profile()[0].status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('logout')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self._get_profile()[0].status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_snapshots_are_dropped_only_after_commit(self):
+        self._get_profile()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_active = False
+            self.user.save()
+            # Still inside the transaction: nothing has been forgotten yet
+            self.assertEqual(self._get_profile()[1], 0)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(self._get_profile()[0].status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_last_login_updates_keep_the_cached_token(self):
+        self._get_profile()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self._get_profile()[1], 0)
+    
+    def test_profile_update_is_visible_on_next_request(self):
+        self._get_profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse('update_profile'), {'first_name': 'Renamed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._get_profile()[0].data['first_name'], 'Renamed')
+    
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cached_db_sessions_are_read_from_the_cache(self):
+        self.client.credentials()
+        response = self.client.post(reverse('login'), {'email': 'cached@example.com', 'password': 'cachedpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('django_session' in query['sql'] for query in queries))
@@ -0,0 +1,114 @@
+"""
+Cached token authentication.
+
+DRF's TokenAuthentication reads the Token joined with its User on every
+request. CachedTokenAuthentication keeps that token/user snapshot in a
+small per-process LRU (AUTH_TOKEN_LOCAL_CACHE_SIZE entries, each trusted
+for AUTH_TOKEN_LOCAL_CACHE_SECONDS) in front of the Django cache
+(AUTH_TOKEN_CACHE_SECONDS), so a repeat request authenticates without
+touching the database. Cache keys are hashes of the token key.
+
+Snapshots are dropped once the deletion of the token (logout) or a save
+of its user (password change, deactivation, profile edits, but not a save
+of ``last_login`` alone) commits, see ``signals.py``. Only the process that made the change is told directly:
+with a shared cache (REDIS_URL) other processes keep their LRU copy for at
+most the local TTL, but with the default per-process LocMem cache they keep
+their own cache entry too. That is why AUTH_TOKEN_CACHE_SECONDS defaults to
+the local TTL unless REDIS_URL is set; it is the longest a revoked token
+can still be accepted. Writes that bypass ``save()`` (queryset updates)
+are likewise only picked up once the cache entry expires.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+DEFAULT_LOCAL_CACHE_SECONDS = 5
+DEFAULT_CACHE_SECONDS = DEFAULT_LOCAL_CACHE_SECONDS
+DEFAULT_LOCAL_CACHE_SIZE = 1024
+
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cache_key(key):
+    return f"auth_token:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
+def _local_get(key):
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        token, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return token
+
+
+def _local_set(key, token):
+    ttl = getattr(settings, 'AUTH_TOKEN_LOCAL_CACHE_SECONDS', DEFAULT_LOCAL_CACHE_SECONDS)
+    size = getattr(settings, 'AUTH_TOKEN_LOCAL_CACHE_SIZE', DEFAULT_LOCAL_CACHE_SIZE)
+    with _lock:
+        _local[key] = (token, time.monotonic() + ttl)
+        _local.move_to_end(key)
+        while len(_local) > size:
+            _local.popitem(last=False)
+
+
+def get_token(key):
+    """Token (with its user loaded) for ``key``, from the caches or the database; None if unknown"""
+    token = _local_get(key)
+    if token is None:
+        token = cache.get(_cache_key(key))
+        if token is None:
+            token = Token.objects.select_related('user').filter(key=key).first()
+            if token is None:
+                return None
+            cache.set(_cache_key(key), token, getattr(settings, 'AUTH_TOKEN_CACHE_SECONDS', DEFAULT_CACHE_SECONDS))
+        _local_set(key, token)
+
+    # Requests may modify request.user, so never hand out the cached instances
+    user = copy.copy(token.user)
+    token = copy.copy(token)
+    token.user = user
+    return token
+
+
+def forget_token(key):
+    with _lock:
+        _local.pop(key, None)
+    cache.delete(_cache_key(key))
+
+
+def forget_user_tokens(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        forget_token(key)
+
+
+def clear_local_tokens():
+    with _lock:
+        _local.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that resolves tokens through ``get_token``"""
+
+    def authenticate_credentials(self, key):
+        token = get_token(key)
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
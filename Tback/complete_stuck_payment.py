@@ -109,9 +109,9 @@ def show_completion_instructions():
     print("\n⚡ Quick completion commands:")
     print("   python manage.py shell")
     print("   >>> from payments.models import Payment")
+    print("   >>> from payments.state import transition")
     print("   >>> p = Payment.objects.filter(status='processing').first()")
-    print("   >>> p.status = 'successful'")
-    print("   >>> p.save()")
+    print("   >>> transition(p, 'successful')")
 
 if __name__ == "__main__":
     complete_stuck_payment()
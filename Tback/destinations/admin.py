@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from django.db.models import Count
 from .models import (
     Category, Destination, DestinationHighlight, 
     DestinationInclude, DestinationImage, Review, Booking,
@@ -13,9 +14,13 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
     readonly_fields = ('created_at', 'updated_at')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(destination_count=Count('destinations'))
+    
     def destinations_count(self, obj):
-        return obj.destinations.count()
+        return obj.destination_count
     destinations_count.short_description = 'Destinations'
+    destinations_count.admin_order_field = 'destination_count'
 
 class DestinationHighlightInline(admin.TabularInline):
     model = DestinationHighlight
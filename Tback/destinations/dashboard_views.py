@@ -1,10 +1,13 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Count, Sum, Q
+from rest_framework import status
+from django.db.models import Count, Sum, Q, Value, CharField
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Booking, Destination, Review
+import base64
+from .models import Booking, Destination, Review, DashboardSummary
+from .summary import refresh_dashboard_summary, member_level_for
 from tickets.models import TicketPurchase
 from .serializers import BookingSerializer
 
@@ -15,124 +18,172 @@ def dashboard_overview(request):
     """Get dashboard overview statistics for the authenticated user"""
     user = request.user
     
-    # Get user's bookings
-    bookings = Booking.objects.filter(user=user)
-    completed_bookings = bookings.filter(status='completed')
-    
-    # Get user's ticket purchases
-    ticket_purchases = TicketPurchase.objects.filter(user=user)
-    completed_tickets = ticket_purchases.filter(status='completed')
-    
-    # Calculate statistics
-    total_bookings = bookings.count()
-    total_tickets = ticket_purchases.count()
-    destinations_visited = completed_bookings.values('destination').distinct().count()
-    
-    # Calculate total spent (bookings + tickets)
-    booking_total = bookings.aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    ticket_total = ticket_purchases.aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    total_spent = float(booking_total) + float(ticket_total)
-    
-    # Get member since date (assuming user creation date)
-    member_since = user.date_joined
-    
-    # Calculate member level based on total spent
-    if total_spent >= 5000:
-        member_level = 'Platinum'
-        member_color = 'bg-purple-100 text-purple-800'
-    elif total_spent >= 2000:
-        member_level = 'Gold'
-        member_color = 'bg-yellow-100 text-yellow-800'
-    elif total_spent >= 500:
-        member_level = 'Silver'
-        member_color = 'bg-gray-100 text-gray-800'
-    else:
-        member_level = 'Bronze'
-        member_color = 'bg-orange-100 text-orange-800'
+    # Read the materialized summary; build it on first access
+    summary = DashboardSummary.objects.filter(pk=user.pk).first()
+    if summary is None:
+        summary = refresh_dashboard_summary(user.pk)
+    
+    total_spent = float(summary.total_spent)
+    member_level, member_color = member_level_for(total_spent)
     
     return Response({
-        'total_bookings': total_bookings + total_tickets,
-        'destinations_visited': destinations_visited,
+        'total_bookings': summary.total_bookings + summary.total_tickets,
+        'destinations_visited': summary.destinations_visited,
         'total_spent': total_spent,
-        'member_since': member_since,
+        'member_since': user.date_joined,
         'member_level': member_level,
         'member_color': member_color,
         'points': int(total_spent * 0.1)  # 10% of spending as points
     })
 
 
+DASHBOARD_FEED_DEFAULT_LIMIT = 20
+DASHBOARD_FEED_MAX_LIMIT = 100
+
+DURATION_DISPLAY = {
+    '1_day': '1 Day',
+    '2_days': '2 Days, 1 Night',
+    '3_days': '3 Days, 2 Nights',
+    '4_days': '4 Days, 3 Nights',
+    '5_days': '5 Days, 4 Nights',
+    '6_days': '6 Days, 5 Nights',
+    '7_days': '7 Days, 6 Nights',
+    '7_plus_days': '7+ Days'
+}
+
+
+def encode_feed_cursor(created_at, kind, pk):
+    """Encode the position of the last feed row into an opaque cursor"""
+    raw = f"{created_at.isoformat()}|{kind}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_feed_cursor(cursor):
+    """Decode a feed cursor, returning (created_at, kind, pk) or None if invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, kind, pk = raw.split('|')
+        created_at = datetime.fromisoformat(created_at)
+        if kind not in ('destination', 'ticket'):
+            return None
+        return created_at, kind, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _feed_rows(queryset, kind, cursor):
+    """
+    Project a queryset onto the (created_at, kind, id) feed columns, applying
+    the keyset condition for rows that sort after the cursor.
+    """
+    if cursor:
+        cursor_created_at, cursor_kind, cursor_id = cursor
+        after_cursor = Q(created_at__lt=cursor_created_at)
+        # Rows sharing the cursor timestamp are ordered by kind, then id (both descending)
+        if kind < cursor_kind:
+            after_cursor |= Q(created_at=cursor_created_at)
+        elif kind == cursor_kind:
+            after_cursor |= Q(created_at=cursor_created_at, id__lt=cursor_id)
+        queryset = queryset.filter(after_cursor)
+
+    return queryset.annotate(
+        kind=Value(kind, output_field=CharField())
+    ).values_list('created_at', 'kind', 'id')
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_bookings(request):
-    """Get user's bookings for dashboard"""
-    user = request.user
+    """
+    Get a page of the user's bookings and ticket purchases for the dashboard.
     
-    # Get destination bookings
-    bookings = Booking.objects.filter(user=user).select_related(
-        'destination'
-    ).prefetch_related(
-        'destination__images'
-    ).order_by('-created_at')
+    Both sources are merged by a single UNION ALL query ordered by creation
+    date and paginated with a keyset cursor, so the number of queries does not
+    grow with the user's history.
+    """
+    user = request.user
     
-    # Get ticket purchases
-    ticket_purchases = TicketPurchase.objects.filter(user=user).select_related(
-        'ticket', 'ticket__venue'
-    ).order_by('-created_at')
+    try:
+        limit = int(request.query_params.get('limit', DASHBOARD_FEED_DEFAULT_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, DASHBOARD_FEED_MAX_LIMIT))
+    
+    cursor = None
+    if request.query_params.get('cursor'):
+        cursor = decode_feed_cursor(request.query_params['cursor'])
+        if cursor is None:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # One UNION ALL query selects the page (plus one row to detect a next page)
+    booking_rows = _feed_rows(Booking.objects.filter(user=user).order_by(), 'destination', cursor)
+    ticket_rows = _feed_rows(TicketPurchase.objects.filter(user=user).order_by(), 'ticket', cursor)
+    page = list(
+        booking_rows.union(ticket_rows, all=True).order_by('-created_at', '-kind', '-id')[:limit + 1]
+    )
+    
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    booking_ids = [pk for _, kind, pk in page if kind == 'destination']
+    purchase_ids = [pk for _, kind, pk in page if kind == 'ticket']
+    
+    # Hydrate only the rows on this page
+    bookings = {}
+    if booking_ids:
+        bookings = Booking.objects.filter(id__in=booking_ids).select_related(
+            'destination'
+        ).prefetch_related('destination__images').in_bulk()
+    
+    purchases = {}
+    if purchase_ids:
+        purchases = TicketPurchase.objects.filter(id__in=purchase_ids).select_related(
+            'ticket', 'ticket__venue'
+        ).in_bulk()
     
-    # Serialize bookings
     booking_data = []
-    for booking in bookings:
-        image_url = booking.destination.images.first().image_url if booking.destination.images.exists() else None
-        # Convert duration choice to readable format
-        duration_map = {
-            '1_day': '1 Day',
-            '2_days': '2 Days, 1 Night',
-            '3_days': '3 Days, 2 Nights',
-            '4_days': '4 Days, 3 Nights',
-            '5_days': '5 Days, 4 Nights',
-            '6_days': '6 Days, 5 Nights',
-            '7_days': '7 Days, 6 Nights',
-            '7_plus_days': '7+ Days'
-        }
-        
-        booking_data.append({
-            'id': booking.booking_reference,
-            'type': 'destination',
-            'destination': booking.destination.name,
-            'date': booking.booking_date,
-            'duration': duration_map.get(booking.destination.duration, booking.destination.duration),
-            'status': booking.status,
-            'amount': f"GH₵ {booking.total_amount}",
-            'image': image_url,
-            'participants': booking.participants,
-            'created_at': booking.created_at
-        })
+    for _, kind, pk in page:
+        if kind == 'destination':
+            booking = bookings[pk]
+            # Use the prefetched images rather than issuing exists()/first() queries
+            images = booking.destination.images.all()
+            image_url = images[0].image_url if images else None
+            
+            booking_data.append({
+                'id': booking.booking_reference,
+                'type': 'destination',
+                'destination': booking.destination.name,
+                'date': booking.booking_date,
+                'duration': DURATION_DISPLAY.get(booking.destination.duration, booking.destination.duration),
+                'status': booking.status,
+                'amount': f"GH₵ {booking.total_amount}",
+                'image': image_url,
+                'participants': booking.participants,
+                'created_at': booking.created_at
+            })
+        else:
+            purchase = purchases[pk]
+            booking_data.append({
+                'id': str(purchase.purchase_id),
+                'type': 'ticket',
+                'destination': purchase.ticket.title,
+                'date': purchase.ticket.event_date.date() if purchase.ticket.event_date else None,
+                'duration': f"Event at {purchase.ticket.venue.name}" if purchase.ticket.venue else "Event",
+                'status': purchase.status,
+                'amount': f"GH₵ {purchase.total_amount}",
+                'image': purchase.ticket.image if purchase.ticket.image else None,
+                'participants': purchase.quantity,
+                'created_at': purchase.created_at
+            })
+    
+    next_cursor = None
+    if has_more and page:
+        next_cursor = encode_feed_cursor(*page[-1])
     
-    # Add ticket purchases
-    for purchase in ticket_purchases:
-        booking_data.append({
-            'id': str(purchase.purchase_id),
-            'type': 'ticket',
-            'destination': purchase.ticket.title,
-            'date': purchase.ticket.event_date.date() if purchase.ticket.event_date else None,
-            'duration': f"Event at {purchase.ticket.venue.name}" if purchase.ticket.venue else "Event",
-            'status': purchase.status,
-            'amount': f"GH₵ {purchase.total_amount}",
-            'image': purchase.ticket.image if purchase.ticket.image else None,
-            'participants': purchase.quantity,
-            'created_at': purchase.created_at
-        })
-    
-    # Sort by creation date
-    booking_data.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    return Response(booking_data)
+    return Response({
+        'results': booking_data,
+        'next_cursor': next_cursor
+    })
 
 
 @api_view(['GET'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from authentication.models import User
+from destinations.summary import compute_summaries, save_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized dashboard summary for every user'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of users to rebuild per batch (default: 500)'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        rebuilt = 0
+        
+        self.stdout.write('🔄 Rebuilding dashboard summaries...')
+        
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            
+            save_summaries(compute_summaries(user_ids))
+            rebuilt += len(user_ids)
+            last_id = user_ids[-1]
+            self.stdout.write(f'   Rebuilt {rebuilt} summaries')
+        
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt dashboard summaries for {rebuilt} users'))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+        ('destinations', '0003_destination_end_date_destination_start_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_bookings', models.PositiveIntegerField(default=0)),
+                ('total_tickets', models.PositiveIntegerField(default=0)),
+                ('booking_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('ticket_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('destinations_visited', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Dashboard Summaries',
+            },
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
+from tback_api.references import booking_reference
 
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -266,8 +267,7 @@ class Booking(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.booking_reference:
-            import uuid
-            self.booking_reference = f"TN{str(uuid.uuid4())[:6].upper()}"
+            self.booking_reference = booking_reference()
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -292,4 +292,29 @@ class BookingAddOn(models.Model):
             return f"{self.booking.booking_reference} - {self.addon_option.name}"
         elif self.experience_addon:
             return f"{self.booking.booking_reference} - {self.experience_addon.name}"
-        return f"{self.booking.booking_reference} - Unknown Add-on"
\ No newline at end of file
+        return f"{self.booking.booking_reference} - Unknown Add-on"
+
+class DashboardSummary(models.Model):
+    """Per-user dashboard totals, kept up to date from booking and ticket purchase changes"""
+    user = models.OneToOneField(
+        'authentication.User',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='dashboard_summary'
+    )
+    total_bookings = models.PositiveIntegerField(default=0)
+    total_tickets = models.PositiveIntegerField(default=0)
+    booking_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    ticket_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    destinations_visited = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Dashboard Summaries"
+    
+    def __str__(self):
+        return f"Dashboard summary for {self.user_id}"
+    
+    @property
+    def total_spent(self):
+        return self.booking_spent + self.ticket_spent
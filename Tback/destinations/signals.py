@@ -0,0 +1,54 @@
+"""
+Django signals that keep the per-user dashboard summary up to date
+"""
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from .models import Booking
+from authentication.models import User
+from .summary import booking_state, purchase_state, apply_booking_change, apply_purchase_change
+from tickets.models import TicketPurchase
+
+
+def _owner_being_deleted(instance, origin):
+    # The user's summary row goes away in the same cascade
+    return isinstance(origin, User) and origin.pk == instance.user_id
+
+
+@receiver(post_init, sender=Booking)
+def remember_booking_state(sender, instance, **kwargs):
+    instance._dashboard_state = booking_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Booking)
+def update_summary_for_booking(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = booking_state(instance)
+    apply_booking_change(None if created else instance._dashboard_state, new_state)
+    instance._dashboard_state = new_state
+
+
+@receiver(post_delete, sender=Booking)
+def update_summary_for_deleted_booking(sender, instance, origin=None, **kwargs):
+    if not _owner_being_deleted(instance, origin):
+        apply_booking_change(instance._dashboard_state, None)
+
+
+@receiver(post_init, sender=TicketPurchase)
+def remember_purchase_state(sender, instance, **kwargs):
+    instance._dashboard_state = purchase_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=TicketPurchase)
+def update_summary_for_purchase(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = purchase_state(instance)
+    apply_purchase_change(None if created else instance._dashboard_state, new_state)
+    instance._dashboard_state = new_state
+
+
+@receiver(post_delete, sender=TicketPurchase)
+def update_summary_for_deleted_purchase(sender, instance, origin=None, **kwargs):
+    if not _owner_being_deleted(instance, origin):
+        apply_purchase_change(instance._dashboard_state, None)
@@ -0,0 +1,163 @@
+"""
+Maintenance of the materialized per-user dashboard summary
+"""
+from collections import namedtuple
+from decimal import Decimal
+from django.db.models import Count, Sum, Q, F
+from django.utils import timezone
+from .models import Booking, DashboardSummary
+from tickets.models import TicketPurchase
+
+SUMMARY_FIELDS = [
+    'total_bookings', 'total_tickets', 'booking_spent',
+    'ticket_spent', 'destinations_visited', 'updated_at'
+]
+
+BookingState = namedtuple('BookingState', ['user_id', 'status', 'total_amount', 'destination_id'])
+PurchaseState = namedtuple('PurchaseState', ['user_id', 'total_amount'])
+
+
+def _as_decimal(value):
+    # Views sometimes assign floats to amount fields before saving
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+
+def booking_state(booking):
+    """Snapshot of the booking fields the summary depends on"""
+    return BookingState(booking.user_id, booking.status, _as_decimal(booking.total_amount), booking.destination_id)
+
+
+def purchase_state(purchase):
+    """Snapshot of the ticket purchase fields the summary depends on"""
+    return PurchaseState(purchase.user_id, _as_decimal(purchase.total_amount))
+
+
+def member_level_for(total_spent):
+    """Return the (level, badge color) pair for a user's total spend"""
+    if total_spent >= 5000:
+        return 'Platinum', 'bg-purple-100 text-purple-800'
+    elif total_spent >= 2000:
+        return 'Gold', 'bg-yellow-100 text-yellow-800'
+    elif total_spent >= 500:
+        return 'Silver', 'bg-gray-100 text-gray-800'
+    return 'Bronze', 'bg-orange-100 text-orange-800'
+
+
+def compute_summaries(user_ids):
+    """
+    Compute summary rows for the given users from the source tables.
+
+    Uses one grouped aggregate query per source table regardless of how many
+    users are in the batch.
+    """
+    now = timezone.now()
+    summaries = {
+        user_id: DashboardSummary(user_id=user_id, updated_at=now)
+        for user_id in user_ids
+    }
+
+    booking_totals = Booking.objects.filter(user_id__in=user_ids).order_by().values('user_id').annotate(
+        count=Count('id'),
+        spent=Sum('total_amount'),
+        visited=Count('destination', filter=Q(status='completed'), distinct=True)
+    )
+    for row in booking_totals:
+        summary = summaries[row['user_id']]
+        summary.total_bookings = row['count']
+        summary.booking_spent = row['spent'] or Decimal('0')
+        summary.destinations_visited = row['visited']
+
+    ticket_totals = TicketPurchase.objects.filter(user_id__in=user_ids).order_by().values('user_id').annotate(
+        count=Count('id'),
+        spent=Sum('total_amount')
+    )
+    for row in ticket_totals:
+        summary = summaries[row['user_id']]
+        summary.total_tickets = row['count']
+        summary.ticket_spent = row['spent'] or Decimal('0')
+
+    return list(summaries.values())
+
+
+def save_summaries(summaries):
+    """Upsert summary rows in a single statement"""
+    DashboardSummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=SUMMARY_FIELDS
+    )
+
+
+def refresh_dashboard_summary(user_id):
+    """Recompute a single user's summary from scratch and return it"""
+    summary = compute_summaries([user_id])[0]
+    save_summaries([summary])
+    return summary
+
+
+def recount_destinations_visited(user_id):
+    """Recount the distinct destinations of a user's completed bookings"""
+    visited = Booking.objects.filter(
+        user_id=user_id, status='completed'
+    ).values('destination').distinct().count()
+    DashboardSummary.objects.filter(pk=user_id).update(
+        destinations_visited=visited,
+        updated_at=timezone.now()
+    )
+
+
+def apply_summary_delta(user_id, refresh_missing=True, **deltas):
+    """
+    Apply counter/total deltas to a user's summary with a single UPDATE.
+
+    Falls back to a full refresh when the user has no summary row yet,
+    unless ``refresh_missing`` is False (deletions never create a row).
+    """
+    updates = {field: F(field) + value for field, value in deltas.items() if value}
+    if not updates:
+        return
+    updates['updated_at'] = timezone.now()
+    if not DashboardSummary.objects.filter(pk=user_id).update(**updates) and refresh_missing:
+        refresh_dashboard_summary(user_id)
+
+
+def apply_booking_change(old, new):
+    """Update summaries for a booking moving from state ``old`` to ``new`` (either may be None)"""
+    if old == new:
+        return
+    if old and new and old.user_id != new.user_id:
+        refresh_dashboard_summary(old.user_id)
+        refresh_dashboard_summary(new.user_id)
+        return
+
+    user_id = (new or old).user_id
+    apply_summary_delta(
+        user_id,
+        refresh_missing=new is not None,
+        total_bookings=(1 if new else 0) - (1 if old else 0),
+        booking_spent=(new.total_amount if new else 0) - (old.total_amount if old else 0)
+    )
+
+    was_completed = bool(old) and old.status == 'completed'
+    is_completed = bool(new) and new.status == 'completed'
+    destination_changed = bool(old) and bool(new) and old.destination_id != new.destination_id
+    if was_completed != is_completed or (is_completed and destination_changed):
+        recount_destinations_visited(user_id)
+
+
+def apply_purchase_change(old, new):
+    """Update summaries for a ticket purchase moving from state ``old`` to ``new`` (either may be None)"""
+    if old == new:
+        return
+    if old and new and old.user_id != new.user_id:
+        refresh_dashboard_summary(old.user_id)
+        refresh_dashboard_summary(new.user_id)
+        return
+
+    apply_summary_delta(
+        (new or old).user_id,
+        refresh_missing=new is not None,
+        total_tickets=(1 if new else 0) - (1 if old else 0),
+        ticket_spent=(new.total_amount if new else 0) - (old.total_amount if old else 0)
+    )
@@ -1,3 +1,219 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import Category, Destination, DestinationImage, Booking, DashboardSummary
+from tickets.models import TicketCategory, Venue, Ticket, TicketPurchase
 
-# Create your tests here.
+User = get_user_model()
+
+class DashboardBookingsFeedTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='traveler',
+            email='traveler@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='Traveler'
+        )
+        category = Category.objects.create(name='Heritage')
+        self.destination = Destination.objects.create(
+            name='Cape Coast Castle',
+            location='Cape Coast',
+            description='Heritage tour',
+            image='https://example.com/cape.jpg',
+            price=Decimal('450.00'),
+            duration='3_days',
+            max_group_size=10,
+            category=category
+        )
+        DestinationImage.objects.create(destination=self.destination, image_url='https://example.com/1.jpg')
+        DestinationImage.objects.create(destination=self.destination, image_url='https://example.com/2.jpg')
+
+        now = timezone.now()
+        ticket_category = TicketCategory.objects.create(name='Concerts', category_type='event')
+        venue = Venue.objects.create(name='National Theatre', address='Accra', city='Accra', region='Greater Accra')
+        self.ticket = Ticket.objects.create(
+            title='Afrobeats Night',
+            category=ticket_category,
+            venue=venue,
+            description='Live music',
+            price=Decimal('100.00'),
+            total_quantity=100,
+            available_quantity=100,
+            event_date=now + timedelta(days=10),
+            sale_start_date=now - timedelta(days=1),
+            sale_end_date=now + timedelta(days=9),
+            status='published'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _create_history(self, bookings, purchases):
+        for _ in range(bookings):
+            Booking.objects.create(
+                destination=self.destination,
+                user=self.user,
+                participants=2,
+                total_amount=Decimal('900.00'),
+                booking_date=date.today()
+            )
+        for _ in range(purchases):
+            TicketPurchase.objects.create(
+                ticket=self.ticket,
+                user=self.user,
+                quantity=1,
+                unit_price=Decimal('100.00'),
+                total_amount=Decimal('100.00'),
+                customer_name='Test Traveler',
+                customer_email='traveler@example.com'
+            )
+
+    def test_feed_pages_through_both_sources_in_order(self):
+        self._create_history(bookings=4, purchases=3)
+        url = reverse('dashboard-bookings')
+
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(response.data['results'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len({(row['type'], row['id']) for row in seen}), 7)
+        created = [row['created_at'] for row in seen]
+        self.assertEqual(created, sorted(created, reverse=True))
+        destination_rows = [row for row in seen if row['type'] == 'destination']
+        self.assertEqual(destination_rows[0]['image'], 'https://example.com/1.jpg')
+
+    def test_query_count_does_not_grow_with_history(self):
+        url = reverse('dashboard-bookings')
+        self._create_history(bookings=2, purchases=2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+
+        self._create_history(bookings=20, purchases=20)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+
+        # One UNION query plus at most one hydration query per source (and images)
+        self.assertLessEqual(len(small), 4)
+        self.assertLessEqual(len(large), len(small))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('dashboard-bookings'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DashboardSummaryTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='summary',
+            email='summary@example.com',
+            password='testpass123'
+        )
+        category = Category.objects.create(name='Nature')
+        self.destination = Destination.objects.create(
+            name='Kakum National Park',
+            location='Central Region',
+            description='Canopy walk',
+            image='https://example.com/kakum.jpg',
+            price=Decimal('300.00'),
+            duration='1_day',
+            max_group_size=10,
+            category=category
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_summary_tracks_booking_changes(self):
+        booking = Booking.objects.create(
+            destination=self.destination,
+            user=self.user,
+            participants=2,
+            total_amount=Decimal('600.00'),
+            booking_date=date.today()
+        )
+        booking.status = 'completed'
+        booking.save()
+
+        response = self.client.get(reverse('dashboard-overview'))
+        self.assertEqual(response.data['total_bookings'], 1)
+        self.assertEqual(response.data['destinations_visited'], 1)
+        self.assertEqual(response.data['total_spent'], 600.0)
+        self.assertEqual(response.data['member_level'], 'Silver')
+
+        booking.delete()
+        summary = DashboardSummary.objects.get(pk=self.user.pk)
+        self.assertEqual(summary.total_bookings, 0)
+        self.assertEqual(summary.destinations_visited, 0)
+        self.assertEqual(summary.total_spent, Decimal('0'))
+
+    def test_deleting_a_user_with_bookings(self):
+        Booking.objects.create(
+            destination=self.destination,
+            user=self.user,
+            participants=1,
+            total_amount=Decimal('300.00'),
+            booking_date=date.today()
+        )
+        DashboardSummary.objects.filter(pk=self.user.pk).delete()
+
+        # No summary row may be recreated for the user while it is deleted
+        self.user.delete()
+        self.assertFalse(DashboardSummary.objects.exists())
+
+        # Deleting a booking whose owner has no summary row does not create one
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        booking = Booking.objects.create(
+            destination=self.destination,
+            user=other,
+            participants=1,
+            total_amount=Decimal('300.00'),
+            booking_date=date.today()
+        )
+        DashboardSummary.objects.filter(pk=other.pk).delete()
+        booking.delete()
+        self.assertFalse(DashboardSummary.objects.filter(pk=other.pk).exists())
+
+    def test_overview_is_a_single_lookup(self):
+        self.client.get(reverse('dashboard-overview'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard-overview'))
+        self.assertEqual(len(queries), 1)
+
+
+class CategoryAdminQueryBudgetTest(APITestCase):
+    def test_destination_counts_are_annotated(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpass123')
+        self.client.force_login(admin_user)
+        url = reverse('admin:destinations_category_changelist')
+        
+        def add_categories(start, count):
+            for n in range(start, start + count):
+                category = Category.objects.create(name=f'Category {n}')
+                Destination.objects.create(
+                    name=f'Destination {n}', location='Ghana', description='Tour',
+                    image='https://example.com/tour.jpg', price=Decimal('100.00'),
+                    duration='1_day', max_group_size=10, category=category
+                )
+        
+        add_categories(0, 2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        add_categories(2, 10)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        
+        self.assertEqual(len(large), len(small))
+        self.assertTrue(all(category.destination_count == 1 for category in response.context['cl'].result_list))
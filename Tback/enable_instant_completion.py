@@ -15,7 +15,7 @@ def enable_instant_completion():
         django.setup()
         
         from payments.models import Payment
-        from django.utils import timezone
+        from payments.state import transition
         
         processing_payments = Payment.objects.filter(status='processing').order_by('-created_at')
         
@@ -28,10 +28,7 @@ def enable_instant_completion():
                 print(f"   - {payment.reference}: {payment.description}")
                 
                 # Complete the payment
-                payment.status = 'successful'
-                payment.processed_at = timezone.now()
-                payment.save()
-                payment.log('info', 'Instantly completed for demo')
+                transition(payment, 'successful', 'Instantly completed for demo')
                 
                 print(f"   ✅ Completed: {payment.reference}")
         
@@ -2,7 +2,9 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import PaymentProvider, Payment, PaymentCallback, PaymentLog
+from django.db.models import Count
+from .models import PaymentProvider, Payment, PaymentCallback, PaymentLog, WebhookEvent, FeeSchedule, FeeTier, ArchivedPayment, OutboxEvent, SettlementRollup
+from .state import bulk_transition
 
 @admin.register(PaymentProvider)
 class PaymentProviderAdmin(admin.ModelAdmin):
@@ -25,8 +27,11 @@ class PaymentProviderAdmin(admin.ModelAdmin):
         })
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(payment_count=Count('payment'))
+    
     def payments_count(self, obj):
-        count = obj.payment_set.count()
+        count = obj.payment_count
         if count > 0:
             url = reverse('admin:payments_payment_changelist') + f'?provider__id__exact={obj.id}'
             return format_html('<a href="{}" style="color: #0066cc;">{} payments</a>', url, count)
@@ -418,17 +423,17 @@ class PaymentAdmin(admin.ModelAdmin):
     actions = ['mark_as_successful', 'mark_as_failed', 'mark_as_cancelled']
     
     def mark_as_successful(self, request, queryset):
-        updated = queryset.filter(status__in=['pending', 'processing']).update(status='successful')
+        updated = len(bulk_transition(queryset.filter(status__in=['pending', 'processing']), 'successful'))
         self.message_user(request, f'{updated} payments marked as successful.')
     mark_as_successful.short_description = "Mark selected payments as successful"
     
     def mark_as_failed(self, request, queryset):
-        updated = queryset.filter(status__in=['pending', 'processing']).update(status='failed')
+        updated = len(bulk_transition(queryset.filter(status__in=['pending', 'processing']), 'failed'))
         self.message_user(request, f'{updated} payments marked as failed.')
     mark_as_failed.short_description = "Mark selected payments as failed"
     
     def mark_as_cancelled(self, request, queryset):
-        updated = queryset.filter(status__in=['pending', 'processing']).update(status='cancelled')
+        updated = len(bulk_transition(queryset.filter(status__in=['pending', 'processing']), 'cancelled'))
         self.message_user(request, f'{updated} payments marked as cancelled.')
     mark_as_cancelled.short_description = "Mark selected payments as cancelled"
 
@@ -506,6 +511,67 @@ class PaymentLogAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('provider_code', 'event_id', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'provider_code', 'received_at')
+    search_fields = ('event_id', 'error')
+    readonly_fields = ('provider_code', 'event_id', 'payload', 'status', 'attempts', 'error', 'received_at', 'processed_at')
+    date_hierarchy = 'received_at'
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('topic', 'payment', 'status', 'attempts', 'available_at', 'created_at', 'processed_at')
+    list_filter = ('status', 'topic', 'created_at')
+    search_fields = ('payment__reference', 'error')
+    readonly_fields = ('topic', 'payment', 'payload', 'status', 'attempts', 'error', 'available_at', 'created_at', 'processed_at')
+    list_select_related = ('payment',)
+    date_hierarchy = 'created_at'
+    
+    def has_add_permission(self, request):
+        return False
+
+class FeeTierInline(admin.TabularInline):
+    model = FeeTier
+    extra = 0
+    fields = ('min_amount', 'max_amount', 'fee')
+
+@admin.register(FeeSchedule)
+class FeeScheduleAdmin(admin.ModelAdmin):
+    list_display = ('payment_method', 'currency', 'fee_type', 'flat_fee', 'rate', 'min_fee', 'is_active', 'updated_at')
+    list_filter = ('fee_type', 'currency', 'is_active')
+    search_fields = ('payment_method', 'currency')
+    readonly_fields = ('updated_at',)
+    inlines = [FeeTierInline]
+
+@admin.register(ArchivedPayment)
+class ArchivedPaymentAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'user', 'amount', 'currency', 'payment_method', 'status', 'created_at', 'archive_file')
+    list_filter = ('status', 'payment_method', 'currency')
+    search_fields = ('reference', 'user__email', 'description')
+    list_select_related = ('user',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(SettlementRollup)
+class SettlementRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'provider_code', 'currency', 'status', 'count', 'gross', 'fees', 'updated_at')
+    list_filter = ('status', 'provider_code', 'currency')
+    date_hierarchy = 'day'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Customize admin site header
 admin.site.site_header = "Trails & Trails - MoMo Payments Admin"
 admin.site.site_title = "MoMo Payments Admin"
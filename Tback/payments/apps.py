@@ -5,4 +5,15 @@ class PaymentsConfig(AppConfig):
     name = 'payments'
     
     def ready(self):
-        import payments.signals
\ No newline at end of file
+        import payments.signals
+        import payments.status_stream
+        from django.core.handlers.asgi import ASGIHandler
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.core.signals import request_started
+        from .scheduler import start_worker_on_request
+        
+        # Only server handlers (not management commands or the test client) run durable timers
+        for handler in (WSGIHandler, ASGIHandler):
+            request_started.connect(
+                start_worker_on_request, sender=handler, dispatch_uid='payments.scheduler.start_worker'
+            )
\ No newline at end of file
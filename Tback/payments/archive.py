@@ -0,0 +1,165 @@
+"""
+Archival of finalized payments, with their callbacks and logs, out of the hot tables.
+
+Payments in a final status whose ``created_at`` is older than
+PAYMENT_ARCHIVE_AFTER_DAYS are written to monthly, gzip-compressed NDJSON
+files under PAYMENT_ARCHIVE_DIR (``payments-YYYY-MM.ndjson.gz``, by the
+month the payment was created), one line per payment holding the payment
+row and all of its callback and log rows. Each run appends a new gzip member,
+so existing files are never rewritten. Once a chunk is on disk, a small
+ArchivedPayment index row is stored for every payment and the payments are
+deleted, which cascades to their callbacks, logs and scheduled transitions.
+
+The file is written before the database transaction, so a crash in between
+leaves a payment both live and in the archive; the next run archives it
+again and readers take the last line for a reference. Lookups of old
+references go through ``lookups.find_archived_payment`` and
+``load_archived_record``.
+
+The files are the only copy of the archived rows, so PAYMENT_ARCHIVE_DIR has
+no default: it must point at durable storage (e.g. a mounted volume, not the
+container file system that a redeploy wipes) and archiving refuses to run
+while it is unset. Payments with outbox events that are still pending or
+failed are skipped, since deleting them would drop that follow-up work.
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from .models import Payment, ArchivedPayment
+from .settlement import provider_code
+
+FINAL_STATUSES = ['successful', 'failed', 'cancelled', 'refunded']
+UNFINISHED_OUTBOX_STATUSES = ['pending', 'failed']
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+DEFAULT_CHUNK_SIZE = 500
+
+
+def archive_dir():
+    """Configured archive directory, or None when archiving is not set up"""
+    return getattr(settings, 'PAYMENT_ARCHIVE_DIR', None) or None
+
+
+def archive_file_for(created_at):
+    """Archive file name for payments created in the month of ``created_at``"""
+    return f"payments-{created_at:%Y-%m}.ndjson.gz"
+
+
+def _row(instance):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+def serialize_payment(payment):
+    """Full archive record for a payment whose callbacks and logs are prefetched"""
+    return {
+        'payment': _row(payment),
+        'callbacks': [_row(callback) for callback in payment.callbacks.all()],
+        'logs': [_row(entry) for entry in payment.logs.all()],
+    }
+
+
+def archivable_payments(days=None):
+    """Finalized payments old enough to be archived"""
+    if days is None:
+        days = getattr(settings, 'PAYMENT_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    cutoff = timezone.now() - timedelta(days=days)
+    return Payment.objects.filter(status__in=FINAL_STATUSES, created_at__lt=cutoff)
+
+
+def _append_records(file_name, records):
+    os.makedirs(archive_dir(), exist_ok=True)
+    with open(os.path.join(archive_dir(), file_name), 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+            for record in records:
+                archive.write((json.dumps(record, cls=DjangoJSONEncoder) + '\n').encode('utf-8'))
+        # The rows are deleted next, so make sure the archive is on disk first
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive_payments(queryset=None, days=None, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """
+    Archive payments chunk by chunk, yielding the number archived per chunk.
+
+    ``queryset`` defaults to ``archivable_payments(days)``. With ``dry_run``
+    the chunks are counted but nothing is written or deleted. Raises
+    ImproperlyConfigured when PAYMENT_ARCHIVE_DIR is unset.
+    """
+    if not dry_run and archive_dir() is None:
+        raise ImproperlyConfigured('PAYMENT_ARCHIVE_DIR must point at durable storage before payments are archived')
+    payments = (queryset if queryset is not None else archivable_payments(days)).exclude(
+        outbox_events__status__in=UNFINISHED_OUTBOX_STATUSES
+    ).order_by('id')
+    last_id = 0
+
+    while True:
+        chunk = list(
+            payments.filter(id__gt=last_id).prefetch_related('callbacks', 'logs')[:chunk_size]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1].pk
+        if dry_run:
+            yield len(chunk)
+            continue
+
+        by_file = {}
+        for payment in chunk:
+            by_file.setdefault(archive_file_for(payment.created_at), []).append(payment)
+        for file_name, members in by_file.items():
+            _append_records(file_name, [serialize_payment(payment) for payment in members])
+
+        with transaction.atomic():
+            ArchivedPayment.objects.filter(reference__in=[payment.reference for payment in chunk]).delete()
+            ArchivedPayment.objects.bulk_create([
+                ArchivedPayment(
+                    reference=payment.reference,
+                    payment_id=payment.payment_id,
+                    user_id=payment.user_id,
+                    amount=payment.amount,
+                    currency=payment.currency,
+                    payment_method=payment.payment_method,
+                    provider_code=provider_code(payment.provider_id),
+                    status=payment.status,
+                    description=payment.description,
+                    created_at=payment.created_at,
+                    processed_at=payment.processed_at,
+                    archive_file=file_name
+                )
+                for file_name, members in by_file.items()
+                for payment in members
+            ])
+            Payment.objects.filter(id__in=[payment.pk for payment in chunk]).delete()
+        yield len(chunk)
+
+
+def load_archived_record(archived):
+    """
+    Read the full record (payment, callbacks and logs) for an ArchivedPayment.
+
+    The monthly file is scanned line by line, which is fine for the
+    occasional support lookup this serves. Returns None if the file or line
+    is missing.
+    """
+    if archive_dir() is None:
+        return None
+    path = os.path.join(archive_dir(), archived.archive_file)
+    if not os.path.exists(path):
+        return None
+
+    needle = json.dumps(archived.reference)
+    found = None
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            # Cheap substring test before parsing; keep the last match
+            if needle not in line:
+                continue
+            record = json.loads(line)
+            if record['payment']['reference'] == archived.reference:
+                found = record
+    return found
@@ -0,0 +1,68 @@
+"""
+Streaming, resumable backfill of ``metadata['booking_details']`` on payments.
+
+Only rows missing the key are selected, using a database-side JSON
+``has_key`` predicate rather than loading every payment into Python. Rows
+are walked in keyset order (``id > last_id``) one chunk at a time, each chunk
+streamed with ``.iterator()`` and written back with a single ``bulk_update``.
+Keyset pages rather than one long-lived cursor keep the writes out of an
+open read cursor (which SQLite does not isolate) and give a natural resume
+point: after every chunk the last id is stored in a BackfillCheckpoint, so an
+interrupted run picks up where it stopped. Memory use is bounded by the chunk
+size regardless of table size.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .booking_utils import attach_booking_details
+from .models import Payment, BackfillCheckpoint
+
+DEFAULT_CHUNK_SIZE = 500
+CHECKPOINT_NAME = 'booking_details'
+
+
+def backfill_booking_details(queryset=None, build=attach_booking_details, force=False,
+                             chunk_size=DEFAULT_CHUNK_SIZE, checkpoint=CHECKPOINT_NAME):
+    """
+    Fill in booking details chunk by chunk, yielding the number of payments updated per chunk.
+
+    ``build(payment)`` sets ``payment.metadata['booking_details']`` in memory.
+    With ``force`` existing details are rebuilt too. Pass ``checkpoint=None``
+    for a one-off run that neither reads nor records progress; otherwise the
+    checkpoint is cleared once the backfill reaches the end of the table.
+    """
+    payments = (queryset if queryset is not None else Payment.objects.all()).order_by('id')
+    if not force:
+        payments = payments.exclude(metadata__has_key='booking_details')
+    payments = payments.select_related('user')
+
+    last_id = 0
+    if checkpoint:
+        last_id = BackfillCheckpoint.objects.get_or_create(name=checkpoint)[0].last_id
+
+    while True:
+        chunk = []
+        for payment in payments.filter(id__gt=last_id)[:chunk_size].iterator(chunk_size=chunk_size):
+            build(payment)
+            chunk.append(payment)
+        if not chunk:
+            break
+
+        last_id = chunk[-1].pk
+        with transaction.atomic():
+            Payment.objects.bulk_update(chunk, ['metadata'])
+            if checkpoint:
+                BackfillCheckpoint.objects.filter(name=checkpoint).update(
+                    last_id=last_id,
+                    processed=F('processed') + len(chunk),
+                    updated_at=timezone.now()
+                )
+        yield len(chunk)
+
+    if checkpoint:
+        BackfillCheckpoint.objects.filter(name=checkpoint).delete()
+
+
+def reset_checkpoint(name=CHECKPOINT_NAME):
+    """Forget a backfill's progress so the next run starts from the beginning"""
+    BackfillCheckpoint.objects.filter(name=name).delete()
@@ -1,18 +1,17 @@
 """
 Utility functions for handling booking details in payments
 """
+from django.utils import timezone
 
-def store_booking_details_in_payment(payment, booking_data):
+
+def build_booking_details(payment, booking_data):
     """
-    Store booking details in payment metadata for display in admin
+    Build the destination booking details stored in payment metadata for display in admin
     
     Args:
-        payment: Payment instance
+        payment: Payment instance (saved or not)
         booking_data: Dictionary containing booking information
     """
-    if not payment.metadata:
-        payment.metadata = {}
-    
     # Get user information from payment or booking data
     user_info = {}
     if payment.user:
@@ -92,10 +91,155 @@ def store_booking_details_in_payment(payment, booking_data):
             for exp in booking_data['experiences']
         ]
     
-    # Store in payment metadata
-    payment.metadata['booking_details'] = booking_details
+    return booking_details
+
+def store_booking_details_in_payment(payment, booking_data):
+    """
+    Store booking details in payment metadata for display in admin
+    
+    Args:
+        payment: Payment instance
+        booking_data: Dictionary containing booking information
+    """
+    if not payment.metadata:
+        payment.metadata = {}
+    payment.metadata['booking_details'] = build_booking_details(payment, booking_data)
+    payment.save()
+
+def is_ticket_payment(payment):
+    """Whether a payment is for an event ticket rather than a destination booking"""
+    return bool(payment.description and "Ticket Purchase:" in payment.description)
+
+def build_ticket_details(payment):
+    """
+    Build the ticket-specific details stored in payment metadata for display in admin
+    
+    Args:
+        payment: Payment instance for a ticket purchase (saved or not)
+    """
+    # Get user information
+    user_info = {}
+    if payment.user:
+        user_name = f"{payment.user.first_name} {payment.user.last_name}".strip()
+        if not user_name:
+            user_name = payment.user.username or "User"
+        user_info = {
+            'name': user_name,
+            'email': payment.user.email or '',
+            'phone': payment.phone_number or ''
+        }
+    else:
+        user_info = {
+            'name': 'Anonymous User',
+            'email': '',
+            'phone': payment.phone_number or ''
+        }
+    
+    # Extract ticket name from description if available
+    ticket_name = "Event Ticket"
+    if is_ticket_payment(payment):
+        ticket_name = payment.description.replace("Ticket Purchase:", "").strip()
+    
+    return {
+        'type': 'ticket',
+        'user_info': user_info,
+        'ticket': {
+            'name': ticket_name,
+            'price': float(payment.amount),
+            'currency': payment.currency,
+            'quantity': 1  # Default to 1, could be enhanced later
+        },
+        'purchase_info': {
+            'purchase_date': (payment.created_at or timezone.now()).isoformat(),
+            'payment_method': payment.payment_method or '',
+            'total_amount': float(payment.amount)
+        }
+    }
+
+def store_ticket_details_in_payment(payment):
+    """Store ticket-specific details in payment metadata for display in admin"""
+    if not payment.metadata:
+        payment.metadata = {}
+    payment.metadata['booking_details'] = build_ticket_details(payment)
     payment.save()
 
+def sample_booking_details_for(payment):
+    """
+    Sample destination booking details sized to the payment amount, filled
+    in with the payer's real contact details where available
+    """
+    sample_data = create_sample_booking_details()
+    sample_data['final_total'] = float(payment.amount)
+    sample_data['base_total'] = float(payment.amount) * 0.65
+    sample_data['options_total'] = float(payment.amount) * 0.35
+    
+    # Customize based on description, then amount
+    description = (payment.description or "").lower()
+    amount = float(payment.amount) if payment.amount else 0
+    if "elmina" in description:
+        sample_data['destination_name'] = 'Elmina Castle & Beach Resort'
+        sample_data['destination_location'] = 'Central Region, Ghana'
+        sample_data['duration'] = '2 Days / 1 Night'
+    elif "akosombo" in description or "dodi" in description:
+        sample_data['destination_name'] = 'Akosombo Dodi Island Boat Cruise'
+        sample_data['destination_location'] = 'Eastern Region, Ghana'
+        sample_data['duration'] = '1 Day Trip'
+    elif "kakum" in description:
+        sample_data['destination_name'] = 'Kakum National Park Adventure'
+        sample_data['destination_location'] = 'Central Region, Ghana'
+        sample_data['duration'] = '2 Days / 1 Night'
+    elif "cape coast" in description:
+        sample_data['destination_name'] = 'Cape Coast Castle Heritage Tour'
+        sample_data['destination_location'] = 'Cape Coast, Ghana'
+        sample_data['duration'] = '3 Days / 2 Nights'
+    elif amount <= 50:
+        sample_data['destination_name'] = 'Local Cultural Experience'
+        sample_data['destination_location'] = 'Accra, Ghana'
+        sample_data['duration'] = '1 Day'
+        sample_data['adults'] = 1
+        sample_data['children'] = 0
+    elif amount <= 150:
+        sample_data['destination_name'] = 'Kakum National Park Adventure'
+        sample_data['destination_location'] = 'Central Region, Ghana'
+        sample_data['duration'] = '2 Days / 1 Night'
+        sample_data['adults'] = 2
+        sample_data['children'] = 0
+    else:
+        sample_data['destination_name'] = 'Cape Coast Castle Heritage Tour'
+        sample_data['destination_location'] = 'Cape Coast, Ghana'
+        sample_data['duration'] = '3 Days / 2 Nights'
+        sample_data['adults'] = 2
+        sample_data['children'] = 1
+    
+    # Use actual user info if available
+    if payment.user:
+        user_name = f"{payment.user.first_name} {payment.user.last_name}".strip()
+        if not user_name:
+            user_name = payment.user.username or "User"
+        sample_data['user_name'] = user_name
+        sample_data['user_email'] = payment.user.email or ''
+    
+    # Use actual phone number if available
+    if payment.phone_number:
+        sample_data['user_phone'] = payment.phone_number
+    
+    return sample_data
+
+def attach_booking_details(payment, booking_data=None, is_ticket=False):
+    """
+    Put ``metadata['booking_details']`` on a payment without saving it, so it
+    is written by the payment's own INSERT.
+    
+    Ticket payments get ticket details; destination payments use
+    ``booking_data`` (already in backend format) or sample details.
+    """
+    if is_ticket or is_ticket_payment(payment):
+        details = build_ticket_details(payment)
+    else:
+        details = build_booking_details(payment, booking_data or sample_booking_details_for(payment))
+    payment.metadata = {**(payment.metadata or {}), 'booking_details': details}
+    return payment
+
 def create_sample_booking_details():
     """
     Create sample booking details for testing
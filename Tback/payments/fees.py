@@ -0,0 +1,105 @@
+"""
+Database-configured payment fee schedules, compiled for fast quoting.
+
+FeeSchedule/FeeTier rows are loaded once per process into CompiledSchedule
+objects keyed by (payment_method, currency); tiered schedules keep their
+bands as sorted parallel lists so the matching band is found with
+``bisect``. Saving or deleting a schedule or tier bumps a version number in
+the shared cache, and each process recompiles when it sees a new version.
+Compiled schedules are also refreshed after MAX_AGE seconds, which bounds
+staleness when the cache is not shared between processes.
+"""
+import threading
+import time
+from bisect import bisect_right
+from django.core.cache import cache
+from .models import FeeSchedule
+
+VERSION_CACHE_KEY = 'payments:fee_schedule_version'
+MAX_AGE = 300  # seconds
+
+_compiled = None
+_compiled_version = None
+_compiled_at = 0.0
+_lock = threading.Lock()
+
+
+class CompiledSchedule:
+    """In-memory form of a FeeSchedule and its tiers"""
+    __slots__ = ('fee_type', 'flat_fee', 'rate', 'min_fee', 'tier_mins', 'tier_maxes', 'tier_fees')
+
+    def __init__(self, schedule):
+        self.fee_type = schedule.fee_type
+        self.flat_fee = float(schedule.flat_fee)
+        self.rate = float(schedule.rate)
+        self.min_fee = float(schedule.min_fee)
+        tiers = sorted(schedule.tiers.all(), key=lambda tier: tier.min_amount)
+        self.tier_mins = [float(tier.min_amount) for tier in tiers]
+        self.tier_maxes = [float(tier.max_amount) if tier.max_amount is not None else float('inf') for tier in tiers]
+        self.tier_fees = [float(tier.fee) for tier in tiers]
+
+    def fee_for(self, amount):
+        if self.fee_type == 'flat':
+            return self.flat_fee
+        if self.fee_type == 'percentage':
+            return max(amount * self.rate, self.min_fee)
+        if self.fee_type == 'tiered':
+            index = bisect_right(self.tier_mins, amount) - 1
+            # Amounts below the first band or in a gap between bands are free
+            if index >= 0 and amount <= self.tier_maxes[index]:
+                return self.tier_fees[index]
+        return 0
+
+
+def compile_schedules():
+    """Load every active schedule with its tiers (two queries)"""
+    schedules = FeeSchedule.objects.filter(is_active=True).prefetch_related('tiers')
+    return {
+        (schedule.payment_method, schedule.currency): CompiledSchedule(schedule)
+        for schedule in schedules
+    }
+
+
+def compiled_schedules():
+    """The compiled schedules for this process, recompiled if they have changed"""
+    global _compiled, _compiled_version, _compiled_at
+    version = cache.get(VERSION_CACHE_KEY, 0)
+    if _compiled is None or version != _compiled_version or time.monotonic() - _compiled_at > MAX_AGE:
+        with _lock:
+            if _compiled is None or version != _compiled_version or time.monotonic() - _compiled_at > MAX_AGE:
+                _compiled = compile_schedules()
+                _compiled_version = version
+                _compiled_at = time.monotonic()
+    return _compiled
+
+
+def invalidate_fee_schedules():
+    """Make every process recompile its fee schedules on next use"""
+    cache.set(VERSION_CACHE_KEY, time.time_ns(), None)
+
+
+def quote_fee(amount, payment_method, currency='GHS', schedules=None):
+    """Return ``{'fee', 'total'}`` for paying ``amount`` with the given method and currency"""
+    schedule = (schedules if schedules is not None else compiled_schedules()).get((payment_method, currency))
+    if schedule is None:
+        return {'fee': 0, 'total': amount}
+
+    fee = schedule.fee_for(amount)
+    return {
+        'fee': round(fee, 2),
+        'total': round(amount + fee, 2)
+    }
+
+
+def quote_fees(requests):
+    """Quote many ``(amount, payment_method, currency)`` combinations against one compiled snapshot"""
+    schedules = compiled_schedules()
+    return [
+        {
+            'amount': amount,
+            'payment_method': payment_method,
+            'currency': currency,
+            **quote_fee(amount, payment_method, currency, schedules)
+        }
+        for amount, payment_method, currency in requests
+    ]
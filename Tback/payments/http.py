@@ -0,0 +1,106 @@
+"""
+Pooled, keep-alive HTTP sessions for payment provider APIs.
+
+Each provider gets one long-lived ``requests.Session`` per process with its
+own connection pool, default (connect, read) timeouts and bounded retries.
+Retries with backoff apply to idempotent methods and to connection errors
+(where the request never reached the provider); POSTs are never replayed
+after they were sent.
+"""
+import threading
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_HTTP_CONFIG = {
+    'pool_maxsize': 10,
+    'connect_timeout': 3.05,
+    'read_timeout': getattr(settings, 'PAYMENT_TIMEOUT', 30),
+    'retries': 2,
+    'backoff_factor': 0.3,
+}
+
+PROVIDER_HTTP_CONFIG = {
+    'mtn_momo': {'pool_maxsize': 20},
+    'paystack': {'pool_maxsize': 20},
+    'mpesa': {},
+}
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUSES = (429, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class ProviderSession(requests.Session):
+    """Session that applies a default timeout to every request"""
+    
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+    
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def provider_config(provider_code):
+    """Effective HTTP settings for a provider (defaults < code < PAYMENT_HTTP_CONFIG setting)"""
+    overrides = getattr(settings, 'PAYMENT_HTTP_CONFIG', {})
+    return {
+        **DEFAULT_HTTP_CONFIG,
+        **PROVIDER_HTTP_CONFIG.get(provider_code, {}),
+        **overrides.get(provider_code, {})
+    }
+
+
+def provider_timeout(provider_code):
+    """(connect, read) timeout tuple for a provider"""
+    config = provider_config(provider_code)
+    return (config['connect_timeout'], config['read_timeout'])
+
+
+def build_session(provider_code):
+    """Create a new pooled session configured for a provider"""
+    config = provider_config(provider_code)
+    retry = Retry(
+        total=config['retries'],
+        connect=config['retries'],
+        read=config['retries'],
+        status=config['retries'],
+        backoff_factor=config['backoff_factor'],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=config['pool_maxsize'],
+        max_retries=retry
+    )
+    session = ProviderSession(timeout=provider_timeout(provider_code))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(provider_code):
+    """Return the shared session for a provider, creating it on first use"""
+    session = _sessions.get(provider_code)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider_code)
+            if session is None:
+                session = _sessions[provider_code] = build_session(provider_code)
+    return session
+
+
+def close_sessions():
+    """Close all pooled sessions (e.g. after forking or in tests)"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,160 @@
+"""
+Idempotency-Key support for endpoints that create payments or purchases.
+
+The first request with a given key (per endpoint scope and caller) runs the
+view and stores its response; repeats with the same key replay that response
+instead of doing the work again. A repeat that arrives while the first
+request is still running waits for it to finish. An in-progress claim is a
+lease: once it is older than IDEMPOTENCY_IN_PROGRESS_LEASE (the original
+request crashed or its process was killed), the next request with the key
+takes it over and runs the view. Reusing a key with a different request
+body is rejected, and keys expire after a TTL.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+DEFAULT_TTL = timedelta(hours=24)
+DEFAULT_IN_PROGRESS_LEASE = timedelta(seconds=60)
+WAIT_TIMEOUT = 30  # seconds a repeat waits for the original request
+WAIT_INTERVAL = 0.1
+
+
+def _request_owner(request):
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return 'anonymous'
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _lease_expired(record):
+    lease = getattr(settings, 'IDEMPOTENCY_IN_PROGRESS_LEASE', DEFAULT_IN_PROGRESS_LEASE)
+    return record.status == 'in_progress' and record.created_at + lease <= timezone.now()
+
+
+def _owned(record):
+    """The record, only while this request still holds its claim"""
+    return IdempotencyKey.objects.filter(pk=record.pk, status='in_progress', created_at=record.created_at)
+
+
+def _take_over(record, ttl):
+    """Renew an expired in-progress lease for this request; False if another request got it first"""
+    now = timezone.now()
+    if not _owned(record).update(created_at=now, expires_at=now + ttl):
+        return False
+    record.created_at = now
+    record.expires_at = now + ttl
+    return True
+
+
+def _claim(scope, owner, key, fingerprint):
+    """Create the key record (or take over an expired lease), returning (record, created)"""
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    scope=scope, owner=owner, key=key, fingerprint=fingerprint,
+                    expires_at=timezone.now() + ttl
+                ), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(scope=scope, owner=owner, key=key).first()
+            if record is None:
+                continue
+            if record.expires_at <= timezone.now():
+                record.delete()
+                continue
+            if record.fingerprint == fingerprint and _lease_expired(record):
+                if _take_over(record, ttl):
+                    return record, True
+                continue
+            return record, False
+    raise IntegrityError(f'Could not claim idempotency key {key}')
+
+
+def _wait_for_completion(record):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None or record.status == 'completed':
+            return record
+        if _lease_expired(record):
+            # The original request is gone; a retry will take the key over
+            return None
+    return None
+
+
+def idempotent(scope):
+    """Decorator for DRF function views that honours the Idempotency-Key header"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({
+                    'success': False,
+                    'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            fingerprint = _fingerprint(request)
+            record, created = _claim(scope, _request_owner(request), key, fingerprint)
+            
+            if not created:
+                if record.fingerprint != fingerprint:
+                    return Response({
+                        'success': False,
+                        'error': f'{IDEMPOTENCY_HEADER} was already used with a different request'
+                    }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                if record.status != 'completed':
+                    record = _wait_for_completion(record)
+                    if record is None:
+                        return Response({
+                            'success': False,
+                            'error': 'The original request with this Idempotency-Key has not completed, please retry'
+                        }, status=status.HTTP_409_CONFLICT)
+                return _replay(record)
+            
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                _owned(record).delete()
+                raise
+            
+            if response.status_code >= 500:
+                # Let the client retry failures that were not its fault
+                _owned(record).delete()
+                return response
+            
+            # A request that outlived its lease must not overwrite the one that took over
+            _owned(record).update(
+                status='completed',
+                response_status=response.status_code,
+                response_body=json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+            )
+            return response
+        return wrapper
+    return decorator
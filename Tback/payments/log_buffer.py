@@ -0,0 +1,102 @@
+"""
+Buffered sink for PaymentLog entries.
+
+Inside ``buffered_payment_logs()`` calls to ``Payment.log()`` are collected
+in memory and written with a single ``bulk_create`` when the block exits (or
+when the buffer reaches PAYMENT_LOG_BUFFER_SIZE), instead of one INSERT per
+event. The buffer lives in a context variable, so each request, thread or
+job gets its own. Outside a buffered block entries are written immediately.
+
+Entries below PAYMENT_LOG_MIN_LEVEL are dropped. Each entry is timestamped
+when it is recorded and entries are inserted in the order they were
+recorded, so ordering by ``created_at``/``id`` is unaffected by buffering.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LEVEL_ORDER = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+DEFAULT_BUFFER_SIZE = 500
+
+_buffer = ContextVar('payment_log_buffer', default=None)
+
+
+def min_level():
+    return getattr(settings, 'PAYMENT_LOG_MIN_LEVEL', 'debug' if settings.DEBUG else 'info')
+
+
+def is_enabled(level):
+    """Whether entries at ``level`` should be stored"""
+    return LEVEL_ORDER.get(level, LEVEL_ORDER['info']) >= LEVEL_ORDER.get(min_level(), LEVEL_ORDER['debug'])
+
+
+def record(payment, level, message, data=None):
+    """Queue a log entry for ``payment``, or write it straight away when no buffer is active"""
+    from .models import PaymentLog
+
+    if not is_enabled(level):
+        return None
+
+    entry = PaymentLog(
+        payment=payment,
+        level=level,
+        message=message,
+        data=data or {},
+        created_at=timezone.now()
+    )
+    entries = _buffer.get()
+    if entries is None:
+        entry.save()
+        return entry
+
+    entries.append(entry)
+    if len(entries) >= getattr(settings, 'PAYMENT_LOG_BUFFER_SIZE', DEFAULT_BUFFER_SIZE):
+        flush()
+    return entry
+
+
+def flush():
+    """Write out everything queued in the current buffer, returning the number of entries written"""
+    from .models import PaymentLog
+
+    entries = _buffer.get()
+    if not entries:
+        return 0
+
+    pending = entries[:]
+    entries.clear()
+    try:
+        # A savepoint, so a failed insert does not abort the caller's transaction
+        with transaction.atomic():
+            PaymentLog.objects.bulk_create(pending)
+    except Exception as e:
+        # Losing log rows must never break the unit of work that produced them
+        logger.error(f"Failed to write {len(pending)} payment log entries: {str(e)}")
+        return 0
+    return len(pending)
+
+
+@contextmanager
+def buffered_payment_logs():
+    """
+    Collect payment log entries for the duration of the block and flush them on exit.
+
+    Nested blocks share the outermost buffer, which is flushed once.
+    """
+    if _buffer.get() is not None:
+        yield
+        return
+
+    token = _buffer.set([])
+    try:
+        yield
+    finally:
+        try:
+            flush()
+        finally:
+            _buffer.reset(token)
@@ -0,0 +1,59 @@
+"""
+Reference lookups with a negative cache.
+
+Public endpoints are polled with references that may not exist (typos,
+stale links, scanners). Misses are remembered in the cache for
+PAYMENT_NOT_FOUND_CACHE_SECONDS, so repeated lookups of an unknown reference
+cost no database query at all, and a first miss costs a single probe of the
+unique ``reference`` index. Creating a payment clears any cached miss for
+its reference once the transaction commits.
+
+References that have been moved to the archive (see ``archive.py``) are
+recognised on the first miss and remembered as archived, so callers can
+fall back to ``find_archived_payment`` without probing the index again for
+references that never existed.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from .models import Payment, ArchivedPayment
+
+DEFAULT_NOT_FOUND_TTL = 30
+MISSING = 'missing'
+ARCHIVED = 'archived'
+MAX_REFERENCE_LENGTH = Payment._meta.get_field('reference').max_length
+
+
+def _missing_key(reference):
+    # References come straight from the URL; hash them into a safe cache key
+    return f"payments:missing:{hashlib.sha1(reference.encode()).hexdigest()}"
+
+
+def find_payment(reference, queryset=None):
+    """Return the payment with ``reference``, or None, remembering misses"""
+    if not reference or len(reference) > MAX_REFERENCE_LENGTH:
+        return None
+    key = _missing_key(reference)
+    if cache.get(key):
+        return None
+    
+    payment = (queryset if queryset is not None else Payment.objects.all()).filter(reference=reference).first()
+    if payment is None:
+        state = ARCHIVED if ArchivedPayment.objects.filter(reference=reference).exists() else MISSING
+        cache.set(key, state, getattr(settings, 'PAYMENT_NOT_FOUND_CACHE_SECONDS', DEFAULT_NOT_FOUND_TTL))
+    return payment
+
+
+def find_archived_payment(reference, queryset=None):
+    """Return the archive index entry for ``reference``, or None; skips the query for known misses"""
+    if not reference or len(reference) > MAX_REFERENCE_LENGTH:
+        return None
+    state = cache.get(_missing_key(reference))
+    if state and state != ARCHIVED:
+        return None
+    return (queryset if queryset is not None else ArchivedPayment.objects.all()).filter(reference=reference).first()
+
+
+def forget_missing(reference):
+    """Drop a cached miss, e.g. once a payment with that reference exists"""
+    cache.delete(_missing_key(reference))
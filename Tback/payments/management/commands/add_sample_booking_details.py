@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from payments.models import Payment
-from payments.booking_utils import store_booking_details_in_payment, create_sample_booking_details
+from payments.backfill import backfill_booking_details
+from payments.booking_utils import build_booking_details, create_sample_booking_details
 
 class Command(BaseCommand):
     help = 'Add sample booking details to existing payments for testing'
@@ -31,12 +32,15 @@ class Command(BaseCommand):
                     self.style.ERROR(f'❌ Payment with ID {options["payment_id"]} not found')
                 )
         elif options['all']:
-            # Update all successful payments
-            payments = Payment.objects.filter(status='successful')
+            # Update all successful payments, streaming them in chunks
             count = 0
-            for payment in payments:
-                self.update_payment_with_sample_data(payment)
-                count += 1
+            for updated in backfill_booking_details(
+                queryset=Payment.objects.filter(status='successful'),
+                build=self.build_sample_data,
+                force=True,
+                checkpoint=None
+            ):
+                count += updated
             
             self.stdout.write(
                 self.style.SUCCESS(f'✅ Updated {count} successful payments with sample booking details')
@@ -54,8 +58,8 @@ class Command(BaseCommand):
                     self.style.WARNING('⚠️  No successful payments found')
                 )
     
-    def update_payment_with_sample_data(self, payment):
-        """Update a payment with sample booking details"""
+    def build_sample_data(self, payment):
+        """Put sample booking details on a payment without saving it"""
         sample_data = create_sample_booking_details()
         
         # Customize based on payment amount
@@ -65,6 +69,11 @@ class Command(BaseCommand):
             sample_data['base_total'] = float(payment.amount) * 0.7  # 70% base
             sample_data['options_total'] = float(payment.amount) * 0.3  # 30% options
         
-        store_booking_details_in_payment(payment, sample_data)
+        payment.metadata = {**(payment.metadata or {}), 'booking_details': build_booking_details(payment, sample_data)}
+    
+    def update_payment_with_sample_data(self, payment):
+        """Update a payment with sample booking details"""
+        self.build_sample_data(payment)
+        payment.save(update_fields=['metadata', 'updated_at'])
         
-        self.stdout.write(f'  📝 Added booking details to {payment.reference} (GH₵{payment.amount})')
\ No newline at end of file
+        self.stdout.write(f'  📝 Added booking details to {payment.reference} (GH₵{payment.amount})')
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from payments.archive import archive_payments, archive_dir, DEFAULT_ARCHIVE_AFTER_DAYS, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Move finalized payments older than PAYMENT_ARCHIVE_AFTER_DAYS into monthly NDJSON archive files'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'PAYMENT_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS),
+            help='Archive payments created more than this many days ago'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of payments archived per transaction'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the payments that would be archived without moving them'
+        )
+    
+    def handle(self, *args, **options):
+        if not options['dry_run'] and archive_dir() is None:
+            raise CommandError('Set PAYMENT_ARCHIVE_DIR to durable storage (e.g. a mounted volume) before archiving')
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(f"🔄 Archiving finalized payments older than {options['days']} days to {archive_dir() or 'PAYMENT_ARCHIVE_DIR (unset)'}...")
+        
+        total = 0
+        for count in archive_payments(days=options['days'], chunk_size=options['chunk_size'], dry_run=options['dry_run']):
+            total += count
+            self.stdout.write(f"   {verb} {total} payments so far")
+        
+        self.stdout.write(self.style.SUCCESS(f"✅ {verb} {total} payments"))
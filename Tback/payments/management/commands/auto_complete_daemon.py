@@ -1,8 +1,9 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from payments.models import Payment
+from payments.sweeper import sweep_payments, DEFAULT_CHUNK_SIZE
 import time
+import random
 import logging
 
 logger = logging.getLogger(__name__)
@@ -29,63 +30,68 @@ class Command(BaseCommand):
             default=0.9,
             help='Success rate for auto-completion (default: 0.9)'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Payments claimed per chunk (default: {DEFAULT_CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--worker-index',
+            type=int,
+            default=0,
+            help='Index of this worker when running several daemons (default: 0)'
+        )
+        parser.add_argument(
+            '--worker-count',
+            type=int,
+            default=1,
+            help='Total number of daemons sharing the work (default: 1)'
+        )
 
     def handle(self, *args, **options):
         interval = options['interval']
         timeout = options['timeout']
         success_rate = options['success_rate']
+        chunk_size = options['chunk_size']
+        worker_index = options['worker_index']
+        worker_count = options['worker_count']
         
         self.stdout.write(f"🚀 Starting auto-completion daemon")
         self.stdout.write(f"   Check interval: {interval}s")
         self.stdout.write(f"   Payment timeout: {timeout}s")
         self.stdout.write(f"   Success rate: {success_rate * 100}%")
+        self.stdout.write(f"   Worker: {worker_index + 1} of {worker_count}")
         self.stdout.write("   Press Ctrl+C to stop")
         
         try:
             while True:
-                self.process_payments(timeout, success_rate)
+                self.process_payments(timeout, success_rate, chunk_size, worker_index, worker_count)
                 time.sleep(interval)
         except KeyboardInterrupt:
             self.stdout.write("\n🛑 Auto-completion daemon stopped")
 
-    def process_payments(self, timeout_seconds, success_rate):
+    def process_payments(self, timeout_seconds, success_rate, chunk_size, worker_index, worker_count):
         """Process payments that are ready for auto-completion"""
         
         # Find payments that are pending/processing and older than timeout
         cutoff_time = timezone.now() - timedelta(seconds=timeout_seconds)
         
-        pending_payments = Payment.objects.filter(
-            status__in=['pending', 'processing'],
-            created_at__lt=cutoff_time
-        )
+        def decide(payment):
+            # Simulate success/failure based on success rate
+            if random.random() < success_rate:
+                return 'successful', 'Auto-completed successfully by daemon'
+            return 'failed', 'Auto-failed by daemon'
         
-        if pending_payments.exists():
-            self.stdout.write(f"⚡ Processing {pending_payments.count()} payments...")
-            
-            for payment in pending_payments:
-                self.complete_payment(payment, success_rate)
-        else:
-            # Only show this occasionally to avoid spam
-            import random
-            if random.random() < 0.1:  # 10% chance
-                self.stdout.write("✅ No payments to process")
-
-    def complete_payment(self, payment, success_rate):
-        """Complete a single payment"""
+        processed = 0
+        for decisions, applied in sweep_payments(decide, cutoff=cutoff_time, chunk_size=chunk_size,
+                                        worker_index=worker_index, worker_count=worker_count):
+            processed += applied
+            self.stdout.write(f"⚡ Processed {applied} payments...")
+            for payment, new_status, message in decisions:
+                icon = "✅" if new_status == 'successful' else "❌"
+                self.stdout.write(f"   {icon} {payment.reference} -> {new_status}")
         
-        # Simulate success/failure based on success rate
-        import random
-        if random.random() < success_rate:
-            # Success
-            payment.status = 'successful'
-            payment.processed_at = timezone.now()
-            payment.save()
-            payment.log('info', 'Auto-completed successfully by daemon')
-            self.stdout.write(f"   ✅ {payment.reference} -> successful")
-        else:
-            # Failure
-            payment.status = 'failed'
-            payment.processed_at = timezone.now()
-            payment.save()
-            payment.log('info', 'Auto-failed by daemon')
-            self.stdout.write(f"   ❌ {payment.reference} -> failed")
\ No newline at end of file
+        # Only show this occasionally to avoid spam
+        if not processed and random.random() < 0.1:  # 10% chance
+            self.stdout.write("✅ No payments to process")
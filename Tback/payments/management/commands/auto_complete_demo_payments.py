@@ -1,7 +1,9 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
+from payments.log_buffer import buffered_payment_logs
 from payments.models import Payment
+from payments.state import transition
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,29 +40,27 @@ class Command(BaseCommand):
         completed_count = 0
         failed_count = 0
         
-        for payment in pending_payments:
-            # Simulate success/failure based on success rate
-            import random
-            if random.random() < success_rate:
-                # Success
-                payment.status = 'successful'
-                payment.processed_at = timezone.now()
-                payment.save()
-                payment.log('info', f'Auto-completed successfully after {timeout_seconds}s timeout')
-                completed_count += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'✅ Auto-completed payment {payment.reference}')
-                )
-            else:
-                # Failure
-                payment.status = 'failed'
-                payment.processed_at = timezone.now()
-                payment.save()
-                payment.log('info', f'Auto-failed after {timeout_seconds}s timeout')
-                failed_count += 1
-                self.stdout.write(
-                    self.style.WARNING(f'❌ Auto-failed payment {payment.reference}')
-                )
+        with buffered_payment_logs():
+            for payment in pending_payments:
+                # Simulate success/failure based on success rate
+                import random
+                if random.random() < success_rate:
+                    # Success
+                    if not transition(payment, 'successful', f'Auto-completed successfully after {timeout_seconds}s timeout'):
+                        continue
+                    completed_count += 1
+                    self.stdout.write(
+                        self.style.SUCCESS(f'✅ Auto-completed payment {payment.reference}')
+                    )
+                else:
+                    # Failure
+                    if not transition(payment, 'failed', f'Auto-failed after {timeout_seconds}s timeout'):
+                        continue
+                    failed_count += 1
+                    self.stdout.write(
+                        self.style.WARNING(f'❌ Auto-failed payment {payment.reference}')
+                    )
+            
         
         if completed_count > 0 or failed_count > 0:
             self.stdout.write(
@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from payments.http import build_session
+import json
+import statistics
+import threading
+import time
+import requests
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive provider stub answering every request with a status payload"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connection_setup_delay = 0.0
+    
+    def setup(self):
+        # Model the per-connection cost (TCP + TLS handshakes) of a real provider
+        time.sleep(self.connection_setup_delay)
+        super().setup()
+    
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        body = json.dumps({'status': 'SUCCESSFUL', 'financialTransactionId': '123456'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    do_GET = _respond
+    do_POST = _respond
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compare per-call requests against the pooled provider session using a local stub provider'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Number of requests per client (default: 200)'
+        )
+        parser.add_argument(
+            '--url',
+            type=str,
+            help='Benchmark against this URL instead of the local stub'
+        )
+        parser.add_argument(
+            '--handshake-ms',
+            type=float,
+            default=20.0,
+            help='Simulated connection setup time of the stub in ms (default: 20)'
+        )
+        parser.add_argument(
+            '--provider',
+            type=str,
+            default='mtn_momo',
+            help='Provider whose session settings to use (default: mtn_momo)'
+        )
+    
+    def handle(self, *args, **options):
+        count = options['requests']
+        server = None
+        url = options['url']
+        
+        if not url:
+            StubProviderHandler.connection_setup_delay = options['handshake_ms'] / 1000
+            server = ThreadingHTTPServer(('127.0.0.1', 0), StubProviderHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f'http://127.0.0.1:{server.server_address[1]}/collection/v1_0/requesttopay/ref'
+        
+        self.stdout.write(f'🔬 Benchmarking {count} GET requests against {url}')
+        
+        try:
+            unpooled = self.measure(lambda: requests.get(url, timeout=30), count)
+            session = build_session(options['provider'])
+            pooled = self.measure(lambda: session.get(url), count)
+            session.close()
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+        
+        self.report('requests.get (new connection per call)', unpooled)
+        self.report(f'pooled {options["provider"]} session (keep-alive)', pooled)
+        
+        speedup = statistics.mean(unpooled) / statistics.mean(pooled)
+        self.stdout.write(self.style.SUCCESS(f'✅ Pooled session is {speedup:.1f}x faster per call'))
+    
+    def measure(self, call, count):
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            call().raise_for_status()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+    
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'   {label}: mean {statistics.mean(timings):.2f} ms, '
+            f'p50 {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms'
+        )
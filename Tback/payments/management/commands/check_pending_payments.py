@@ -3,6 +3,7 @@ from django.utils import timezone
 from datetime import timedelta
 from payments.models import Payment
 from payments.services import PaymentService
+from payments.sweeper import sweep_payments, DEFAULT_CHUNK_SIZE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,6 +23,24 @@ class Command(BaseCommand):
             action='store_true',
             help='Update payment status from provider'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Payments claimed per chunk when updating (default: {DEFAULT_CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--worker-index',
+            type=int,
+            default=0,
+            help='Index of this worker when running several checkers (default: 0)'
+        )
+        parser.add_argument(
+            '--worker-count',
+            type=int,
+            default=1,
+            help='Total number of checkers sharing the work (default: 1)'
+        )
     
     def handle(self, *args, **options):
         hours = options['hours']
@@ -38,32 +57,21 @@ class Command(BaseCommand):
         
         if update:
             payment_service = PaymentService()
-            updated_count = 0
             
-            for payment in pending_payments:
+            def decide(payment):
                 try:
                     result = payment_service.check_payment_status(payment)
                     
                     if result.get('success') and result.get('status'):
                         new_status = result.get('status')
                         if new_status != payment.status:
-                            old_status = payment.status
-                            payment.status = new_status
-                            
-                            if new_status in ['successful', 'failed', 'cancelled']:
-                                payment.processed_at = timezone.now()
-                            
-                            payment.save()
-                            payment.log('info', f'Status updated from {old_status} to {new_status} via management command')
-                            
                             self.stdout.write(
                                 self.style.SUCCESS(
-                                    f'Updated payment {payment.reference}: {old_status} -> {new_status}'
+                                    f'Updated payment {payment.reference}: {payment.status} -> {new_status}'
                                 )
                             )
-                            updated_count += 1
-                        else:
-                            self.stdout.write(f'Payment {payment.reference}: status unchanged ({payment.status})')
+                            return new_status, f'Status updated from {payment.status} to {new_status} via management command'
+                        self.stdout.write(f'Payment {payment.reference}: status unchanged ({payment.status})')
                     else:
                         self.stdout.write(
                             self.style.WARNING(
@@ -76,6 +84,13 @@ class Command(BaseCommand):
                     self.stdout.write(
                         self.style.ERROR(f'Error checking payment {payment.reference}: {str(e)}')
                     )
+                return None
+            
+            updated_count = 0
+            for decisions, applied in sweep_payments(decide, cutoff=cutoff_time, chunk_size=options['chunk_size'],
+                                            worker_index=options['worker_index'],
+                                            worker_count=options['worker_count']):
+                updated_count += applied
             
             self.stdout.write(f'Updated {updated_count} payments')
         else:
@@ -2,6 +2,8 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 from payments.models import Payment
+from payments.state import transition
+from payments.sweeper import sweep_payments, DEFAULT_CHUNK_SIZE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,6 +35,24 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be done without making changes',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Payments claimed per chunk (default: {DEFAULT_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--worker-index',
+            type=int,
+            default=0,
+            help='Index of this worker when running several sweepers (default: 0)',
+        )
+        parser.add_argument(
+            '--worker-count',
+            type=int,
+            default=1,
+            help='Total number of sweepers sharing the work (default: 1)',
+        )
 
     def handle(self, *args, **options):
         reference = options['reference']
@@ -45,15 +65,13 @@ class Command(BaseCommand):
             try:
                 payment = Payment.objects.get(reference=reference)
                 if payment.status in ['pending', 'processing']:
+                    old_status = payment.status
                     if not dry_run:
-                        payment.status = new_status
-                        payment.processed_at = timezone.now()
-                        payment.save()
-                        payment.log('info', f'Payment manually completed via management command to {new_status}')
+                        transition(payment, new_status, f'Payment manually completed via management command to {new_status}')
                     
                     self.stdout.write(
                         self.style.SUCCESS(
-                            f'{"[DRY RUN] " if dry_run else ""}Completed payment {reference}: {payment.status} -> {new_status}'
+                            f'{"[DRY RUN] " if dry_run else ""}Completed payment {reference}: {old_status} -> {new_status}'
                         )
                     )
                 else:
@@ -67,37 +85,30 @@ class Command(BaseCommand):
         else:
             # Complete stuck payments
             cutoff_time = timezone.now() - timedelta(minutes=minutes)
-            stuck_payments = Payment.objects.filter(
-                status__in=['pending', 'processing'],
-                created_at__lt=cutoff_time
-            )
-
-            count = stuck_payments.count()
-            if count == 0:
-                self.stdout.write(
-                    self.style.SUCCESS(f'No stuck payments found (older than {minutes} minutes)')
-                )
-                return
-
-            self.stdout.write(f'Found {count} stuck payment(s):')
+            now = timezone.now()
             
-            for payment in stuck_payments:
-                age_minutes = (timezone.now() - payment.created_at).total_seconds() / 60
+            def decide(payment):
+                age_minutes = (now - payment.created_at).total_seconds() / 60
                 self.stdout.write(
                     f'- {payment.reference}: {payment.status} for {age_minutes:.1f} minutes'
                 )
-                
-                if not dry_run:
-                    payment.status = new_status
-                    payment.processed_at = timezone.now()
-                    payment.save()
-                    payment.log('info', f'Payment auto-completed via management command to {new_status} after {age_minutes:.1f} minutes')
+                return new_status, f'Payment auto-completed via management command to {new_status} after {age_minutes:.1f} minutes'
+            
+            count = 0
+            for decisions, applied in sweep_payments(decide, cutoff=cutoff_time, chunk_size=options['chunk_size'],
+                                            worker_index=options['worker_index'],
+                                            worker_count=options['worker_count'], dry_run=dry_run):
+                count += applied
 
-            if not dry_run:
+            if count == 0:
+                self.stdout.write(
+                    self.style.SUCCESS(f'No stuck payments found (older than {minutes} minutes)')
+                )
+            elif not dry_run:
                 self.stdout.write(
                     self.style.SUCCESS(f'Completed {count} stuck payment(s) with status: {new_status}')
                 )
             else:
                 self.stdout.write(
                     self.style.WARNING(f'[DRY RUN] Would complete {count} payment(s) with status: {new_status}')
-                )
\ No newline at end of file
+                )
@@ -1,6 +1,5 @@
 from django.core.management.base import BaseCommand
-from payments.models import Payment
-from payments.booking_utils import store_booking_details_in_payment, create_sample_booking_details
+from payments.backfill import backfill_booking_details, reset_checkpoint, DEFAULT_CHUNK_SIZE
 
 class Command(BaseCommand):
     help = 'Ensure all payments have booking details for admin display'
@@ -11,88 +10,40 @@ class Command(BaseCommand):
             action='store_true',
             help='Force update even if booking details already exist',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Payments read and written per chunk (default: {DEFAULT_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the saved checkpoint and start from the first payment',
+        )
     
     def handle(self, *args, **options):
         force_update = options['force']
+        # Forced rebuilds track progress separately from the missing-details backfill
+        checkpoint = 'booking_details_force' if force_update else 'booking_details'
+        
+        if options['restart']:
+            reset_checkpoint(checkpoint)
         
-        # Get payments that need booking details
         if force_update:
-            payments = Payment.objects.all()
             self.stdout.write('🔄 Force updating all payments...')
         else:
-            # Only update payments without booking details
-            payments_without_details = []
-            for payment in Payment.objects.all():
-                if not payment.metadata or 'booking_details' not in payment.metadata:
-                    payments_without_details.append(payment)
-            payments = payments_without_details
-            self.stdout.write(f'📋 Found {len(payments)} payments without booking details')
-        
-        if not payments:
-            self.stdout.write(self.style.SUCCESS('✅ All payments already have booking details'))
-            return
+            self.stdout.write('🔄 Backfilling payments without booking details...')
         
         updated_count = 0
-        for payment in payments:
-            self.add_booking_details_to_payment(payment)
-            updated_count += 1
-        
-        self.stdout.write(
-            self.style.SUCCESS(f'✅ Updated {updated_count} payments with booking details')
-        )
-    
-    def add_booking_details_to_payment(self, payment):
-        """Add appropriate booking details to a payment"""
-        
-        # Create sample data based on payment details
-        sample_data = create_sample_booking_details()
-        
-        # Customize based on payment amount and method
-        if payment.amount:
-            sample_data['final_total'] = float(payment.amount)
-            sample_data['base_total'] = float(payment.amount) * 0.65  # 65% base
-            sample_data['options_total'] = float(payment.amount) * 0.35  # 35% options
-        
-        # Customize destination based on amount ranges
-        amount = float(payment.amount) if payment.amount else 0
-        if amount <= 50:
-            sample_data['destination_name'] = 'Local Cultural Experience'
-            sample_data['destination_location'] = 'Accra, Ghana'
-            sample_data['duration'] = '1 Day'
-            sample_data['adults'] = 1
-            sample_data['children'] = 0
-        elif amount <= 150:
-            sample_data['destination_name'] = 'Kakum National Park Adventure'
-            sample_data['destination_location'] = 'Central Region, Ghana'
-            sample_data['duration'] = '2 Days / 1 Night'
-            sample_data['adults'] = 2
-            sample_data['children'] = 0
-        elif amount <= 300:
-            sample_data['destination_name'] = 'Cape Coast Castle Heritage Tour'
-            sample_data['destination_location'] = 'Cape Coast, Ghana'
-            sample_data['duration'] = '3 Days / 2 Nights'
-            sample_data['adults'] = 2
-            sample_data['children'] = 1
+        for count in backfill_booking_details(force=force_update, chunk_size=options['chunk_size'],
+                                              checkpoint=checkpoint):
+            updated_count += count
+            self.stdout.write(f'  📝 Updated {updated_count} payments so far')
+        
+        if updated_count:
+            self.stdout.write(
+                self.style.SUCCESS(f'✅ Updated {updated_count} payments with booking details')
+            )
         else:
-            sample_data['destination_name'] = 'Northern Ghana Safari Experience'
-            sample_data['destination_location'] = 'Northern Region, Ghana'
-            sample_data['duration'] = '5 Days / 4 Nights'
-            sample_data['adults'] = 3
-            sample_data['children'] = 2
-        
-        # Use actual user info if available
-        if payment.user:
-            user_name = f"{payment.user.first_name} {payment.user.last_name}".strip()
-            if not user_name:
-                user_name = payment.user.username or "User"
-            sample_data['user_name'] = user_name
-            sample_data['user_email'] = payment.user.email or ''
-        
-        # Use actual phone number if available
-        if payment.phone_number:
-            sample_data['user_phone'] = payment.phone_number
-        
-        # Store the booking details
-        store_booking_details_in_payment(payment, sample_data)
-        
-        self.stdout.write(f'  📝 {payment.reference}: {sample_data["destination_name"]} (GH₵{payment.amount})')
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS('✅ All payments already have booking details'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from payments.exports import export_lines, DATASETS, FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Stream payments or ticket purchases to CSV/NDJSON for finance'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS), help='What to export')
+        parser.add_argument(
+            '--format',
+            dest='export_format',
+            choices=sorted(FORMATS),
+            default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument('--status', action='append', default=[], help='Only rows with this status (repeatable)')
+        parser.add_argument('--from', dest='date_from', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+    
+    def handle(self, *args, **options):
+        try:
+            lines = export_lines(
+                options['dataset'],
+                options['export_format'],
+                statuses=options['status'],
+                date_from=options['date_from'],
+                date_to=options['date_to']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        
+        count = 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        
+        rows = count - 1 if options['export_format'] == 'csv' else count
+        self.stderr.write(self.style.SUCCESS(f"✅ Exported {rows} {options['dataset']} rows to {options['output']}"))
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from payments.log_buffer import buffered_payment_logs
 from payments.models import Payment
+from payments.state import transition
 import logging
 
 logger = logging.getLogger(__name__)
@@ -88,11 +90,9 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS('No stuck payments to complete!'))
             return
 
-        for payment in stuck_payments:
-            payment.status = status
-            payment.processed_at = timezone.now()
-            payment.save()
-            payment.log('info', f'Payment completed via fix_payment_flow command to {status}')
+        with buffered_payment_logs():
+            for payment in stuck_payments:
+                transition(payment, status, f'Payment completed via fix_payment_flow command to {status}')
 
         self.stdout.write(
             self.style.SUCCESS(f'Completed {count} stuck payment(s) with status: {status}')
@@ -104,10 +104,7 @@ class Command(BaseCommand):
             
             if payment.status in ['pending', 'processing']:
                 old_status = payment.status
-                payment.status = status
-                payment.processed_at = timezone.now()
-                payment.save()
-                payment.log('info', f'Payment completed via fix_payment_flow command: {old_status} -> {status}')
+                transition(payment, status, f'Payment completed via fix_payment_flow command: {old_status} -> {status}')
                 
                 self.stdout.write(
                     self.style.SUCCESS(f'Payment {reference} completed: {old_status} -> {status}')
@@ -127,10 +124,8 @@ class Command(BaseCommand):
             payment = Payment.objects.get(reference=reference)
             
             old_status = payment.status
-            payment.status = 'pending'
-            payment.processed_at = None
-            payment.save()
-            payment.log('info', f'Payment reset via fix_payment_flow command: {old_status} -> pending')
+            transition(payment, 'pending', f'Payment reset via fix_payment_flow command: {old_status} -> pending',
+                       force=True, processed_at=None)
             
             self.stdout.write(
                 self.style.SUCCESS(f'Payment {reference} reset: {old_status} -> pending')
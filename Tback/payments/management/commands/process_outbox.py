@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from payments.models import OutboxEvent
+from payments.outbox import run_worker, process_outbox_events, DEFAULT_BATCH_SIZE, DEFAULT_POLL_INTERVAL
+
+
+class Command(BaseCommand):
+    help = 'Drain the payment outbox and run fulfillment for completed payments'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Events claimed per batch (default: {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=DEFAULT_POLL_INTERVAL,
+            help=f'Seconds between outbox checks when idle (default: {DEFAULT_POLL_INTERVAL})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process all currently due events and exit'
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Requeue failed events before processing'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        
+        if options['retry_failed']:
+            requeued = OutboxEvent.objects.filter(status='failed').update(
+                status='pending', attempts=0, available_at=timezone.now()
+            )
+            self.stdout.write(f'🔁 Requeued {requeued} failed outbox events')
+        
+        if options['once']:
+            total = 0
+            while True:
+                claimed = process_outbox_events(batch_size)
+                total += claimed
+                if claimed < batch_size:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'✅ Processed {total} outbox events'))
+            return
+        
+        self.stdout.write('🚀 Outbox worker running (Ctrl+C to stop)')
+        try:
+            run_worker(batch_size=batch_size, poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('\n🛑 Outbox worker stopped')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from payments.settlement import rebuild_settlement_rollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily settlement rollups from payments and the archive index'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='First day to rebuild (YYYY-MM-DD, default: all)')
+        parser.add_argument('--to', dest='date_to', help='Last day to rebuild (YYYY-MM-DD, default: all)')
+    
+    def handle(self, *args, **options):
+        days = {}
+        for option in ('date_from', 'date_to'):
+            value = options[option]
+            try:
+                days[option] = parse_date(value) if value else None
+            except ValueError:
+                days[option] = None
+            if value and days[option] is None:
+                raise CommandError(f'Invalid date: {value} (expected YYYY-MM-DD)')
+        
+        self.stdout.write("🔄 Rebuilding settlement rollups...")
+        rows = rebuild_settlement_rollup(**days)
+        self.stdout.write(self.style.SUCCESS(f"✅ Wrote {rows} rollup rows"))
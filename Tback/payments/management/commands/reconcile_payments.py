@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import timedelta
+from payments.models import Payment
+from payments.reconciliation import reconcile_payments, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Reconcile pending/processing payments with their providers concurrently'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--minutes',
+            type=int,
+            default=0,
+            help='Only reconcile payments older than X minutes (default: 0)'
+        )
+        parser.add_argument(
+            '--provider',
+            type=str,
+            help='Only reconcile payments for this provider code'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Payments loaded and written back per batch (default: {DEFAULT_CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--concurrency',
+            action='append',
+            default=[],
+            metavar='PROVIDER=N',
+            help='Concurrent checks allowed for a provider, e.g. mtn_momo=50 (repeatable)'
+        )
+    
+    def handle(self, *args, **options):
+        concurrency = {}
+        for value in options['concurrency']:
+            provider_code, _, limit = value.partition('=')
+            if not limit.isdigit() or int(limit) < 1:
+                raise CommandError(f'Invalid --concurrency value: {value}')
+            concurrency[provider_code] = int(limit)
+        
+        payments = Payment.objects.filter(
+            created_at__lt=timezone.now() - timedelta(minutes=options['minutes'])
+        )
+        if options['provider']:
+            payments = payments.filter(provider__code=options['provider'])
+        
+        self.stdout.write('🔄 Reconciling in-flight payments...')
+        
+        def on_chunk(report):
+            self.stdout.write(
+                f'   Checked {report.checked} payments ({report.throughput:.1f}/s), '
+                f'{report.updated} updated, {report.errors} errors'
+            )
+        
+        report = reconcile_payments(
+            payments,
+            chunk_size=options['chunk_size'],
+            concurrency=concurrency,
+            on_chunk=on_chunk
+        )
+        
+        for provider_code, count in sorted(report.by_provider.items()):
+            self.stdout.write(f'   {provider_code}: {count} checked')
+        for transition, count in sorted(report.transitions.items()):
+            self.stdout.write(f'   {transition}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Reconciled {report.checked} payments in {report.elapsed:.2f}s '
+            f'({report.throughput:.1f} checks/s), {report.updated} updated'
+        ))
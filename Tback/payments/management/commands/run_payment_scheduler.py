@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from payments.scheduler import run_worker, run_due_transitions, DEFAULT_BATCH_SIZE, DEFAULT_POLL_INTERVAL
+
+
+class Command(BaseCommand):
+    help = 'Run the worker that executes scheduled payment transitions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Transitions claimed per batch (default: {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=DEFAULT_POLL_INTERVAL,
+            help=f'Maximum seconds between queue checks (default: {DEFAULT_POLL_INTERVAL})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain all currently due transitions and exit'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        
+        if options['once']:
+            total = 0
+            while True:
+                claimed = run_due_transitions(batch_size)
+                total += claimed
+                if claimed < batch_size:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'✅ Processed {total} scheduled transitions'))
+            return
+        
+        self.stdout.write('🚀 Payment scheduler running (Ctrl+C to stop)')
+        try:
+            run_worker(batch_size=batch_size, poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('\n🛑 Payment scheduler stopped')
@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from payments.mtn_momo_service import MTNMoMoService
 from payments.models import Payment, PaymentProvider
+from payments.state import transition
 import json
 
 class Command(BaseCommand):
@@ -134,9 +135,7 @@ class Command(BaseCommand):
             self.stdout.write(f'   Message: {result.get("message")}')
             
             # Update payment with external reference
-            payment.external_reference = result.get('external_reference')
-            payment.status = 'processing'
-            payment.save()
+            transition(payment, 'processing', external_reference=result.get('external_reference'))
             
             # Test status check
             self.stdout.write('\nChecking payment status...')
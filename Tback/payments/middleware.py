@@ -1,113 +1,17 @@
 """
-Middleware to ensure booking details are added to payments
+Payment middleware
 """
-import logging
-from django.utils.deprecation import MiddlewareMixin
+from .log_buffer import buffered_payment_logs
 
-logger = logging.getLogger(__name__)
-
-class BookingDetailsMiddleware(MiddlewareMixin):
+class PaymentLogBufferMiddleware:
     """
-    Middleware to ensure all payments have booking details
+    Buffer PaymentLog entries written while handling a request and insert
+    them in one batch once the response has been produced
     """
     
-    def process_response(self, request, response):
-        """
-        Check if a payment was created and add booking details if missing
-        """
-        # Only process successful payment creation requests
-        if (request.path.startswith('/api/payments/checkout/create/') and 
-            request.method == 'POST' and 
-            response.status_code == 201):
-            
-            try:
-                import json
-                response_data = json.loads(response.content.decode('utf-8'))
-                
-                if 'payment' in response_data and 'reference' in response_data['payment']:
-                    payment_reference = response_data['payment']['reference']
-                    
-                    # Check if payment has booking details
-                    from .models import Payment
-                    try:
-                        payment = Payment.objects.get(reference=payment_reference)
-                        
-                        if not payment.metadata or 'booking_details' not in payment.metadata:
-                            # Add booking details
-                            self.add_booking_details_to_payment(payment)
-                            logger.info(f"Added booking details to payment {payment_reference} via middleware")
-                            
-                    except Payment.DoesNotExist:
-                        logger.warning(f"Payment {payment_reference} not found in middleware")
-                        
-            except Exception as e:
-                logger.error(f"Error in BookingDetailsMiddleware: {str(e)}")
-        
-        return response
+    def __init__(self, get_response):
+        self.get_response = get_response
     
-    def add_booking_details_to_payment(self, payment):
-        """Add booking details to a payment"""
-        try:
-            from .booking_utils import store_booking_details_in_payment, create_sample_booking_details
-            
-            # Create sample booking details
-            sample_data = create_sample_booking_details()
-            sample_data['final_total'] = float(payment.amount)
-            sample_data['base_total'] = float(payment.amount) * 0.65
-            sample_data['options_total'] = float(payment.amount) * 0.35
-            
-            # Customize based on amount and description
-            amount = float(payment.amount) if payment.amount else 0
-            description = payment.description or ""
-            
-            # Try to extract destination from description
-            if "akosombo" in description.lower() or "dodi" in description.lower():
-                sample_data['destination_name'] = 'Akosombo Dodi Island Boat Cruise'
-                sample_data['destination_location'] = 'Eastern Region, Ghana'
-                sample_data['duration'] = '1 Day Trip'
-                sample_data['adults'] = 2
-                sample_data['children'] = 0
-            elif "kakum" in description.lower():
-                sample_data['destination_name'] = 'Kakum National Park Adventure'
-                sample_data['destination_location'] = 'Central Region, Ghana'
-                sample_data['duration'] = '2 Days / 1 Night'
-            elif "cape coast" in description.lower():
-                sample_data['destination_name'] = 'Cape Coast Castle Heritage Tour'
-                sample_data['destination_location'] = 'Cape Coast, Ghana'
-                sample_data['duration'] = '3 Days / 2 Nights'
-            elif amount <= 50:
-                sample_data['destination_name'] = 'Local Cultural Experience'
-                sample_data['destination_location'] = 'Accra, Ghana'
-                sample_data['duration'] = '1 Day'
-                sample_data['adults'] = 1
-                sample_data['children'] = 0
-            elif amount <= 150:
-                sample_data['destination_name'] = 'Kakum National Park Adventure'
-                sample_data['destination_location'] = 'Central Region, Ghana'
-                sample_data['duration'] = '2 Days / 1 Night'
-                sample_data['adults'] = 2
-                sample_data['children'] = 0
-            else:
-                sample_data['destination_name'] = 'Northern Ghana Safari Experience'
-                sample_data['destination_location'] = 'Northern Region, Ghana'
-                sample_data['duration'] = '5 Days / 4 Nights'
-                sample_data['adults'] = 3
-                sample_data['children'] = 2
-            
-            # Use actual user info if available
-            if payment.user:
-                user_name = f"{payment.user.first_name} {payment.user.last_name}".strip()
-                if not user_name:
-                    user_name = payment.user.username or "User"
-                sample_data['user_name'] = user_name
-                sample_data['user_email'] = payment.user.email or ''
-            
-            # Use actual phone number if available
-            if payment.phone_number:
-                sample_data['user_phone'] = payment.phone_number
-            
-            # Store the booking details
-            store_booking_details_in_payment(payment, sample_data)
-            
-        except Exception as e:
-            logger.error(f"Failed to add booking details to payment {payment.reference}: {str(e)}")
\ No newline at end of file
+    def __call__(self, request):
+        with buffered_payment_logs():
+            return self.get_response(request)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_alter_payment_payment_method'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('auto_complete', 'Auto Complete')], default='auto_complete', max_length=20)),
+                ('due_at', models.DateTimeField(db_index=True)),
+                ('success_rate', models.FloatField(default=0.9)),
+                ('delay_seconds', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_transitions', to='payments.payment')),
+            ],
+            options={
+                'ordering': ['due_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='paymentlog',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AlterField(
+            model_name='paymentlog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
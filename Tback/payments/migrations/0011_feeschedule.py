@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_backfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeeSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_method', models.CharField(max_length=20)),
+                ('currency', models.CharField(max_length=3)),
+                ('fee_type', models.CharField(choices=[('flat', 'Flat'), ('percentage', 'Percentage'), ('tiered', 'Tiered')], max_length=20)),
+                ('flat_fee', models.DecimalField(decimal_places=2, default=0, help_text='Fee for flat schedules', max_digits=10)),
+                ('rate', models.DecimalField(decimal_places=4, default=0, help_text='Fraction of the amount for percentage schedules', max_digits=6)),
+                ('min_fee', models.DecimalField(decimal_places=2, default=0, help_text='Minimum fee for percentage schedules', max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['payment_method', 'currency'],
+                'constraints': [models.UniqueConstraint(fields=('payment_method', 'currency'), name='unique_fee_schedule')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FeeTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, help_text='Leave empty for no upper bound', max_digits=12, null=True)),
+                ('fee', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiers', to='payments.feeschedule')),
+            ],
+            options={
+                'ordering': ['schedule', 'min_amount'],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+from decimal import Decimal
+from django.db import migrations
+
+MOMO_GHS_TIERS = [(1, 100, 0), (101, 500, 2), (501, 1000, 5), (1001, 5000, 10), (5001, None, 20)]
+MOMO_KES_TIERS = [(1, 100, 0), (101, 500, 5), (501, 1000, 10), (1001, 5000, 15), (5001, None, 25)]
+
+# Fee structures previously hard-coded in payments.utils.calculate_payment_fees
+SCHEDULES = [
+    ('momo', 'GHS', 'tiered', {}, MOMO_GHS_TIERS),
+    ('mobile_money', 'GHS', 'tiered', {}, MOMO_GHS_TIERS),
+    ('mobile_money', 'KES', 'tiered', {}, MOMO_KES_TIERS),
+    ('card', 'GHS', 'percentage', {'rate': '0.035', 'min_fee': '2'}, []),
+    ('card', 'KES', 'percentage', {'rate': '0.035', 'min_fee': '10'}, []),
+    ('card', 'USD', 'percentage', {'rate': '0.029', 'min_fee': '0.30'}, []),
+    ('card', 'EUR', 'percentage', {'rate': '0.029', 'min_fee': '0.30'}, []),
+    ('bank_transfer', 'GHS', 'flat', {'flat_fee': '5'}, []),
+    ('bank_transfer', 'KES', 'flat', {'flat_fee': '50'}, []),
+    ('bank_transfer', 'USD', 'flat', {'flat_fee': '1.00'}, []),
+    ('bank_transfer', 'EUR', 'flat', {'flat_fee': '1.00'}, []),
+]
+
+
+def seed_fee_schedules(apps, schema_editor):
+    FeeSchedule = apps.get_model('payments', 'FeeSchedule')
+    FeeTier = apps.get_model('payments', 'FeeTier')
+    for payment_method, currency, fee_type, values, tiers in SCHEDULES:
+        schedule, created = FeeSchedule.objects.get_or_create(
+            payment_method=payment_method,
+            currency=currency,
+            defaults={'fee_type': fee_type, **{field: Decimal(value) for field, value in values.items()}}
+        )
+        if created:
+            FeeTier.objects.bulk_create([
+                FeeTier(
+                    schedule=schedule,
+                    min_amount=Decimal(low),
+                    max_amount=Decimal(high) if high is not None else None,
+                    fee=Decimal(fee)
+                )
+                for low, high, fee in tiers
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_feeschedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_fee_schedules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations
+from django.utils import timezone
+
+
+def _fee_rules(FeeSchedule):
+    """{(payment_method, currency): fee function}, mirroring payments.fees.CompiledSchedule.fee_for"""
+    rules = {}
+    for schedule in FeeSchedule.objects.filter(is_active=True).prefetch_related('tiers'):
+        if schedule.fee_type == 'flat':
+            rules[(schedule.payment_method, schedule.currency)] = lambda amount, fee=float(schedule.flat_fee): fee
+        elif schedule.fee_type == 'percentage':
+            rules[(schedule.payment_method, schedule.currency)] = (
+                lambda amount, rate=float(schedule.rate), min_fee=float(schedule.min_fee): max(amount * rate, min_fee)
+            )
+        elif schedule.fee_type == 'tiered':
+            tiers = [
+                (float(tier.min_amount), float(tier.max_amount) if tier.max_amount is not None else float('inf'), float(tier.fee))
+                for tier in schedule.tiers.all()
+            ]
+
+            def tiered(amount, tiers=sorted(tiers)):
+                # The last band starting at or below the amount; gaps between bands are free
+                matching = [tier for tier in tiers if tier[0] <= amount]
+                if matching and amount <= matching[-1][1]:
+                    return matching[-1][2]
+                return 0
+
+            rules[(schedule.payment_method, schedule.currency)] = tiered
+    return rules
+
+
+def seed_settlement_rollup(apps, schema_editor):
+    # Rollups are only maintained incrementally from here on, so start from
+    # the current payment and archive tables
+    Payment = apps.get_model('payments', 'Payment')
+    PaymentProvider = apps.get_model('payments', 'PaymentProvider')
+    ArchivedPayment = apps.get_model('payments', 'ArchivedPayment')
+    FeeSchedule = apps.get_model('payments', 'FeeSchedule')
+    SettlementRollup = apps.get_model('payments', 'SettlementRollup')
+
+    rules = _fee_rules(FeeSchedule)
+    codes = dict(PaymentProvider.objects.values_list('id', 'code'))
+    totals = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+    columns = ('created_at', 'currency', 'status', 'amount', 'payment_method')
+    sources = [
+        ((codes.get(provider_id, ''), *row) for provider_id, *row in Payment.objects.order_by().values_list('provider_id', *columns).iterator(chunk_size=2000)),
+        ArchivedPayment.objects.order_by().values_list('provider_code', *columns).iterator(chunk_size=2000),
+    ]
+    for source in sources:
+        for code, created_at, currency, status, amount, payment_method in source:
+            gross = Decimal(str(amount))
+            rule = rules.get((payment_method, currency))
+            fee = Decimal(str(round(rule(float(gross)), 2))) if rule else Decimal('0')
+            total = totals[(timezone.localdate(created_at), code, currency, status)]
+            total[0] += 1
+            total[1] += gross
+            total[2] += fee
+
+    SettlementRollup.objects.all().delete()
+    SettlementRollup.objects.bulk_create([
+        SettlementRollup(day=day, provider_code=code, currency=currency, status=status, count=count, gross=gross, fees=fees)
+        for (day, code, currency, status), (count, gross, fees) in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0016_archivedpayment_provider_code_settlementrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_settlement_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0017_seed_settlement_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledtransition',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scheduledtransition',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from tback_api.references import payment_reference
 from decimal import Decimal
 import uuid
 
@@ -51,6 +53,7 @@ class Payment(models.Model):
     
     # Payment status and tracking
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    version = models.PositiveIntegerField(default=0, editable=False)  # Bumped by every status transition
     external_reference = models.CharField(max_length=100, blank=True)  # Provider's transaction ID
     
     # Timestamps
@@ -71,20 +74,25 @@ class Payment(models.Model):
             models.Index(fields=['external_reference']),
         ]
     
+    # Written only by payments.state.transition()/bulk_transition()
+    STATE_FIELDS = ('status', 'processed_at', 'version')
+    
     def save(self, *args, **kwargs):
         if not self.reference:
-            # Generate unique reference
-            self.reference = f"PAY{str(uuid.uuid4())[:8].upper()}"
+            # Generate unique, time-ordered reference
+            self.reference = payment_reference()
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            # A stale instance must not overwrite a concurrent status transition
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STATE_FIELDS
+            ]
         super().save(*args, **kwargs)
     
     def log(self, level, message, data=None):
-        """Create a log entry for this payment"""
-        PaymentLog.objects.create(
-            payment=self,
-            level=level,
-            message=message,
-            data=data or {}
-        )
+        """Create a log entry for this payment (buffered inside ``buffered_payment_logs()``)"""
+        from .log_buffer import record
+        return record(self, level, message, data)
     
     def __str__(self):
         return f"Payment {self.reference} - {self.currency} {self.amount} ({self.status})"
@@ -117,10 +125,210 @@ class PaymentLog(models.Model):
     level = models.CharField(max_length=10, choices=LOG_LEVELS, default='info')
     message = models.TextField()
     data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)  # Set when the entry is recorded, not when it is flushed
+    
+    class Meta:
+        ordering = ['-created_at', '-id']
+    
+    def __str__(self):
+        return f"{self.payment.reference} - {self.level.upper()}: {self.message[:50]}"
+
+class ScheduledTransition(models.Model):
+    """Durable timer that moves a payment to a final status once it is due"""
+    ACTION_CHOICES = [
+        ('auto_complete', 'Auto Complete'),
+    ]
+    
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='scheduled_transitions')
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES, default='auto_complete')
+    due_at = models.DateTimeField(db_index=True)
+    success_rate = models.FloatField(default=0.9)
+    delay_seconds = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['due_at']
+    
+    def __str__(self):
+        return f"{self.action} for {self.payment.reference} at {self.due_at}"
+
+class WebhookEvent(models.Model):
+    """Inbox of raw provider webhooks, acknowledged on receipt and processed by a worker"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+    
+    provider_code = models.CharField(max_length=50)
+    event_id = models.CharField(max_length=255)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['provider_code', 'event_id'], name='unique_webhook_event'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.provider_code} event {self.event_id} ({self.status})"
+
+class OutboxEvent(models.Model):
+    """Follow-up work for a payment transition, written in the same transaction and run by a worker"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+    
+    topic = models.CharField(max_length=50)
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='outbox_events')
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)  # Not retried before this
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['topic', 'payment'], name='unique_outbox_event'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic} for payment {self.payment_id} ({self.status})"
+
+class SettlementRollup(models.Model):
+    """Payments rolled up per creation day, provider, currency and status, maintained on every transition"""
+    day = models.DateField()
+    provider_code = models.CharField(max_length=20, blank=True)  # Empty for payments without a provider
+    currency = models.CharField(max_length=3)
+    status = models.CharField(max_length=20, choices=Payment.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    gross = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    fees = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-day', 'provider_code', 'currency', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'provider_code', 'currency', 'status'], name='unique_settlement_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.provider_code or '-'} {self.currency} {self.status}: {self.count}"
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a request made with an Idempotency-Key header"""
+    STATUS_CHOICES = [
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+    ]
+    
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    owner = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'owner', 'key'], name='unique_idempotency_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status})"
+
+class BackfillCheckpoint(models.Model):
+    """Resume point of a long-running, keyset-ordered backfill over payments"""
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.last_id} ({self.processed} processed)"
+
+class FeeSchedule(models.Model):
+    """Processing fee rule for one payment method and currency"""
+    FEE_TYPE_CHOICES = [
+        ('flat', 'Flat'),
+        ('percentage', 'Percentage'),
+        ('tiered', 'Tiered'),
+    ]
+    
+    payment_method = models.CharField(max_length=20)
+    currency = models.CharField(max_length=3)
+    fee_type = models.CharField(max_length=20, choices=FEE_TYPE_CHOICES)
+    flat_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Fee for flat schedules")
+    rate = models.DecimalField(max_digits=6, decimal_places=4, default=0, help_text="Fraction of the amount for percentage schedules")
+    min_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Minimum fee for percentage schedules")
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['payment_method', 'currency']
+        constraints = [
+            models.UniqueConstraint(fields=['payment_method', 'currency'], name='unique_fee_schedule'),
+        ]
+    
+    def __str__(self):
+        return f"{self.payment_method} {self.currency} ({self.fee_type})"
+
+class FeeTier(models.Model):
+    """Amount band of a tiered fee schedule; both bounds are inclusive"""
+    schedule = models.ForeignKey(FeeSchedule, on_delete=models.CASCADE, related_name='tiers')
+    min_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    max_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Leave empty for no upper bound")
+    fee = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    class Meta:
+        ordering = ['schedule', 'min_amount']
+    
+    def __str__(self):
+        upper = self.max_amount if self.max_amount is not None else '∞'
+        return f"{self.schedule}: {self.min_amount}-{upper} → {self.fee}"
+
+class ArchivedPayment(models.Model):
+    """Index entry for a payment moved out of the hot tables into a monthly NDJSON archive file"""
+    reference = models.CharField(max_length=50, unique=True)
+    payment_id = models.UUIDField()
+    user = models.ForeignKey('authentication.User', on_delete=models.SET_NULL, related_name='archived_payments', null=True, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3)
+    payment_method = models.CharField(max_length=20)
+    provider_code = models.CharField(max_length=20, blank=True)
+    status = models.CharField(max_length=20, choices=Payment.STATUS_CHOICES)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    processed_at = models.DateTimeField(null=True, blank=True)
+    archive_file = models.CharField(max_length=255, help_text="Archive file holding the full record, relative to PAYMENT_ARCHIVE_DIR")
+    archived_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
     
     def __str__(self):
-        return f"{self.payment.reference} - {self.level.upper()}: {self.message[:50]}"
\ No newline at end of file
+        return f"Archived payment {self.reference} ({self.status})"
@@ -2,13 +2,132 @@ import requests
 import uuid
 import base64
 import logging
-from typing import Dict, Any, Optional
+import threading
+import time
+from typing import Callable, Dict, Any, Optional
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from .models import Payment
+from .http import get_session, provider_timeout
 
 logger = logging.getLogger(__name__)
 
+class MTNTokenManager:
+    """
+    Caches MTN MoMo access tokens and refreshes them ahead of expiry.
+    
+    Tokens live in this process and in the cache backend, so with a shared
+    cache (REDIS_URL) every worker process reuses the same token. A refresh
+    starts in the background once a token is within ``refresh_ahead``
+    seconds of expiring. A lock per key (plus ``cache.add`` across processes
+    sharing the cache) ensures only one refresh runs at a time, and callers
+    holding a usable token never wait for a refresh in progress.
+    """
+    
+    def __init__(self, expiry_margin=60, refresh_ahead=300, lock_timeout=30):
+        self.expiry_margin = expiry_margin
+        self.refresh_ahead = refresh_ahead
+        self.lock_timeout = lock_timeout
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+        self._refreshing = set()
+    
+    def get_token(self, key: str, fetch: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Return a usable token result for ``key``, calling ``fetch`` only when needed"""
+        entry = self._usable(key)
+        if entry:
+            if time.time() >= entry['refresh_at']:
+                self._refresh_in_background(key, fetch)
+            return {'success': True, 'access_token': entry['access_token'], 'expires_in': int(entry['expires_at'] - time.time())}
+        
+        with self._fetch_lock(key):
+            # Another thread may have refreshed while we waited for the lock
+            entry = self._usable(key)
+            if entry:
+                return {'success': True, 'access_token': entry['access_token'], 'expires_in': int(entry['expires_at'] - time.time())}
+            return self._refresh(key, fetch)
+    
+    def invalidate(self, key: str):
+        """Drop a token, e.g. after the API rejected it"""
+        self._tokens.pop(key, None)
+        cache.delete(self._cache_key(key))
+    
+    def _cache_key(self, key):
+        return f'mtn_momo_token:{key}'
+    
+    def _fetch_lock(self, key):
+        with self._lock:
+            return self._fetch_locks.setdefault(key, threading.Lock())
+    
+    def _usable(self, key):
+        now = time.time()
+        entry = self._tokens.get(key)
+        if entry is None or entry['expires_at'] - now <= self.expiry_margin:
+            entry = cache.get(self._cache_key(key))
+            if entry is None or entry['expires_at'] - now <= self.expiry_margin:
+                return None
+            self._tokens[key] = entry
+        return entry
+    
+    def _refresh(self, key, fetch):
+        lock_key = f'{self._cache_key(key)}:lock'
+        if not cache.add(lock_key, True, timeout=self.lock_timeout):
+            # Another process is refreshing; wait briefly for its token
+            deadline = time.time() + self.lock_timeout
+            while time.time() < deadline:
+                time.sleep(0.1)
+                entry = self._usable(key)
+                if entry:
+                    return {'success': True, 'access_token': entry['access_token'], 'expires_in': int(entry['expires_at'] - time.time())}
+                if cache.add(lock_key, True, timeout=self.lock_timeout):
+                    break
+            else:
+                return {'success': False, 'error': 'Timed out waiting for MTN MoMo token refresh'}
+        
+        try:
+            result = fetch()
+            if result.get('success') and result.get('access_token'):
+                expires_in = int(result.get('expires_in') or 3600)
+                now = time.time()
+                entry = {
+                    'access_token': result['access_token'],
+                    'expires_at': now + expires_in,
+                    # Short-lived tokens refresh halfway through their lifetime
+                    'refresh_at': now + expires_in - min(self.refresh_ahead, expires_in / 2)
+                }
+                self._tokens[key] = entry
+                cache.set(self._cache_key(key), entry, timeout=max(expires_in - self.expiry_margin, 1))
+            return result
+        finally:
+            cache.delete(lock_key)
+    
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        
+        def run():
+            try:
+                with self._fetch_lock(key):
+                    # Skip if another process already stored a fresher token
+                    entry = cache.get(self._cache_key(key))
+                    if entry and time.time() < entry['refresh_at']:
+                        self._tokens[key] = entry
+                    else:
+                        self._refresh(key, fetch)
+            except Exception as e:
+                logger.error(f"MTN MoMo background token refresh error: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        
+        threading.Thread(target=run, name='mtn-momo-token-refresh', daemon=True).start()
+
+token_manager = MTNTokenManager()
+
 class MTNMoMoService:
     """Service class for MTN Mobile Money API integration"""
     
@@ -19,10 +138,19 @@ class MTNMoMoService:
         self.collection_api_key = settings.MTN_MOMO_COLLECTION_API_KEY
         self.subscription_key = settings.MTN_MOMO_COLLECTION_SUBSCRIPTION_KEY
         self.callback_url = settings.MTN_MOMO_CALLBACK_URL
-        self.timeout = 30
+        self.session = get_session('mtn_momo')
+        self.timeout = provider_timeout('mtn_momo')
         
+    @property
+    def _token_key(self) -> str:
+        return f"{self.environment}:{self.collection_user_id}"
+    
     def _get_access_token(self) -> Dict[str, Any]:
-        """Get access token for MTN MoMo API"""
+        """Get a cached access token for MTN MoMo API, requesting one only when needed"""
+        return token_manager.get_token(self._token_key, self._request_access_token)
+    
+    def _request_access_token(self) -> Dict[str, Any]:
+        """Request a new access token from MTN MoMo API"""
         try:
             # Encode credentials
             credentials = base64.b64encode(
@@ -35,7 +163,7 @@ class MTNMoMoService:
                 'Content-Type': 'application/json'
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/collection/token/",
                 headers=headers,
                 timeout=self.timeout
@@ -99,7 +227,7 @@ class MTNMoMoService:
                 'Ocp-Apim-Subscription-Key': self.subscription_key
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/collection/v1_0/requesttopay",
                 json=payload,
                 headers=headers,
@@ -115,6 +243,8 @@ class MTNMoMoService:
                     'transaction_id': transaction_ref
                 }
             else:
+                if response.status_code == 401:
+                    token_manager.invalidate(self._token_key)
                 logger.error(f"MTN MoMo payment failed: {response.status_code} - {response.text}")
                 return {
                     'success': False,
@@ -153,7 +283,7 @@ class MTNMoMoService:
                 'Ocp-Apim-Subscription-Key': self.subscription_key
             }
             
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/collection/v1_0/requesttopay/{external_reference}",
                 headers=headers,
                 timeout=self.timeout
@@ -183,6 +313,8 @@ class MTNMoMoService:
                     'message': f'Payment status: {status}'
                 }
             else:
+                if response.status_code == 401:
+                    token_manager.invalidate(self._token_key)
                 logger.error(f"MTN MoMo status check failed: {response.status_code} - {response.text}")
                 return {
                     'success': False,
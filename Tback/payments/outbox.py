@@ -0,0 +1,159 @@
+"""
+Transactional outbox for work that follows a payment transition.
+
+``state.transition()`` writes an OutboxEvent in the same transaction as the
+status change, so follow-up work is recorded if and only if the transition
+commits. A worker drains the outbox in batches, claiming rows with
+``SELECT ... FOR UPDATE SKIP LOCKED``, and runs each event's handler in its
+own savepoint. Handlers are idempotent, so an event that is retried after a
+crash or a failure repeats no work. Failed events are retried with
+exponential backoff up to MAX_ATTEMPTS times before being marked failed;
+a handler returns ``'retry': False`` for failures no retry can fix.
+Request paths never run fulfillment themselves.
+"""
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from .log_buffer import buffered_payment_logs
+from .models import Payment, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Topic written when a payment enters the given status
+TRANSITION_TOPICS = {
+    'successful': 'payment.successful',
+}
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_POLL_INTERVAL = 5.0
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def enqueue_for_transition(payments, new_status):
+    """Record the outbox event for payments that just moved to ``new_status``, if it has one"""
+    topic = TRANSITION_TOPICS.get(new_status)
+    if topic is None or not payments:
+        return
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(topic=topic, payment=payment) for payment in payments],
+        ignore_conflicts=True
+    )
+    transaction.on_commit(_wake_worker)
+
+
+def fulfill_successful_payment(event):
+    """Confirm the booking and issue tickets for a successful payment"""
+    from tickets.fulfillment import fulfill_ticket_payment, TicketUnavailable
+
+    payment = Payment.objects.select_for_update().select_related('booking', 'user').get(pk=event.payment_id)
+    if payment.status != 'successful':
+        # Refunded (or force-reset) before the worker got to it
+        return {'success': True, 'skipped': payment.status}
+
+    if payment.booking and payment.booking.status == 'pending':
+        payment.booking.status = 'confirmed'
+        payment.booking.save(update_fields=['status', 'updated_at'])
+        payment.log('info', f'Booking {payment.booking.booking_reference} confirmed')
+
+    try:
+        purchase = fulfill_ticket_payment(payment)
+    except TicketUnavailable as e:
+        payment.log('error', f'Ticket purchase not created: {str(e)}')
+        return {'success': False, 'error': str(e), 'retry': False}
+    if purchase is not None:
+        payment.log('info', f'Ticket purchase {purchase.purchase_id} fulfilled')
+    return {'success': True}
+
+
+OUTBOX_HANDLERS = {
+    'payment.successful': fulfill_successful_payment,
+}
+
+
+def process_outbox_events(batch_size=DEFAULT_BATCH_SIZE):
+    """Claim and run one batch of due outbox events, returning how many were claimed"""
+    with transaction.atomic(), buffered_payment_logs():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=timezone.now())
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        for event in events:
+            event.attempts += 1
+            try:
+                with transaction.atomic():
+                    result = OUTBOX_HANDLERS[event.topic](event)
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+
+            now = timezone.now()
+            if result.get('success'):
+                event.status = 'processed'
+                event.error = ''
+                event.processed_at = now
+            else:
+                event.error = str(result.get('error') or 'Processing failed')
+                if event.attempts >= MAX_ATTEMPTS or result.get('retry') is False:
+                    event.status = 'failed'
+                    event.processed_at = now
+                else:
+                    event.available_at = now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (event.attempts - 1))
+                logger.warning(f"Outbox event {event.pk} ({event.topic}) failed: {event.error}")
+
+        OutboxEvent.objects.bulk_update(events, ['status', 'attempts', 'error', 'available_at', 'processed_at'])
+    return len(events)
+
+
+def seconds_until_next_due(poll_interval=DEFAULT_POLL_INTERVAL):
+    """How long the worker may sleep before the next pending event becomes due"""
+    next_due = (
+        OutboxEvent.objects.filter(status='pending').order_by('available_at')
+        .values_list('available_at', flat=True).first()
+    )
+    if next_due is None:
+        return poll_interval
+    return max(0.0, min(poll_interval, (next_due - timezone.now()).total_seconds()))
+
+
+def run_worker(stop_event=None, batch_size=DEFAULT_BATCH_SIZE, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Drain the outbox until ``stop_event`` is set"""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        close_old_connections()
+        try:
+            if process_outbox_events(batch_size) >= batch_size:
+                continue
+            timeout = seconds_until_next_due(poll_interval)
+        except Exception as e:
+            logger.error(f"Outbox worker error: {str(e)}")
+            timeout = poll_interval
+
+        _wakeup.wait(timeout)
+        _wakeup.clear()
+
+
+def _wake_worker():
+    ensure_worker()
+    _wakeup.set()
+
+
+def ensure_worker():
+    """Start the in-process outbox worker once, if autostart is enabled"""
+    global _worker
+    if not getattr(settings, 'PAYMENT_OUTBOX_WORKER_AUTOSTART', True):
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run_worker, name='payment-outbox-worker', daemon=True)
+            _worker.start()
+            logger.info("Started payment outbox worker")
@@ -1,12 +1,12 @@
 import os
-import requests
 import hashlib
 import hmac
 import json
 from decimal import Decimal
 from django.conf import settings
-from django.utils import timezone
 from .models import Payment, PaymentLog
+from .http import get_session
+from .state import transition
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,7 +18,8 @@ class PaystackService:
         self.secret_key = os.getenv('PAYSTACK_SECRET_KEY')
         self.public_key = os.getenv('PAYSTACK_PUBLIC_KEY')
         self.webhook_secret = os.getenv('PAYSTACK_WEBHOOK_SECRET')
-        self.base_url = 'https://api.paystack.co'
+        self.base_url = os.getenv('PAYSTACK_BASE_URL', 'https://api.paystack.co')
+        self.session = get_session('paystack')
         
         if not self.secret_key:
             raise ValueError("PAYSTACK_SECRET_KEY not found in environment variables")
@@ -59,7 +60,7 @@ class PaystackService:
                     'phone': payment.phone_number or payment.user.phone_number
                 }
             
-            response = requests.post(
+            response = self.session.post(
                 f'{self.base_url}/transaction/initialize',
                 headers=self._get_headers(),
                 json=payload
@@ -69,15 +70,12 @@ class PaystackService:
             
             if response.status_code == 200 and response_data.get('status'):
                 # Update payment with Paystack reference
-                payment.external_reference = response_data['data']['reference']
-                payment.status = 'processing'
                 payment.metadata.update({
                     'paystack_access_code': response_data['data']['access_code'],
                     'paystack_authorization_url': response_data['data']['authorization_url']
                 })
-                payment.save()
-                
-                payment.log('info', 'Payment initialized with Paystack', response_data)
+                transition(payment, 'processing', 'Payment initialized with Paystack', response_data,
+                           external_reference=response_data['data']['reference'], metadata=payment.metadata)
                 
                 return {
                     'success': True,
@@ -104,7 +102,7 @@ class PaystackService:
     def verify_payment(self, reference: str):
         """Verify a payment with Paystack"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f'{self.base_url}/transaction/verify/{reference}',
                 headers=self._get_headers()
             )
@@ -137,21 +135,25 @@ class PaystackService:
                 logger.warning("Invalid webhook signature")
                 return {'success': False, 'error': 'Invalid signature'}
             
-            event = payload.get('event')
-            data = payload.get('data', {})
-            
-            if event == 'charge.success':
-                return self._handle_successful_payment(data)
-            elif event == 'charge.failed':
-                return self._handle_failed_payment(data)
-            else:
-                logger.info(f"Unhandled webhook event: {event}")
-                return {'success': True, 'message': f'Event {event} received but not processed'}
+            return self.process_event(payload)
                 
         except Exception as e:
             logger.error(f"Error handling Paystack webhook: {str(e)}")
             return {'success': False, 'error': str(e)}
     
+    def process_event(self, payload: dict):
+        """Apply an already verified Paystack webhook event"""
+        event = payload.get('event')
+        data = payload.get('data', {})
+        
+        if event == 'charge.success':
+            return self._handle_successful_payment(data)
+        elif event == 'charge.failed':
+            return self._handle_failed_payment(data)
+        else:
+            logger.info(f"Unhandled webhook event: {event}")
+            return {'success': True, 'message': f'Event {event} received but not processed'}
+    
     def verify_webhook_signature(self, payload: dict, signature: str):
         """Verify Paystack webhook signature"""
         if not self.webhook_secret:
@@ -185,9 +187,6 @@ class PaystackService:
                 return {'success': False, 'error': 'Payment not found'}
             
             # Update payment status
-            payment.status = 'successful'
-            payment.processed_at = timezone.now()
-            payment.external_reference = data.get('id', payment.external_reference)
             payment.metadata.update({
                 'paystack_transaction_id': data.get('id'),
                 'paystack_gateway_response': data.get('gateway_response'),
@@ -195,14 +194,11 @@ class PaystackService:
                 'paystack_fees': data.get('fees'),
                 'paystack_authorization': data.get('authorization', {})
             })
-            payment.save()
-            
-            payment.log('info', 'Payment completed successfully via webhook', data)
-            
-            # Update booking status if applicable
-            if payment.booking:
-                payment.booking.payment_status = 'paid'
-                payment.booking.save()
+            # Booking confirmation follows through the outbox
+            transition(
+                payment, 'successful', 'Payment completed successfully via webhook', data,
+                external_reference=data.get('id', payment.external_reference), metadata=payment.metadata
+            )
             
             return {'success': True, 'message': 'Payment processed successfully'}
             
@@ -225,16 +221,12 @@ class PaystackService:
                 return {'success': False, 'error': 'Payment not found'}
             
             # Update payment status
-            payment.status = 'failed'
-            payment.processed_at = timezone.now()
             payment.metadata.update({
                 'paystack_transaction_id': data.get('id'),
                 'paystack_gateway_response': data.get('gateway_response'),
                 'paystack_failure_reason': data.get('gateway_response')
             })
-            payment.save()
-            
-            payment.log('error', 'Payment failed via webhook', data)
+            transition(payment, 'failed', 'Payment failed via webhook', data, level='error', metadata=payment.metadata)
             
             return {'success': True, 'message': 'Failed payment processed'}
             
@@ -257,7 +249,7 @@ class PaystackService:
                 payload['customer_note'] = reason
                 payload['merchant_note'] = reason
             
-            response = requests.post(
+            response = self.session.post(
                 f'{self.base_url}/refund',
                 headers=self._get_headers(),
                 json=payload
@@ -266,14 +258,12 @@ class PaystackService:
             response_data = response.json()
             
             if response.status_code == 200 and response_data.get('status'):
-                payment.status = 'refunded'
                 payment.metadata.update({
                     'refund_data': response_data['data'],
                     'refund_reason': reason
                 })
-                payment.save()
-                
-                payment.log('info', f'Payment refunded: {refund_amount}', response_data)
+                transition(payment, 'refunded', f'Payment refunded: {refund_amount}', response_data,
+                           metadata=payment.metadata)
                 
                 return {
                     'success': True,
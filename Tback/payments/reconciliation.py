@@ -0,0 +1,151 @@
+"""
+Concurrent reconciliation of in-flight payments against their providers.
+
+Provider calls are blocking (pooled ``requests`` sessions), so they run on a
+thread pool driven by asyncio, with a semaphore per provider bounding how
+many calls hit each provider at once. The ORM is only used from the calling
+thread: payments are loaded in keyset-ordered chunks and each chunk's
+results are written back with set-based updates (see ``sweeper``).
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from django.conf import settings
+from django.db import transaction
+from .models import Payment
+from .services import PaymentService
+from .sweeper import SWEEPABLE_STATUSES, apply_decisions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER_CONCURRENCY = {
+    'mtn_momo': 20,
+    'paystack': 10,
+}
+DEFAULT_CONCURRENCY = 5
+DEFAULT_CHUNK_SIZE = 500
+
+PAYSTACK_STATUS_MAPPING = {
+    'success': 'successful',
+    'failed': 'failed',
+    'reversed': 'refunded',
+}
+
+
+@dataclass
+class ReconciliationReport:
+    checked: int = 0
+    updated: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    by_provider: Counter = field(default_factory=Counter)
+    transitions: Counter = field(default_factory=Counter)
+    
+    @property
+    def throughput(self):
+        """Provider checks completed per second"""
+        return self.checked / self.elapsed if self.elapsed else 0.0
+
+
+class ProviderStatusChecker:
+    """Blocking, thread-safe status lookup for a single payment"""
+    
+    def __init__(self):
+        self.payment_service = PaymentService()
+        self._paystack = None
+    
+    def _paystack_service(self):
+        if self._paystack is None:
+            from .paystack_service import PaystackService
+            self._paystack = PaystackService()
+        return self._paystack
+    
+    def __call__(self, payment):
+        if payment.provider.code == 'paystack':
+            result = self._paystack_service().verify_payment(payment.reference)
+            if not result['success']:
+                return result
+            return {
+                'success': True,
+                'status': PAYSTACK_STATUS_MAPPING.get(result['data'].get('status'), payment.status)
+            }
+        return self.payment_service.check_payment_status(payment)
+
+
+def provider_concurrency(provider_code, overrides=None):
+    limits = {**DEFAULT_PROVIDER_CONCURRENCY, **getattr(settings, 'PAYMENT_RECONCILE_CONCURRENCY', {}), **(overrides or {})}
+    return limits.get(provider_code, DEFAULT_CONCURRENCY)
+
+
+async def check_payments(payments, check, executor, semaphores):
+    """Check a batch of payments concurrently, returning [(payment, result)]"""
+    loop = asyncio.get_running_loop()
+    
+    async def check_one(payment):
+        async with semaphores[payment.provider.code]:
+            try:
+                return payment, await loop.run_in_executor(executor, check, payment)
+            except Exception as e:
+                logger.error(f"Reconciliation check error for {payment.reference}: {str(e)}")
+                return payment, {'success': False, 'error': str(e)}
+    
+    return await asyncio.gather(*(check_one(payment) for payment in payments))
+
+
+def reconcile_payments(queryset=None, check=None, chunk_size=DEFAULT_CHUNK_SIZE, concurrency=None, on_chunk=None):
+    """
+    Reconcile every pending/processing payment in ``queryset``.
+    
+    Payments without a provider cannot be checked and are skipped.
+    
+    ``concurrency`` optionally overrides per-provider limits, e.g.
+    ``{'mtn_momo': 50}``. ``on_chunk(report)`` is called after each chunk.
+    """
+    payments = (queryset if queryset is not None else Payment.objects.all()).filter(
+        status__in=SWEEPABLE_STATUSES, provider__isnull=False
+    ).select_related('provider').order_by('id')
+    check = check or ProviderStatusChecker()
+    report = ReconciliationReport()
+    started = time.monotonic()
+    last_id = 0
+    
+    provider_codes = set(payments.values_list('provider__code', flat=True).distinct())
+    limits = {code: provider_concurrency(code, concurrency) for code in provider_codes}
+    
+    with ThreadPoolExecutor(max_workers=max(sum(limits.values()), 1), thread_name_prefix='reconcile') as executor:
+        while True:
+            chunk = list(payments.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].pk
+            
+            async def run_chunk():
+                # Semaphores must be created inside the running loop
+                semaphores = {code: asyncio.Semaphore(limits.get(code, DEFAULT_CONCURRENCY)) for code in {p.provider.code for p in chunk}}
+                return await check_payments(chunk, check, executor, semaphores)
+            
+            decisions = []
+            for payment, result in asyncio.run(run_chunk()):
+                report.checked += 1
+                report.by_provider[payment.provider.code] += 1
+                if not result.get('success'):
+                    report.errors += 1
+                    continue
+                new_status = result.get('status')
+                if new_status and new_status != payment.status:
+                    report.transitions[f'{payment.status} -> {new_status}'] += 1
+                    decisions.append((payment, new_status, f'Status updated from {payment.status} to {new_status} by reconciliation'))
+            
+            if decisions:
+                with transaction.atomic():
+                    report.updated += apply_decisions(decisions)
+            
+            report.elapsed = time.monotonic() - started
+            if on_chunk:
+                on_chunk(report)
+    
+    report.elapsed = time.monotonic() - started
+    return report
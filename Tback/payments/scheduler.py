@@ -0,0 +1,143 @@
+"""
+Durable, database-backed scheduler for delayed payment transitions.
+
+Timers are stored as ScheduledTransition rows indexed by ``due_at`` and
+executed by a single worker loop per process. Due rows are claimed in
+batches with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several processes can
+share the queue without double-processing, and only one batch is held in
+memory at a time. A job whose handler fails is kept and retried with
+exponential backoff, up to MAX_ATTEMPTS times. The worker starts with the
+first request a server process handles (see ``apps.py``), so overdue
+timers run after a restart without waiting for a new checkout.
+"""
+import logging
+import random
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from .log_buffer import buffered_payment_logs
+from .models import Payment, ScheduledTransition
+from .state import transition
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_POLL_INTERVAL = 5.0
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def schedule_transition(payment, delay_seconds=30, success_rate=0.9, action='auto_complete'):
+    """Persist a delayed transition for a payment and make sure a worker will run it"""
+    job = ScheduledTransition.objects.create(
+        payment=payment,
+        action=action,
+        due_at=timezone.now() + timedelta(seconds=delay_seconds),
+        success_rate=success_rate,
+        delay_seconds=delay_seconds
+    )
+    transaction.on_commit(_wakeup.set)
+    ensure_worker()
+    return job
+
+
+def _apply_auto_complete(job):
+    payment = job.payment
+    if payment.status not in ['pending', 'processing']:
+        logger.info(f"Payment {payment.reference} already processed, skipping auto-completion")
+        return
+    
+    if random.random() < job.success_rate:
+        if transition(payment, 'successful', f'Auto-completed successfully after {job.delay_seconds}s delay'):
+            logger.info(f"Auto-completed payment {payment.reference} successfully")
+    elif transition(payment, 'failed', f'Auto-failed after {job.delay_seconds}s delay'):
+        logger.info(f"Auto-failed payment {payment.reference}")
+
+
+ACTION_HANDLERS = {
+    'auto_complete': _apply_auto_complete,
+}
+
+
+def run_due_transitions(batch_size=DEFAULT_BATCH_SIZE):
+    """Claim and execute one batch of due transitions, returning how many were claimed"""
+    with transaction.atomic(), buffered_payment_logs():
+        jobs = list(
+            ScheduledTransition.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(due_at__lte=timezone.now())
+            .select_related('payment')
+            .order_by('due_at')[:batch_size]
+        )
+        if not jobs:
+            return 0
+        
+        done, retry = [], []
+        for job in jobs:
+            try:
+                with transaction.atomic():
+                    ACTION_HANDLERS[job.action](job)
+                done.append(job.pk)
+            except Exception as e:
+                job.attempts += 1
+                job.error = str(e)
+                if job.attempts >= MAX_ATTEMPTS:
+                    logger.error(f"Giving up {job.action} for {job.payment.reference} after {job.attempts} attempts: {job.error}")
+                    done.append(job.pk)
+                else:
+                    logger.warning(f"Error running {job.action} for {job.payment.reference}, will retry: {job.error}")
+                    job.due_at = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+                    retry.append(job)
+        
+        ScheduledTransition.objects.filter(pk__in=done).delete()
+        if retry:
+            ScheduledTransition.objects.bulk_update(retry, ['attempts', 'error', 'due_at'])
+    return len(jobs)
+
+
+def seconds_until_next_due(poll_interval=DEFAULT_POLL_INTERVAL):
+    """How long the worker may sleep before the next transition becomes due"""
+    next_due = ScheduledTransition.objects.order_by('due_at').values_list('due_at', flat=True).first()
+    if next_due is None:
+        return poll_interval
+    return max(0.0, min(poll_interval, (next_due - timezone.now()).total_seconds()))
+
+
+def run_worker(stop_event=None, batch_size=DEFAULT_BATCH_SIZE, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Process due transitions until ``stop_event`` is set"""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        close_old_connections()
+        try:
+            if run_due_transitions(batch_size) >= batch_size:
+                continue
+            timeout = seconds_until_next_due(poll_interval)
+        except Exception as e:
+            logger.error(f"Payment scheduler error: {str(e)}")
+            timeout = poll_interval
+        
+        _wakeup.wait(timeout)
+        _wakeup.clear()
+
+
+def ensure_worker():
+    """Start the in-process worker thread once, if autostart is enabled"""
+    global _worker
+    if not getattr(settings, 'PAYMENT_SCHEDULER_AUTOSTART', True):
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run_worker, name='payment-scheduler', daemon=True)
+            _worker.start()
+            logger.info("Started payment scheduler worker")
+
+
+def start_worker_on_request(sender, **kwargs):
+    """``request_started`` receiver that (re)starts the worker once a server process takes traffic"""
+    if _worker is None or not _worker.is_alive():
+        ensure_worker()
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from decimal import Decimal
-from .models import Payment, PaymentProvider, PaymentCallback
+from .models import Payment, PaymentProvider, PaymentCallback, ArchivedPayment
 
 User = get_user_model()
 
@@ -74,6 +74,20 @@ class PaymentListSerializer(serializers.ModelSerializer):
             'created_at', 'processed_at'
         ]
 
+class ArchivedPaymentSerializer(serializers.ModelSerializer):
+    """Summary of a payment that has been moved to the archive"""
+    user = serializers.StringRelatedField(read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    archived = serializers.BooleanField(default=True, read_only=True)
+    
+    class Meta:
+        model = ArchivedPayment
+        fields = [
+            'payment_id', 'reference', 'user', 'amount', 'currency', 'payment_method',
+            'status', 'status_display', 'description', 'created_at', 'processed_at',
+            'archived', 'archived_at'
+        ]
+
 class PaymentCallbackSerializer(serializers.ModelSerializer):
     """Serializer for payment callbacks"""
     
@@ -131,4 +145,17 @@ class CheckoutPaymentSerializer(serializers.Serializer):
                 'provider_code': f'Provider {provider_code} is not available'
             })
         
-        return attrs
\ No newline at end of file
+        return attrs
+
+class FeeQuoteItemSerializer(serializers.Serializer):
+    """One amount/method/currency combination to quote"""
+    amount = serializers.FloatField(min_value=0)
+    payment_method = serializers.CharField(max_length=20)
+    currency = serializers.CharField(max_length=3, default='GHS')
+    
+    def validate_currency(self, value):
+        return value.upper()
+
+class FeeQuoteRequestSerializer(serializers.Serializer):
+    """Batch of fee quotes requested by the checkout page"""
+    quotes = FeeQuoteItemSerializer(many=True, allow_empty=False, max_length=100)
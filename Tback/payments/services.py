@@ -5,6 +5,7 @@ from django.conf import settings
 from django.utils import timezone
 from .models import Payment, PaymentProvider, PaymentCallback
 from .mtn_momo_service import MTNMoMoService
+from .http import get_session, provider_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +13,8 @@ class PaymentService:
     """Service class for handling payment operations"""
     
     def __init__(self):
-        self.timeout = getattr(settings, 'PAYMENT_TIMEOUT', 30)
+        self.session = get_session('mpesa')
+        self.timeout = provider_timeout('mpesa')
     
     def initiate_payment(self, payment: Payment) -> Dict[str, Any]:
         """Initiate payment with the provider"""
@@ -133,7 +135,7 @@ class PaymentService:
         }
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 config.get('stk_push_url'),
                 json=payload,
                 headers=headers,
@@ -188,7 +190,7 @@ class PaymentService:
         }
         
         try:
-            response = requests.get(
+            response = self.session.get(
                 config.get('token_url'),
                 headers=headers,
                 timeout=self.timeout
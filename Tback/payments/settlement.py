@@ -0,0 +1,154 @@
+"""
+Daily settlement rollup of payments by provider, currency and status.
+
+Each payment counts towards one SettlementRollup row, keyed by the local day
+it was created, its provider code, currency and current status, with its
+amount in ``gross`` and its quoted processing fee in ``fees``. Creating a
+payment adds it to its row; every status transition moves it from the old
+status's row to the new one inside the transition's transaction (see
+``state.py``), with one UPDATE per affected row. Fees are quoted from the
+compiled fee schedules, so they cost no query.
+
+``rebuild_settlement_rollup`` recomputes a date range from the payment
+table and the archive index, e.g. after fee schedules change or to seed
+existing data. Archiving a payment leaves its rollup row untouched.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .fees import quote_fee
+from .models import Payment, PaymentProvider, ArchivedPayment, SettlementRollup
+
+_provider_codes = {}
+
+
+def provider_code(provider_id):
+    """Code for a provider id, from a small per-process map refreshed on misses"""
+    if provider_id is None:
+        return ''
+    if provider_id not in _provider_codes:
+        _provider_codes.update(PaymentProvider.objects.values_list('id', 'code'))
+    return _provider_codes.get(provider_id, '')
+
+
+def forget_provider_codes():
+    _provider_codes.clear()
+
+
+def settlement_key(created_at, provider_id, currency, status):
+    return (timezone.localdate(created_at), provider_code(provider_id), currency, status)
+
+
+def settlement_amounts(amount, payment_method, currency):
+    """(gross, fee) a payment adds to its rollup row"""
+    gross = Decimal(str(amount))
+    return gross, Decimal(str(quote_fee(float(gross), payment_method, currency)['fee']))
+
+
+def apply_deltas(deltas):
+    """Apply ``{key: [count, gross, fees]}`` deltas, one UPDATE per rollup row"""
+    now = timezone.now()
+    for (day, code, currency, status), (count, gross, fees) in deltas.items():
+        if not count and not gross and not fees:
+            continue
+        rows = SettlementRollup.objects.filter(day=day, provider_code=code, currency=currency, status=status)
+        changes = {
+            'count': F('count') + count,
+            'gross': F('gross') + gross,
+            'fees': F('fees') + fees,
+            'updated_at': now
+        }
+        if not rows.update(**changes):
+            SettlementRollup.objects.bulk_create(
+                [SettlementRollup(day=day, provider_code=code, currency=currency, status=status)],
+                ignore_conflicts=True
+            )
+            rows.update(**changes)
+
+
+def _add(deltas, key, sign, gross, fee):
+    delta = deltas.setdefault(key, [0, Decimal('0'), Decimal('0')])
+    delta[0] += sign
+    delta[1] += sign * gross
+    delta[2] += sign * fee
+
+
+def record_created(payment):
+    """Count a newly inserted payment"""
+    gross, fee = settlement_amounts(payment.amount, payment.payment_method, payment.currency)
+    deltas = {}
+    _add(deltas, settlement_key(payment.created_at, payment.provider_id, payment.currency, payment.status), 1, gross, fee)
+    apply_deltas(deltas)
+
+
+def record_transitions(moves):
+    """Move payments between rollup rows for ``[(payment, old_status)]`` that now have ``payment.status``"""
+    deltas = {}
+    for payment, old_status in moves:
+        gross, fee = settlement_amounts(payment.amount, payment.payment_method, payment.currency)
+        _add(deltas, settlement_key(payment.created_at, payment.provider_id, payment.currency, old_status), -1, gross, fee)
+        _add(deltas, settlement_key(payment.created_at, payment.provider_id, payment.currency, payment.status), 1, gross, fee)
+    apply_deltas(deltas)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rebuild_settlement_rollup(date_from=None, date_to=None):
+    """
+    Recompute rollup rows for the inclusive day range (all days by default).
+
+    Live and archived payments are streamed with only the needed columns,
+    so memory use is bounded by the number of rollup rows rather than
+    payments. Returns the number of rows written.
+    """
+    payments = Payment.objects.order_by()
+    archived = ArchivedPayment.objects.order_by()
+    rollups = SettlementRollup.objects.all()
+    if date_from:
+        payments = payments.filter(created_at__gte=_day_start(date_from))
+        archived = archived.filter(created_at__gte=_day_start(date_from))
+        rollups = rollups.filter(day__gte=date_from)
+    if date_to:
+        payments = payments.filter(created_at__lt=_day_start(date_to) + timedelta(days=1))
+        archived = archived.filter(created_at__lt=_day_start(date_to) + timedelta(days=1))
+        rollups = rollups.filter(day__lte=date_to)
+
+    forget_provider_codes()
+    totals = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+    columns = ('created_at', 'currency', 'status', 'amount', 'payment_method')
+    sources = [
+        ((provider_code(provider_id), *row) for provider_id, *row in payments.values_list('provider_id', *columns).iterator(chunk_size=2000)),
+        archived.values_list('provider_code', *columns).iterator(chunk_size=2000),
+    ]
+    for source in sources:
+        for code, created_at, currency, status, amount, payment_method in source:
+            gross, fee = settlement_amounts(amount, payment_method, currency)
+            total = totals[(timezone.localdate(created_at), code, currency, status)]
+            total[0] += 1
+            total[1] += gross
+            total[2] += fee
+
+    rows = [
+        SettlementRollup(day=day, provider_code=code, currency=currency, status=status, count=count, gross=gross, fees=fees)
+        for (day, code, currency, status), (count, gross, fees) in totals.items()
+    ]
+    with transaction.atomic():
+        rollups.delete()
+        SettlementRollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def settlement_summary(date_from, date_to=None, statuses=('successful',)):
+    """Totals per (provider, currency) over a day range, read from the rollup"""
+    rows = SettlementRollup.objects.filter(day__gte=date_from, status__in=statuses)
+    if date_to:
+        rows = rows.filter(day__lte=date_to)
+    return list(
+        rows.order_by('provider_code', 'currency').values('provider_code', 'currency')
+        .annotate(count=Sum('count'), gross=Sum('gross'), fees=Sum('fees'))
+    )
@@ -0,0 +1,151 @@
+"""
+Payment status state machine with optimistic concurrency.
+
+Every status change goes through ``transition()`` (or ``bulk_transition()``
+for many rows). Moves are checked against ALLOWED_TRANSITIONS and written
+with a compare-and-swap UPDATE (``WHERE id = ? AND version = ?``) that
+touches only ``status``, ``processed_at``, ``version`` and ``updated_at``,
+plus any fields passed explicitly. No row lock is taken: if another writer
+got there first, the payment's state is re-read and the transition retried
+from the new state only if it is still allowed, so concurrent webhooks,
+status polls, workers and admin actions cannot overwrite each other.
+
+``Payment.save()`` leaves the state fields alone on updates, so a stale
+instance saved for some other reason cannot undo a transition either.
+Because transitions are UPDATEs, ``post_save`` does not fire for them;
+listen to ``payment_status_changed`` instead. The UPDATE, the signal, the
+transition's outbox event (see ``outbox.py``) and its settlement rollup
+update (see ``settlement.py``) share one transaction.
+"""
+import logging
+from django.db import transaction
+from django.db.models import F, Q
+from django.dispatch import Signal
+from django.utils import timezone
+from .models import Payment
+from .outbox import enqueue_for_transition
+from .settlement import record_transitions
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_TRANSITIONS = {
+    'pending': {'processing', 'successful', 'failed', 'cancelled'},
+    'processing': {'successful', 'failed', 'cancelled'},
+    'successful': {'refunded'},
+    'failed': set(),
+    'cancelled': set(),
+    'refunded': set(),
+}
+# Statuses that stamp processed_at when entered
+PROCESSED_STATUSES = {'successful', 'failed', 'cancelled'}
+MAX_ATTEMPTS = 3
+# Rows per bulk_transition UPDATE; each row adds an OR term and SQLite rejects very large expression trees
+BULK_TRANSITION_BATCH_SIZE = 200
+
+# Sent inside the transaction that wrote a transition, with ``payment``, ``old_status`` and ``new_status``
+payment_status_changed = Signal()
+
+
+def can_transition(old_status, new_status):
+    return new_status in ALLOWED_TRANSITIONS.get(old_status, ())
+
+
+def _changes(new_status, now, fields):
+    changes = {'status': new_status, 'version': F('version') + 1, 'updated_at': now, **fields}
+    if new_status in PROCESSED_STATUSES:
+        changes['processed_at'] = now
+    return changes
+
+
+def _applied(payment, old_status, new_status, now, fields):
+    payment.status = new_status
+    payment.version += 1
+    payment.updated_at = now
+    if new_status in PROCESSED_STATUSES:
+        payment.processed_at = now
+    for name, value in fields.items():
+        setattr(payment, name, value)
+    payment_status_changed.send(sender=Payment, payment=payment, old_status=old_status, new_status=new_status)
+
+
+def transition(payment, new_status, message=None, data=None, level='info', force=False, **fields):
+    """
+    Move ``payment`` to ``new_status``, returning True if this call made the change.
+
+    ``message`` is logged against the payment when the transition happens.
+    Extra keyword arguments are model fields written by the same UPDATE
+    (e.g. ``external_reference``). ``force`` skips the transition rules for
+    manual/demo overrides, but the write is still version-checked.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        old_status = payment.status
+        if old_status == new_status or not (force or can_transition(old_status, new_status)):
+            return False
+
+        now = timezone.now()
+        with transaction.atomic(savepoint=False):
+            updated = Payment.objects.filter(pk=payment.pk, version=payment.version).update(
+                **_changes(new_status, now, fields)
+            )
+            if updated:
+                _applied(payment, old_status, new_status, now, fields)
+                enqueue_for_transition([payment], new_status)
+                record_transitions([(payment, old_status)])
+        if updated:
+            if message:
+                payment.log(level, message, data)
+            return True
+
+        # Someone else changed the payment first; re-check from their result
+        payment.refresh_from_db(fields=['status', 'processed_at', 'version', 'updated_at'])
+
+    logger.warning(f"Gave up moving payment {payment.reference} to {new_status} after {MAX_ATTEMPTS} conflicts")
+    return False
+
+
+def _loaded_versions(payments, bump=0):
+    """Matches each payment's row at the version it was loaded with (plus ``bump``)"""
+    condition = Q()
+    for payment in payments:
+        condition |= Q(pk=payment.pk, version=payment.version + bump)
+    return condition
+
+
+def bulk_transition(payments, new_status, force=False):
+    """
+    Move many payments to ``new_status``, returning those that changed.
+
+    Rows are written with one UPDATE per BULK_TRANSITION_BATCH_SIZE payments.
+    The UPDATE matches each row on the version it was loaded with, so rows
+    changed by a concurrent writer since then are left alone (not retried)
+    and every payment returned moved from the status it was loaded with.
+    """
+    payments = [
+        payment for payment in payments
+        if payment.status != new_status and (force or can_transition(payment.status, new_status))
+    ]
+    if not payments:
+        return []
+
+    now = timezone.now()
+    with transaction.atomic(savepoint=False):
+        changed = []
+        for start in range(0, len(payments), BULK_TRANSITION_BATCH_SIZE):
+            batch = payments[start:start + BULK_TRANSITION_BATCH_SIZE]
+            updated = Payment.objects.filter(_loaded_versions(batch)).update(**_changes(new_status, now, {}))
+            if updated != len(batch):
+                # Some rows had changed since they were loaded; find the ones this statement wrote
+                written = set(
+                    Payment.objects.filter(_loaded_versions(batch, bump=1), status=new_status, updated_at=now)
+                    .values_list('pk', flat=True)
+                )
+                batch = [payment for payment in batch if payment.pk in written]
+            changed.extend(batch)
+        payments = changed
+
+        moves = [(payment, payment.status) for payment in payments]
+        for payment, old_status in moves:
+            _applied(payment, old_status, new_status, now, {})
+        enqueue_for_transition(payments, new_status)
+        record_transitions(moves)
+    return payments
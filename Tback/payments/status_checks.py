@@ -0,0 +1,92 @@
+"""
+Coalescing layer in front of provider status checks.
+
+Concurrent checks for the same payment share a single in-flight provider
+call (single-flight), successful results are cached for a short
+provider-specific TTL, and upstream calls for a reference are rate-limited
+through an atomic ``cache.add``. The cached results and the rate limit are
+only shared between processes when the cache is (REDIS_URL); with the
+default per-process LocMem cache each process limits itself.
+"""
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from .services import PaymentService
+
+# Seconds a successful provider answer is reused, per provider code
+DEFAULT_STATUS_CHECK_TTL = {
+    'mtn_momo': 5,
+    'paystack': 10,
+}
+DEFAULT_TTL = 5
+MIN_CHECK_INTERVAL = 2  # seconds between upstream calls for one reference
+INFLIGHT_WAIT_TIMEOUT = 30  # seconds a follower waits for the leader
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class _InflightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+def _ttl_for(provider_code):
+    ttls = getattr(settings, 'PAYMENT_STATUS_CHECK_TTL', DEFAULT_STATUS_CHECK_TTL)
+    return ttls.get(provider_code, DEFAULT_TTL)
+
+
+def coalesced_status_check(provider_code, reference, fetch):
+    """
+    Return ``fetch()``'s result for a payment, sharing and caching it.
+    
+    ``fetch`` must return the usual ``{'success': ..., ...}`` dict. Only
+    successful results are cached. When the reference was checked upstream
+    too recently the result is ``{'success': False, 'rate_limited': True}``.
+    """
+    key = f'payment_status_check:{provider_code}:{reference}'
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    
+    with _inflight_lock:
+        call = _inflight.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _inflight[key] = _InflightCall()
+    
+    if not is_leader:
+        call.done.wait(INFLIGHT_WAIT_TIMEOUT)
+        if call.result is not None:
+            return call.result
+        return {'success': False, 'message': 'Status check in progress', 'error': 'Status check in progress'}
+    
+    try:
+        if not cache.add(f'{key}:recent', True, timeout=MIN_CHECK_INTERVAL):
+            result = {
+                'success': False,
+                'rate_limited': True,
+                'message': 'Status checked recently, please retry shortly',
+                'error': 'Status checked recently, please retry shortly'
+            }
+        else:
+            result = fetch()
+            if result.get('success'):
+                cache.set(key, result, _ttl_for(provider_code))
+        call.result = result
+        return result
+    finally:
+        call.done.set()
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def check_payment_status(payment, payment_service=None):
+    """Coalesced PaymentService.check_payment_status for a payment"""
+    service = payment_service or PaymentService()
+    return coalesced_status_check(
+        payment.provider.code,
+        payment.reference,
+        lambda: service.check_payment_status(payment)
+    )
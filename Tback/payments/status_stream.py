@@ -0,0 +1,99 @@
+"""
+In-process fan-out of payment status changes to waiting clients.
+
+Every process keeps one watcher thread. While at least one client is waiting,
+it reads the status of all watched references with a single query per tick
+and wakes the waiters whose payment changed. Saves made in this process wake
+waiters immediately through the payment_status_changed signal, so confirmation is
+sub-second either way while the database sees one cheap query per tick no
+matter how many clients are connected.
+"""
+import logging
+import threading
+import time
+from django.db import close_old_connections, connection, transaction
+from django.dispatch import receiver
+from .models import Payment
+from .state import payment_status_changed
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ['successful', 'failed', 'cancelled', 'refunded']
+WATCH_POLL_INTERVAL = 0.5  # seconds
+
+
+class PaymentStatusWatcher:
+    """Lets request threads block until a payment's status changes"""
+    
+    def __init__(self, poll_interval=WATCH_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._watches = {}  # reference -> {'status', 'version', 'waiters'}
+        self._thread = None
+    
+    def notify(self, reference, status):
+        """Record the latest status for a reference, waking waiters if it changed"""
+        with self._condition:
+            watch = self._watches.get(reference)
+            if watch is not None and watch['status'] != status:
+                watch['status'] = status
+                watch['version'] += 1
+                self._condition.notify_all()
+    
+    def wait_for_change(self, reference, known_status, timeout):
+        """
+        Block until the payment leaves ``known_status`` or ``timeout`` elapses.
+        
+        Returns the new status, or None on timeout.
+        """
+        with self._condition:
+            watch = self._watches.setdefault(reference, {'status': known_status, 'version': 0, 'waiters': 0})
+            watch['waiters'] += 1
+            self._ensure_thread()
+            try:
+                if watch['status'] != known_status:
+                    return watch['status']
+                version = watch['version']
+                changed = self._condition.wait_for(lambda: watch['version'] != version, timeout)
+                return watch['status'] if changed else None
+            finally:
+                watch['waiters'] -= 1
+                if not watch['waiters']:
+                    del self._watches[reference]
+    
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='payment-status-watcher', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                references = list(self._watches)
+            if not references:
+                with self._condition:
+                    # Exit once idle; the next waiter starts a fresh thread
+                    if not self._watches:
+                        self._thread = None
+                        connection.close()
+                        return
+                continue
+            
+            try:
+                close_old_connections()
+                rows = Payment.objects.filter(reference__in=references).values_list('reference', 'status')
+                for reference, status in rows:
+                    self.notify(reference, status)
+            except Exception as e:
+                logger.error(f"Payment status watcher error: {str(e)}")
+            
+            time.sleep(self.poll_interval)
+
+
+watcher = PaymentStatusWatcher()
+
+
+@receiver(payment_status_changed, sender=Payment)
+def publish_payment_status(sender, payment, new_status, **kwargs):
+    reference, status = payment.reference, new_status
+    transaction.on_commit(lambda: watcher.notify(reference, status))
@@ -0,0 +1,91 @@
+"""
+Shared engine for sweeping stale pending/processing payments.
+
+Rows are read in keyset-ordered chunks and ``decide()`` (which may call a
+payment provider) runs outside any transaction, so no database lock is held
+during network calls. Each chunk's decisions are then applied in one short
+transaction with one ``bulk_transition`` UPDATE per target status and a
+single bulk insert of PaymentLog rows. ``bulk_transition`` re-checks each
+row as it writes, so a payment moved by someone else while its decision was
+being made is not overwritten.
+
+Rows are not claimed or locked while they are swept. Several sweepers split
+the table statically with ``worker_index``/``worker_count`` (``id % count``);
+each process must be started with its own index; two processes given the
+same index decide the same payments, and only the first write of each
+payment wins.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F
+from .log_buffer import buffered_payment_logs
+from .models import Payment
+from .state import bulk_transition
+
+SWEEPABLE_STATUSES = ['pending', 'processing']
+DEFAULT_CHUNK_SIZE = 500
+
+
+def stale_payments(cutoff=None, worker_index=0, worker_count=1, queryset=None):
+    """Payments eligible for sweeping, restricted to this worker's partition"""
+    payments = (queryset if queryset is not None else Payment.objects.all()).filter(
+        status__in=SWEEPABLE_STATUSES
+    )
+    if cutoff is not None:
+        payments = payments.filter(created_at__lt=cutoff)
+    if worker_count > 1:
+        payments = payments.annotate(sweep_bucket=F('id') % worker_count).filter(sweep_bucket=worker_index)
+    return payments
+
+
+def apply_decisions(decisions):
+    """
+    Apply (payment, new_status, message) decisions with set-based writes.
+
+    Returns the number of payments whose status was actually changed.
+    """
+    by_status = defaultdict(list)
+    for payment, new_status, message in decisions:
+        by_status[new_status].append(payment)
+    
+    changed = set()
+    with transaction.atomic(), buffered_payment_logs():
+        for new_status, payments in by_status.items():
+            changed.update(payment.pk for payment in bulk_transition(payments, new_status))
+        
+        for payment, new_status, message in decisions:
+            if payment.pk in changed:
+                payment.log('info', message)
+    return len(changed)
+
+
+def sweep_payments(decide, cutoff=None, chunk_size=DEFAULT_CHUNK_SIZE, worker_index=0,
+                   worker_count=1, queryset=None, dry_run=False):
+    """
+    Sweep stale payments chunk by chunk.
+
+    ``decide(payment)`` returns ``(new_status, log_message)`` or ``None`` to
+    leave the payment alone. Yields ``(decisions, applied)`` for each chunk,
+    where ``applied`` is the number of payments actually changed (the number
+    of decisions when ``dry_run`` is set).
+    """
+    payments = stale_payments(cutoff, worker_index, worker_count, queryset).order_by('id')
+    last_id = 0
+    
+    while True:
+        chunk = list(payments.filter(id__gt=last_id).select_related('provider', 'user')[:chunk_size])
+        if not chunk:
+            return
+        
+        decisions = []
+        for payment in chunk:
+            decision = decide(payment)
+            if decision:
+                decisions.append((payment, *decision))
+        
+        applied = len(decisions)
+        if decisions and not dry_run:
+            applied = apply_decisions(decisions)
+        
+        last_id = chunk[-1].pk
+        yield decisions, applied
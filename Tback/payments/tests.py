@@ -1,12 +1,47 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command, CommandError
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import csv
+import os
+import tempfile
+import json
+import threading
+import time
+import uuid
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from unittest.mock import patch, MagicMock
-from .models import Payment, PaymentProvider, PaymentCallback
+from .models import (
+    Payment, PaymentProvider, PaymentCallback, PaymentLog, ScheduledTransition, WebhookEvent, IdempotencyKey,
+    BackfillCheckpoint, FeeSchedule, FeeTier, ArchivedPayment, OutboxEvent, SettlementRollup
+)
+from .scheduler import schedule_transition, run_due_transitions
+from .sweeper import sweep_payments
+from .status_stream import PaymentStatusWatcher
+from .status_checks import coalesced_status_check
+from .mtn_momo_service import MTNTokenManager
+from .http import get_session, close_sessions
+from .reconciliation import reconcile_payments
+from .webhooks import process_webhook_events
+from .log_buffer import buffered_payment_logs
+from .backfill import backfill_booking_details
+from .archive import archive_payments, load_archived_record
+from .state import transition, bulk_transition, payment_status_changed
+from .outbox import process_outbox_events
+from .exports import export_lines
+from .settlement import rebuild_settlement_rollup, settlement_summary
 from .services import PaymentService
-from .utils import generate_payment_reference, format_phone_number
+from .utils import generate_payment_reference, format_phone_number, calculate_payment_fees
+from tback_api.references import ReferenceGenerator
 
 User = get_user_model()
 
@@ -234,7 +269,29 @@ class PaymentUtilsTest(TestCase):
         reference = generate_payment_reference()
         
         self.assertTrue(reference.startswith('PAY-'))
-        self.assertEqual(len(reference), 25)  # PAY- + 14 digits + - + 6 chars
+        self.assertEqual(len(reference), 42)  # PAY- + 14 digits + - + 6 chars + - + 16 random chars
+    
+    def test_references_are_not_predictable_from_time_and_node(self):
+        generator = ReferenceGenerator(node_id=7, clock=lambda: 1760000000000)
+        first, second = generator.payment_reference(), generator.payment_reference()
+        
+        # Consecutive references share the time prefix but not the random tail
+        self.assertEqual(first[:18], second[:18])
+        self.assertNotEqual(first[-16:], second[-16:])
+    
+    def test_references_are_unique_and_time_ordered(self):
+        # A clock stuck on one millisecond (then stepping back) exercises sequence exhaustion
+        ticks = iter([1760000000000] * 1500 + [1759999999000] + list(range(1760000000001, 1760000001000)))
+        generator = ReferenceGenerator(node_id=7, clock=lambda: next(ticks))
+        
+        references = [generator.payment_reference() for _ in range(1200)]
+        bookings = [generator.booking_reference() for _ in range(300)]
+        
+        self.assertEqual(len(set(references)), len(references))
+        self.assertEqual(references, sorted(references))
+        self.assertTrue(all(len(reference) == 42 for reference in references))
+        self.assertEqual(bookings, sorted(bookings))
+        self.assertTrue(all(len(booking) == 20 and booking.startswith('TN') for booking in bookings))
     
     def test_format_phone_number(self):
         # Test with leading zero
@@ -247,4 +304,1187 @@ class PaymentUtilsTest(TestCase):
         
         # Test without country code
         result = format_phone_number('254700000000')
-        self.assertEqual(result, '+254700000000')
\ No newline at end of file
+        self.assertEqual(result, '+254700000000')
+
+
+@override_settings(PAYMENT_SCHEDULER_AUTOSTART=False)
+class ScheduledTransitionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='scheduler',
+            email='scheduler@example.com',
+            password='testpass123'
+        )
+        self.provider = PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+    
+    def _create_payment(self, reference):
+        return Payment.objects.create(
+            reference=reference,
+            user=self.user,
+            amount=100.00,
+            currency='GHS',
+            payment_method='mobile_money',
+            provider=self.provider,
+            status='processing'
+        )
+    
+    def test_only_due_transitions_are_run(self):
+        due = self._create_payment('PAY-DUE')
+        later = self._create_payment('PAY-LATER')
+        schedule_transition(due, delay_seconds=0, success_rate=1.0)
+        schedule_transition(later, delay_seconds=3600, success_rate=1.0)
+        
+        self.assertEqual(run_due_transitions(), 1)
+        
+        due.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual(due.status, 'successful')
+        self.assertEqual(later.status, 'processing')
+        self.assertEqual(ScheduledTransition.objects.count(), 1)
+    
+    def test_batches_are_bounded(self):
+        for i in range(5):
+            schedule_transition(self._create_payment(f'PAY-BATCH-{i}'), delay_seconds=0, success_rate=0.0)
+        
+        self.assertEqual(run_due_transitions(batch_size=2), 2)
+        self.assertEqual(run_due_transitions(batch_size=2), 2)
+        self.assertEqual(run_due_transitions(batch_size=2), 1)
+        self.assertEqual(run_due_transitions(batch_size=2), 0)
+        self.assertEqual(Payment.objects.filter(status='failed').count(), 5)
+    
+    def test_finished_payment_is_left_alone(self):
+        payment = self._create_payment('PAY-DONE')
+        schedule_transition(payment, delay_seconds=0, success_rate=0.0)
+        Payment.objects.filter(pk=payment.pk).update(status='successful')
+        
+        run_due_transitions()
+        
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'successful')
+    
+    def test_failed_jobs_are_retried_with_backoff(self):
+        job = schedule_transition(self._create_payment('PAY-RETRY'), delay_seconds=0, success_rate=1.0)
+        
+        with patch.dict('payments.scheduler.ACTION_HANDLERS', {'auto_complete': MagicMock(side_effect=RuntimeError('boom'))}):
+            self.assertEqual(run_due_transitions(), 1)
+        
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.error), (1, 'boom'))
+        self.assertGreater(job.due_at, timezone.now())
+        self.assertEqual(run_due_transitions(), 0)
+    
+    def test_worker_starts_with_server_requests_only(self):
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.core.signals import request_started
+        
+        with patch('payments.scheduler.ensure_worker') as ensure_worker:
+            self.client.get('/api/health/')
+            ensure_worker.assert_not_called()
+            request_started.send(sender=WSGIHandler, environ={})
+            ensure_worker.assert_called_once()
+
+
+class PaymentSweeperTest(TestCase):
+    def setUp(self):
+        self.provider = PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+        for i in range(7):
+            Payment.objects.create(
+                reference=f'PAY-STUCK-{i}',
+                amount=50.00,
+                currency='GHS',
+                payment_method='mobile_money',
+                provider=self.provider,
+                status='processing'
+            )
+        Payment.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        rebuild_settlement_rollup()
+    
+    def test_sweep_uses_set_based_writes_per_chunk(self):
+        depths = []
+        
+        def decide(payment):
+            depths.append(len(connection.atomic_blocks))
+            return 'failed', 'Swept'
+        
+        chunks = sweep_payments(decide, cutoff=timezone.now(), chunk_size=3)
+        
+        # Read + one UPDATE + one bulk log insert (+ savepoint bookkeeping),
+        # plus one rollup UPDATE for the old status and an upsert for the new one
+        with self.assertNumQueries(11):
+            first, applied = next(chunks)
+        self.assertEqual((len(first), applied), (3, 3))
+        self.assertEqual(sum(applied for _, applied in chunks), 4)
+        self.assertEqual(Payment.objects.filter(status='failed').count(), 7)
+        self.assertEqual(PaymentLog.objects.filter(message='Swept').count(), 7)
+        # Decisions (provider calls) are made outside the sweeper's transactions
+        self.assertEqual(set(depths), {len(connection.atomic_blocks)})
+    
+    def test_workers_partition_the_table(self):
+        decide = lambda payment: ('successful', 'Swept')
+        swept = []
+        for worker_index in range(2):
+            for decisions, _ in sweep_payments(decide, chunk_size=2, worker_index=worker_index, worker_count=2):
+                swept.extend(payment.pk for payment, _, _ in decisions)
+        
+        self.assertEqual(sorted(swept), sorted(Payment.objects.values_list('pk', flat=True)))
+    
+    def test_counts_only_payments_actually_changed(self):
+        moved = Payment.objects.order_by('id').first()
+        
+        def decide(payment):
+            if payment.pk == moved.pk:
+                # Someone else completes this payment while the sweeper decides
+                transition(Payment.objects.get(pk=payment.pk), 'successful')
+            return 'failed', 'Swept'
+        
+        results = list(sweep_payments(decide, chunk_size=10))
+        self.assertEqual([(len(decisions), applied) for decisions, applied in results], [(7, 6)])
+        self.assertEqual(Payment.objects.get(pk=moved.pk).status, 'successful')
+        
+        out = StringIO()
+        Payment.objects.filter(pk=moved.pk).update(status='processing')
+        call_command('complete_stuck_payments', minutes=5, status='failed', stdout=out)
+        self.assertIn('Completed 1 stuck payment(s)', out.getvalue())
+    
+    def test_complete_stuck_payments_command(self):
+        call_command('complete_stuck_payments', minutes=5, status='failed', stdout=StringIO())
+        self.assertFalse(Payment.objects.filter(status='processing').exists())
+        self.assertTrue(Payment.objects.exclude(processed_at=None).exists())
+
+
+class PaymentStatusStreamTest(TestCase):
+    def setUp(self):
+        self.provider = PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+        self.payment = Payment.objects.create(
+            reference='PAY-STREAM',
+            amount=75.00,
+            currency='GHS',
+            payment_method='mobile_money',
+            provider=self.provider,
+            status='successful'
+        )
+    
+    def test_stream_sends_current_status_and_closes_when_final(self):
+        url = reverse('payments:payment-status-stream', kwargs={'reference': 'PAY-STREAM'})
+        response = self.client.get(url)
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        event = [line for line in body.splitlines() if line.startswith('data: ')]
+        self.assertEqual(len(event), 1)
+        self.assertEqual(json.loads(event[0][len('data: '):])['status'], 'successful')
+    
+    def test_long_poll_returns_immediately_when_status_already_moved(self):
+        url = reverse('payments:payment-status-stream', kwargs={'reference': 'PAY-STREAM'})
+        response = self.client.get(url, {'wait': 25, 'since': 'processing'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'successful')
+    
+    def test_unknown_reference_returns_404(self):
+        url = reverse('payments:payment-status-stream', kwargs={'reference': 'PAY-MISSING'})
+        self.assertEqual(self.client.get(url, {'wait': 1}).status_code, 404)
+    
+    def test_watcher_wakes_waiters_on_change(self):
+        watcher = PaymentStatusWatcher(poll_interval=60)
+        watcher._ensure_thread = lambda: None
+        threading.Timer(0.05, watcher.notify, args=('PAY-X', 'successful')).start()
+        
+        self.assertEqual(watcher.wait_for_change('PAY-X', 'processing', timeout=5), 'successful')
+        self.assertIsNone(watcher.wait_for_change('PAY-X', 'processing', timeout=0.05))
+
+
+class CoalescedStatusCheckTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+    
+    def _fetch(self, result, delay=0):
+        def fetch():
+            self.calls += 1
+            time.sleep(delay)
+            return result
+        return fetch
+    
+    def test_concurrent_checks_share_one_provider_call(self):
+        fetch = self._fetch({'success': True, 'status': 'successful'}, delay=0.2)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(coalesced_status_check('mtn_momo', 'PAY-SF', fetch)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([result['status'] for result in results], ['successful'] * 5)
+    
+    def test_successful_results_are_cached(self):
+        fetch = self._fetch({'success': True, 'status': 'processing'})
+        coalesced_status_check('mtn_momo', 'PAY-CACHE', fetch)
+        coalesced_status_check('mtn_momo', 'PAY-CACHE', fetch)
+        self.assertEqual(self.calls, 1)
+    
+    def test_failed_checks_are_rate_limited(self):
+        fetch = self._fetch({'success': False, 'message': 'Provider unavailable'})
+        self.assertFalse(coalesced_status_check('paystack', 'PAY-RL', fetch).get('rate_limited'))
+        self.assertTrue(coalesced_status_check('paystack', 'PAY-RL', fetch)['rate_limited'])
+        self.assertEqual(self.calls, 1)
+
+
+class MTNTokenManagerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+    
+    def _fetch(self, expires_in=3600):
+        def fetch():
+            self.calls += 1
+            return {'success': True, 'access_token': f'token-{self.calls}', 'expires_in': expires_in}
+        return fetch
+    
+    def test_token_is_reused_until_near_expiry(self):
+        manager = MTNTokenManager()
+        fetch = self._fetch()
+        self.assertEqual(manager.get_token('sandbox:user', fetch)['access_token'], 'token-1')
+        self.assertEqual(manager.get_token('sandbox:user', fetch)['access_token'], 'token-1')
+        self.assertEqual(self.calls, 1)
+    
+    def test_token_is_shared_through_the_cache(self):
+        fetch = self._fetch()
+        MTNTokenManager().get_token('sandbox:user', fetch)
+        self.assertEqual(MTNTokenManager().get_token('sandbox:user', fetch)['access_token'], 'token-1')
+        self.assertEqual(self.calls, 1)
+    
+    def test_refresh_ahead_runs_once_in_background(self):
+        manager = MTNTokenManager()
+        fetch = self._fetch()
+        manager.get_token('sandbox:user', fetch)
+        
+        # Move the token into its refresh-ahead window
+        entry = dict(manager._tokens['sandbox:user'], refresh_at=time.time() - 1)
+        manager._tokens['sandbox:user'] = entry
+        cache.set('mtn_momo_token:sandbox:user', entry)
+        
+        # The still-valid token keeps being served while a single refresh runs
+        for _ in range(5):
+            self.assertIn(manager.get_token('sandbox:user', fetch)['access_token'], ['token-1', 'token-2'])
+        deadline = time.time() + 5
+        while 'sandbox:user' in manager._refreshing and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(manager.get_token('sandbox:user', fetch)['access_token'], 'token-2')
+    
+    def test_callers_do_not_wait_for_a_background_refresh(self):
+        manager = MTNTokenManager()
+        manager.get_token('sandbox:user', self._fetch())
+        entry = dict(manager._tokens['sandbox:user'], refresh_at=time.time() - 1)
+        manager._tokens['sandbox:user'] = entry
+        cache.set('mtn_momo_token:sandbox:user', entry)
+        
+        started, release = threading.Event(), threading.Event()
+        
+        def slow_fetch():
+            started.set()
+            release.wait(5)
+            return self._fetch()()
+        
+        self.addCleanup(release.set)
+        manager.get_token('sandbox:user', slow_fetch)
+        self.assertTrue(started.wait(5))
+        
+        # While the fetch is blocked, callers are served the current token at once
+        began = time.monotonic()
+        for _ in range(3):
+            self.assertEqual(manager.get_token('sandbox:user', slow_fetch)['access_token'], 'token-1')
+        self.assertLess(time.monotonic() - began, 1)
+        release.set()
+    
+    def test_failed_requests_are_not_cached(self):
+        manager = MTNTokenManager()
+        manager.get_token('sandbox:user', lambda: {'success': False, 'error': 'Token request failed: 500'})
+        self.assertEqual(manager.get_token('sandbox:user', self._fetch())['access_token'], 'token-1')
+
+
+class ProviderSessionTest(TestCase):
+    def tearDown(self):
+        close_sessions()
+    
+    def test_sessions_are_shared_per_provider(self):
+        self.assertIs(get_session('mtn_momo'), get_session('mtn_momo'))
+        self.assertIsNot(get_session('mtn_momo'), get_session('paystack'))
+    
+    @override_settings(PAYMENT_HTTP_CONFIG={'paystack': {'read_timeout': 12, 'pool_maxsize': 5}})
+    def test_session_applies_timeouts_and_only_retries_idempotent_calls(self):
+        session = get_session('paystack')
+        adapter = session.get_adapter('https://api.paystack.co')
+        
+        self.assertEqual(session.timeout, (3.05, 12))
+        self.assertEqual(adapter._pool_maxsize, 5)
+        self.assertIn('GET', adapter.max_retries.allowed_methods)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the MTN MoMo and Paystack APIs"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0.1
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+    
+    def _send(self, payload, status_code=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self._send({'access_token': 'fake-token', 'expires_in': 3600})
+    
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        time.sleep(cls.delay)
+        with cls.lock:
+            cls.active -= 1
+        
+        reference = self.path.rstrip('/').rsplit('/', 1)[-1]
+        if self.path.startswith('/transaction/verify/'):
+            self._send({'status': True, 'data': {'status': 'success', 'reference': reference}})
+        else:
+            self._send({'status': 'FAILED' if reference.startswith('fail') else 'SUCCESSFUL'})
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class PaymentReconciliationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakeProviderHandler.max_active = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeProviderHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        
+        settings_override = override_settings(
+            MTN_MOMO_BASE_URL=base_url,
+            MTN_MOMO_COLLECTION_USER_ID='user',
+            MTN_MOMO_COLLECTION_API_KEY='key',
+            MTN_MOMO_COLLECTION_SUBSCRIPTION_KEY='subscription'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        env = patch.dict(os.environ, {'PAYSTACK_SECRET_KEY': 'sk_test', 'PAYSTACK_BASE_URL': base_url})
+        env.start()
+        self.addCleanup(env.stop)
+        
+        momo = PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+        paystack = PaymentProvider.objects.create(name='Paystack', code='paystack', is_active=True)
+        for i in range(20):
+            Payment.objects.create(
+                reference=f'PAY-MOMO-{i}',
+                external_reference=f'fail-{i}' if i % 5 == 0 else f'ok-{i}',
+                amount=20.00,
+                currency='GHS',
+                payment_method='mobile_money',
+                provider=momo,
+                status='processing'
+            )
+        for i in range(5):
+            Payment.objects.create(
+                reference=f'PAY-PSTK-{i}',
+                amount=20.00,
+                currency='GHS',
+                payment_method='card',
+                provider=paystack,
+                status='processing'
+            )
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        close_sessions()
+    
+    def test_checks_run_concurrently_and_results_are_applied(self):
+        # Payments without a provider cannot be checked and are left alone
+        Payment.objects.create(reference='PAY-NO-PROVIDER', amount=20.00, currency='GHS', status='processing')
+        
+        report = reconcile_payments(concurrency={'mtn_momo': 10, 'paystack': 5}, chunk_size=100)
+        
+        self.assertEqual(report.checked, 25)
+        self.assertEqual(report.errors, 0)
+        self.assertEqual(report.updated, 25)
+        self.assertGreater(FakeProviderHandler.max_active, 1)
+        self.assertLess(report.elapsed, 25 * FakeProviderHandler.delay)
+        self.assertEqual(Payment.objects.filter(status='failed').count(), 4)
+        self.assertEqual(Payment.objects.filter(status='successful').count(), 21)
+        self.assertEqual(PaymentLog.objects.filter(message__contains='by reconciliation').count(), 25)
+    
+    def test_per_provider_concurrency_is_bounded(self):
+        reconcile_payments(Payment.objects.filter(provider__code='mtn_momo'), concurrency={'mtn_momo': 3})
+        self.assertLessEqual(FakeProviderHandler.max_active, 3)
+
+
+@override_settings(PAYMENT_WEBHOOK_WORKER_AUTOSTART=False)
+class WebhookInboxTest(APITestCase):
+    def setUp(self):
+        self.provider = PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+        self.payment = Payment.objects.create(
+            reference='PAY-HOOK',
+            amount=30.00,
+            currency='GHS',
+            payment_method='mobile_money',
+            provider=self.provider,
+            status='processing'
+        )
+        self.url = reverse('payments:mtn-momo-webhook')
+        self.event = {'externalId': 'PAY-HOOK', 'status': 'SUCCESSFUL', 'financialTransactionId': '987'}
+    
+    def test_webhook_is_acknowledged_before_processing(self):
+        response = self.client.post(self.url, self.event, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(WebhookEvent.objects.get().status, 'pending')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'processing')
+    
+    def test_retried_webhooks_are_processed_once(self):
+        for _ in range(3):
+            self.client.post(self.url, self.event, format='json')
+        
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(process_webhook_events(), 1)
+        self.assertEqual(process_webhook_events(), 0)
+        
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'successful')
+        self.assertEqual(self.payment.logs.filter(message__contains='MTN webhook').count(), 1)
+        self.assertEqual(WebhookEvent.objects.get().status, 'processed')
+    
+    def test_unknown_payment_is_marked_failed(self):
+        self.client.post(self.url, dict(self.event, externalId='PAY-UNKNOWN'), format='json')
+        process_webhook_events()
+        
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, 'failed')
+        self.assertIn('PAY-UNKNOWN', event.error)
+
+
+@override_settings(PAYMENT_SCHEDULER_AUTOSTART=False)
+class IdempotentCheckoutTest(APITestCase):
+    def setUp(self):
+        PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+        self.url = reverse('payments:checkout-payment')
+        self.data = {
+            'amount': '120.00',
+            'currency': 'GHS',
+            'payment_method': 'momo',
+            'provider_code': 'mtn_momo',
+            'phone_number': '+233241234567',
+            'description': 'Kakum tour'
+        }
+    
+    def test_repeated_key_replays_the_first_response(self):
+        first = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        second = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json()['payment']['reference'], first.data['payment']['reference'])
+        self.assertEqual(Payment.objects.count(), 1)
+    
+    def test_key_reused_with_different_body_is_rejected(self):
+        self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-2')
+        response = self.client.post(
+            self.url, dict(self.data, amount='999.00'), format='json', HTTP_IDEMPOTENCY_KEY='checkout-2'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Payment.objects.count(), 1)
+    
+    @patch('payments.idempotency.WAIT_TIMEOUT', 0.2)
+    def test_duplicate_of_in_flight_request_does_not_redo_work(self):
+        self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-3')
+        IdempotencyKey.objects.update(status='in_progress')
+        
+        response = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-3')
+        
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Payment.objects.count(), 1)
+    
+    def test_abandoned_in_progress_key_is_taken_over_after_its_lease(self):
+        self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-4')
+        # The first request died before storing its response
+        IdempotencyKey.objects.update(
+            status='in_progress', response_status=None, response_body=None,
+            created_at=timezone.now() - timedelta(minutes=5)
+        )
+        
+        response = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-4')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Payment.objects.count(), 2)
+        record = IdempotencyKey.objects.get()
+        self.assertEqual((record.status, record.response_body['payment']['reference']),
+                         ('completed', response.data['payment']['reference']))
+    
+    def test_requests_without_key_are_unaffected(self):
+        self.client.post(self.url, self.data, format='json')
+        self.client.post(self.url, self.data, format='json')
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class BufferedPaymentLogTest(TestCase):
+    def setUp(self):
+        provider = PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+        self.payment = Payment.objects.create(
+            amount=50,
+            currency='GHS',
+            payment_method='momo',
+            provider=provider,
+            phone_number='+233241234567',
+            description='Buffered log payment'
+        )
+    
+    def test_entries_are_flushed_in_one_insert_and_keep_their_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            with buffered_payment_logs():
+                for i in range(5):
+                    self.payment.log('info', f'step {i}')
+                with buffered_payment_logs():
+                    self.payment.log('warning', 'nested step')
+                self.assertEqual(len(queries), 0)
+        
+        # One INSERT, inside its own savepoint
+        self.assertEqual([query['sql'].split()[0] for query in queries], ['SAVEPOINT', 'INSERT', 'RELEASE'])
+        messages = list(PaymentLog.objects.order_by('created_at', 'id').values_list('message', flat=True))
+        self.assertEqual(messages, ['step 0', 'step 1', 'step 2', 'step 3', 'step 4', 'nested step'])
+        self.assertEqual(self.payment.logs.first().message, 'nested step')
+    
+    @override_settings(PAYMENT_LOG_MIN_LEVEL='info')
+    def test_entries_below_the_minimum_level_are_dropped(self):
+        with buffered_payment_logs():
+            self.payment.log('debug', 'noisy detail')
+            self.payment.log('error', 'provider unreachable')
+        
+        self.assertEqual(list(PaymentLog.objects.values_list('level', flat=True)), ['error'])
+    
+    def test_unbuffered_log_is_written_immediately(self):
+        self.payment.log('info', 'direct entry')
+        self.assertEqual(PaymentLog.objects.get().message, 'direct entry')
+    
+    def test_failed_flush_leaves_the_enclosing_transaction_usable(self):
+        existing = self.payment.log('info', 'already stored')
+        
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                with buffered_payment_logs():
+                    entry = self.payment.log('info', 'clashing entry')
+                    entry.id = existing.id
+                Payment.objects.filter(pk=self.payment.pk).update(description='Still committed')
+        
+        self.assertTrue(any(query['sql'].startswith('SAVEPOINT') for query in queries))
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).description, 'Still committed')
+        self.assertEqual(PaymentLog.objects.get().message, 'already stored')
+
+
+class SingleWriteCheckoutTest(APITestCase):
+    def setUp(self):
+        PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+        self.url = reverse('payments:checkout-payment')
+        self.data = {
+            'amount': '75.00',
+            'currency': 'GHS',
+            'payment_method': 'momo',
+            'provider_code': 'mtn_momo',
+            'phone_number': '+233241234567',
+            'description': 'Ticket Purchase: Afrobeats Night',
+            'booking_details': {'type': 'ticket'}
+        }
+    
+    def _payment_writes(self, queries):
+        return [
+            q['sql'] for q in queries.captured_queries
+            if '"payments_payment"' in q['sql'] and q['sql'].lstrip().startswith(('INSERT', 'UPDATE'))
+        ]
+    
+    def test_checkout_writes_the_payment_row_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        writes = self._payment_writes(queries)
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].lstrip().startswith('INSERT'))
+        
+        payment = Payment.objects.get()
+        self.assertEqual(payment.status, 'processing')
+        self.assertEqual(payment.metadata['booking_details']['type'], 'ticket')
+        self.assertEqual(payment.metadata['booking_details']['ticket']['name'], 'Afrobeats Night')
+    
+    def test_payments_created_elsewhere_get_details_in_the_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            payment = Payment.objects.create(amount=40, currency='GHS', description='Walking tour')
+        
+        self.assertEqual(len(self._payment_writes(queries)), 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.metadata['booking_details']['destination']['name'], 'Local Cultural Experience')
+
+
+class BookingDetailsBackfillTest(TestCase):
+    def setUp(self):
+        self.payments = [
+            Payment.objects.create(amount=40 + i, currency='GHS', description='Kakum tour')
+            for i in range(5)
+        ]
+        # Simulate rows written before booking details were filled in on insert
+        Payment.objects.exclude(pk=self.payments[2].pk).update(metadata={})
+        Payment.objects.filter(pk=self.payments[2].pk).update(metadata={'booking_details': {'kept': True}})
+    
+    def test_only_rows_missing_details_are_updated_in_chunks(self):
+        chunks = list(backfill_booking_details(chunk_size=2))
+        
+        self.assertEqual(chunks, [2, 2])
+        self.assertFalse(Payment.objects.exclude(metadata__has_key='booking_details').exists())
+        self.assertEqual(Payment.objects.get(pk=self.payments[2].pk).metadata['booking_details'], {'kept': True})
+        self.assertEqual(
+            Payment.objects.get(pk=self.payments[0].pk).metadata['booking_details']['destination']['name'],
+            'Kakum National Park Adventure'
+        )
+        self.assertFalse(BackfillCheckpoint.objects.exists())
+    
+    def test_interrupted_backfill_resumes_from_checkpoint(self):
+        backfill = backfill_booking_details(chunk_size=2)
+        self.assertEqual(next(backfill), 2)
+        backfill.close()
+        self.assertEqual(BackfillCheckpoint.objects.get().last_id, self.payments[1].pk)
+        
+        self.assertEqual(list(backfill_booking_details(chunk_size=2)), [2])
+        self.assertFalse(Payment.objects.exclude(metadata__has_key='booking_details').exists())
+
+
+class PaymentProviderAdminQueryBudgetTest(TestCase):
+    def test_payment_counts_are_annotated(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpass123')
+        self.client.force_login(admin_user)
+        url = reverse('admin:payments_paymentprovider_changelist')
+        
+        def add_providers(start, count):
+            for n in range(start, start + count):
+                provider = PaymentProvider.objects.create(name=f'Provider {n}', code=f'provider_{n}')
+                Payment.objects.create(amount=10, currency='GHS', provider=provider)
+        
+        add_providers(0, 2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        add_providers(2, 10)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        
+        self.assertEqual(len(large), len(small))
+        self.assertContains(response, '1 payments')
+
+
+class PaymentNotFoundLookupTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('payments:payment-status', args=['PAY-20990101000000-NOPE00'])
+    
+    def test_unknown_reference_is_cached_and_hides_debug_info(self):
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('debug_info', response.data)
+        # One probe of the live table and one of the archive index
+        self.assertEqual(len(first), 2)
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_staff_see_debug_info(self):
+        staff = User.objects.create_user(username='staff', email='staff@example.com', password='staffpass123', is_staff=True)
+        self.client.force_authenticate(user=staff)
+        
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['debug_info']['total_payments'], 0)
+    
+    def test_creating_the_payment_clears_the_cached_miss(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(reference='PAY-20990101000000-NOPE00', amount=10, currency='GHS', status='successful')
+        
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['reference'], 'PAY-20990101000000-NOPE00')
+
+
+class FeeScheduleTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+    
+    def test_seeded_schedules_match_the_previous_fee_table(self):
+        self.assertEqual(calculate_payment_fees(50, 'momo'), {'fee': 0, 'total': 50})
+        self.assertEqual(calculate_payment_fees(100.5, 'momo'), {'fee': 0, 'total': 100.5})  # Gap between bands
+        self.assertEqual(calculate_payment_fees(750, 'momo'), {'fee': 5, 'total': 755})
+        self.assertEqual(calculate_payment_fees(9000, 'mobile_money', 'KES'), {'fee': 25, 'total': 9025})
+        self.assertEqual(calculate_payment_fees(100, 'card', 'USD'), {'fee': 2.9, 'total': 102.9})
+        self.assertEqual(calculate_payment_fees(10, 'card'), {'fee': 2, 'total': 12})
+        self.assertEqual(calculate_payment_fees(10, 'bank_transfer', 'EUR'), {'fee': 1, 'total': 11})
+        self.assertEqual(calculate_payment_fees(10, 'crypto'), {'fee': 0, 'total': 10})
+    
+    def test_changes_are_picked_up_without_a_deploy(self):
+        calculate_payment_fees(750, 'momo')
+        with self.assertNumQueries(0):
+            calculate_payment_fees(750, 'momo')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            FeeTier.objects.filter(schedule__payment_method='momo', schedule__currency='GHS', fee=5).update(fee=6)
+            FeeSchedule.objects.get(payment_method='momo', currency='GHS').save()
+        
+        self.assertEqual(calculate_payment_fees(750, 'momo'), {'fee': 6, 'total': 756})
+    
+    def test_batch_quote_endpoint(self):
+        response = self.client.post(reverse('payments:fee-quote'), {'quotes': [
+            {'amount': 750, 'payment_method': 'momo'},
+            {'amount': 100, 'payment_method': 'card', 'currency': 'usd'},
+        ]}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([quote['fee'] for quote in response.data['quotes']], [5, 2.9])
+        self.assertEqual(response.data['quotes'][1]['currency'], 'USD')
+        
+        response = self.client.post(reverse('payments:fee-quote'), {'quotes': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PaymentArchiveTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        settings_override = override_settings(PAYMENT_ARCHIVE_DIR=self.archive_dir.name, PAYMENT_ARCHIVE_AFTER_DAYS=180)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='archived', email='archived@example.com', password='archivedpass123')
+        self.old = Payment.objects.create(user=self.user, amount=120, currency='GHS', status='successful')
+        self.old.log('info', 'Payment completed')
+        PaymentCallback.objects.create(payment=self.old, provider_reference='EXT-1', status='successful', callback_data={'ok': True})
+        self.stale_pending = Payment.objects.create(user=self.user, amount=80, currency='GHS', status='pending')
+        self.recent = Payment.objects.create(user=self.user, amount=60, currency='GHS', status='failed')
+        Payment.objects.filter(pk__in=[self.old.pk, self.stale_pending.pk]).update(
+            created_at=timezone.now() - timedelta(days=400)
+        )
+    
+    def test_only_old_finalized_payments_are_archived(self):
+        self.assertEqual(list(archive_payments()), [1])
+        
+        self.assertFalse(Payment.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(PaymentLog.objects.filter(payment_id=self.old.pk).exists())
+        self.assertEqual(Payment.objects.filter(pk__in=[self.stale_pending.pk, self.recent.pk]).count(), 2)
+        
+        archived = ArchivedPayment.objects.get(reference=self.old.reference)
+        self.assertEqual(archived.user, self.user)
+        record = load_archived_record(archived)
+        self.assertEqual(record['payment']['reference'], self.old.reference)
+        self.assertEqual(record['callbacks'][0]['provider_reference'], 'EXT-1')
+        self.assertEqual(record['logs'][0]['message'], 'Payment completed')
+    
+    def test_dry_run_moves_nothing(self):
+        self.assertEqual(list(archive_payments(dry_run=True)), [1])
+        self.assertTrue(Payment.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(ArchivedPayment.objects.exists())
+    
+    def test_refuses_to_run_without_a_configured_directory(self):
+        with override_settings(PAYMENT_ARCHIVE_DIR=None):
+            with self.assertRaises(ImproperlyConfigured):
+                list(archive_payments())
+            with self.assertRaises(CommandError):
+                call_command('archive_payments', stdout=StringIO())
+        self.assertTrue(Payment.objects.filter(pk=self.old.pk).exists())
+    
+    def test_payments_with_unfinished_outbox_events_are_kept(self):
+        event = OutboxEvent.objects.create(topic='ticket_purchase', payment=self.old, status='failed')
+        self.assertEqual(list(archive_payments()), [])
+        self.assertTrue(OutboxEvent.objects.filter(pk=event.pk).exists())
+        
+        OutboxEvent.objects.filter(pk=event.pk).update(status='processed')
+        self.assertEqual(list(archive_payments()), [1])
+    
+    def test_archived_references_stay_readable(self):
+        list(archive_payments())
+        
+        response = self.client.get(reverse('payments:payment-status', args=[self.old.reference]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['archived'])
+        self.assertEqual(response.data['status'], 'successful')
+        
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('payments:payment-detail', args=[self.old.reference]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['reference'], self.old.reference)
+        
+        # The full record is for staff only
+        url = reverse('payments:archived-payment-record', args=[self.old.reference])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['record']['logs'][0]['message'], 'Payment completed')
+
+
+class PaymentStateMachineTest(TestCase):
+    def setUp(self):
+        self.payment = Payment.objects.create(amount=75, currency='GHS', status='pending')
+    
+    def test_transition_is_a_single_compare_and_swap_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(transition(self.payment, 'failed'))
+        
+        # Everything after the CAS UPDATE is settlement rollup bookkeeping
+        self.assertTrue(all('payments_settlementrollup' in query['sql'] for query in queries[1:]))
+        sql = queries[0]['sql']
+        self.assertIn('"version" = ', sql.split('WHERE')[1])
+        self.assertNotIn('"metadata"', sql)
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.version), ('failed', 1))
+        self.assertIsNotNone(self.payment.processed_at)
+    
+    def test_concurrent_writers_do_not_lose_updates(self):
+        first = Payment.objects.get(pk=self.payment.pk)
+        second = Payment.objects.get(pk=self.payment.pk)
+        
+        self.assertTrue(transition(first, 'processing'))
+        # The stale writer re-reads and retries, since processing -> successful is allowed
+        self.assertTrue(transition(second, 'successful'))
+        self.assertEqual(second.version, 2)
+        
+        # ...but cannot undo a final status
+        self.assertFalse(transition(first, 'failed'))
+        self.assertEqual(first.status, 'successful')
+        
+        # A full save of a stale instance leaves the status alone
+        stale = Payment.objects.get(pk=self.payment.pk)
+        transition(Payment.objects.get(pk=self.payment.pk), 'refunded')
+        stale.description = 'Edited'
+        stale.save()
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.description), ('refunded', 'Edited'))
+    
+    def test_rules_signal_and_bulk_transition(self):
+        changes = []
+        receiver = lambda sender, payment, old_status, new_status, **kwargs: changes.append((old_status, new_status))
+        payment_status_changed.connect(receiver)
+        self.addCleanup(payment_status_changed.disconnect, receiver)
+        
+        self.assertTrue(transition(self.payment, 'failed', 'Declined'))
+        self.assertFalse(transition(self.payment, 'pending'))
+        self.assertTrue(transition(self.payment, 'pending', force=True, processed_at=None))
+        self.assertEqual(changes, [('pending', 'failed'), ('failed', 'pending')])
+        self.assertEqual(PaymentLog.objects.get(payment=self.payment).message, 'Declined')
+        
+        done = Payment.objects.create(amount=10, currency='GHS', status='successful')
+        changed = bulk_transition(Payment.objects.all(), 'cancelled')
+        self.assertEqual([payment.pk for payment in changed], [self.payment.pk])
+        self.assertEqual(Payment.objects.get(pk=done.pk).status, 'successful')
+    
+    def test_bulk_transition_skips_rows_changed_since_loading(self):
+        stale = Payment.objects.get(pk=self.payment.pk)
+        fresh = Payment.objects.create(amount=25, currency='GHS', status='pending')
+        # A webhook moves the payment while the sweeper is deciding
+        transition(Payment.objects.get(pk=self.payment.pk), 'processing')
+        
+        changed = bulk_transition([stale, fresh], 'failed')
+        
+        self.assertEqual([payment.pk for payment in changed], [fresh.pk])
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'processing')
+        counts = dict(SettlementRollup.objects.values_list('status', 'count'))
+        self.assertEqual((counts['pending'], counts['processing'], counts['failed']), (0, 1, 1))
+    
+    def test_bulk_transition_writes_in_batches(self):
+        payments = [self.payment] + [Payment.objects.create(amount=25, currency='GHS', status='pending') for _ in range(4)]
+        transition(Payment.objects.get(pk=payments[2].pk), 'processing')
+        
+        with patch('payments.state.BULK_TRANSITION_BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            changed = bulk_transition(payments, 'failed')
+        
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "payments_payment"')]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual([payment.pk for payment in changed], [payments[i].pk for i in (0, 1, 3, 4)])
+        self.assertEqual(Payment.objects.filter(status='failed').count(), 4)
+        
+        # Large sweeps stay under SQLite's expression depth limit
+        many = [Payment(reference=f'PAY-BATCH-{i}', amount=1, currency='GHS', status='pending') for i in range(1200)]
+        Payment.objects.bulk_create(many)
+        many = list(Payment.objects.filter(reference__startswith='PAY-BATCH-'))
+        rebuild_settlement_rollup()
+        self.assertEqual(len(bulk_transition(many, 'cancelled')), 1200)
+
+
+@override_settings(PAYMENT_OUTBOX_WORKER_AUTOSTART=False)
+class PaymentOutboxTest(TestCase):
+    def setUp(self):
+        from tickets.models import Ticket, TicketCategory, Venue
+        
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='buyerpass123')
+        now = timezone.now()
+        venue = Venue.objects.create(name='Accra Arena', slug='accra-arena', address='Ring Road', city='Accra', region='Greater Accra')
+        category = TicketCategory.objects.create(name='Concerts', slug='concerts', category_type='event')
+        self.ticket = Ticket.objects.create(
+            title='Highlife Night', slug='highlife-night', description='Live music', category=category, venue=venue,
+            price=50, total_quantity=100, available_quantity=100, event_date=now + timedelta(days=10),
+            sale_start_date=now - timedelta(days=1), sale_end_date=now + timedelta(days=9), status='published'
+        )
+        self.payment = Payment.objects.create(
+            user=self.user, amount=100, currency='GHS', status='processing',
+            description='Ticket Purchase: Highlife Night (2 tickets)',
+            metadata={'ticket_order': {'ticket_id': self.ticket.pk, 'quantity': 2, 'customer_email': 'buyer@example.com'}}
+        )
+    
+    def test_success_is_recorded_with_the_transition_and_fulfilled_by_the_worker(self):
+        transition(self.payment, 'successful')
+        event = OutboxEvent.objects.get(payment=self.payment)
+        self.assertEqual((event.topic, event.status), ('payment.successful', 'pending'))
+        
+        self.assertEqual(process_outbox_events(), 1)
+        
+        purchase = self.ticket.purchases.get()
+        self.assertEqual((purchase.status, purchase.payment_status), ('confirmed', 'completed'))
+        self.assertEqual(purchase.payment_reference, self.payment.reference)
+        self.assertEqual(purchase.ticket_codes.count(), 2)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.available_quantity, 98)
+        self.assertEqual(OutboxEvent.objects.get(pk=event.pk).status, 'processed')
+    
+    def test_fulfillment_is_idempotent_and_failed_events_back_off(self):
+        transition(self.payment, 'successful')
+        process_outbox_events()
+        OutboxEvent.objects.update(status='pending')
+        process_outbox_events()
+        self.assertEqual(self.ticket.purchases.get().ticket_codes.count(), 2)
+        
+        failing = Payment.objects.create(
+            user=self.user, amount=10, currency='GHS', status='processing',
+            metadata={'ticket_order': {'ticket_id': self.ticket.pk}}
+        )
+        transition(failing, 'successful')
+        with patch('tickets.fulfillment.fulfill_ticket_payment', side_effect=RuntimeError('database hiccup')):
+            process_outbox_events()
+        event = OutboxEvent.objects.get(payment=failing)
+        self.assertEqual((event.status, event.attempts), ('pending', 1))
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertEqual(process_outbox_events(), 0)
+    
+    def test_sold_out_or_unpublished_tickets_fail_without_retrying(self):
+        self.ticket.available_quantity = 1
+        self.ticket.save()
+        transition(self.payment, 'successful')
+        process_outbox_events()
+        
+        event = OutboxEvent.objects.get(payment=self.payment)
+        self.assertEqual((event.status, event.attempts), ('failed', 1))
+        self.assertIn('Not enough tickets left', event.error)
+        self.assertFalse(self.ticket.purchases.exists())
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.available_quantity, 1)
+        self.assertTrue(self.payment.logs.filter(level='error', message__contains='not created').exists())
+        
+        unpublished = Payment.objects.create(
+            user=self.user, amount=10, currency='GHS', status='processing',
+            metadata={'ticket_order': {'ticket_id': 999999}}
+        )
+        transition(unpublished, 'successful')
+        process_outbox_events()
+        self.assertEqual(OutboxEvent.objects.get(payment=unpublished).status, 'failed')
+    
+    def test_worker_and_direct_purchase_share_one_purchase(self):
+        from django.db import IntegrityError, transaction
+        from tickets.fulfillment import create_purchase_for_payment
+        from tickets.models import TicketPurchase
+        
+        # The direct purchase endpoint got there first
+        direct = TicketPurchase.objects.create(
+            ticket=self.ticket, user=self.user, quantity=2, unit_price=50, total_amount=100,
+            customer_name='Buyer', customer_email='buyer@example.com', payment_reference=self.payment.reference
+        )
+        order = self.payment.metadata['ticket_order']
+        self.assertEqual(create_purchase_for_payment(self.payment, order).pk, direct.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TicketPurchase.objects.create(
+                ticket=self.ticket, user=self.user, quantity=1, unit_price=50, total_amount=50,
+                customer_name='Buyer', customer_email='buyer@example.com', payment_reference=self.payment.reference
+            )
+        
+        transition(self.payment, 'successful')
+        process_outbox_events()
+        self.assertEqual(self.ticket.purchases.get().pk, direct.pk)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.available_quantity, 100)
+    
+    def test_direct_purchase_does_not_return_another_users_purchase(self):
+        from rest_framework.test import APIClient
+        
+        transition(self.payment, 'successful')
+        process_outbox_events()
+        
+        client = APIClient()
+        data = {'ticket_id': self.ticket.pk, 'quantity': 2, 'payment_reference': self.payment.reference}
+        client.force_authenticate(user=User.objects.create_user(username='other', email='other@example.com', password='otherpass123'))
+        response = client.post(reverse('tickets:direct-purchase-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('purchase', response.data)
+        
+        client.force_authenticate(user=self.user)
+        response = client.post(reverse('tickets:direct-purchase-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['purchase']['payment_reference'], self.payment.reference)
+    
+    def test_other_transitions_write_no_outbox_event(self):
+        transition(self.payment, 'failed')
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class FinanceExportTest(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='finance', email='finance@example.com', password='financepass123', is_staff=True)
+        for i, payment_status in enumerate(['successful', 'successful', 'failed']):
+            Payment.objects.create(reference=f'PAY-EXPORT-{i}', user=self.staff, amount=10 + i, currency='GHS', status=payment_status)
+        Payment.objects.filter(reference='PAY-EXPORT-0').update(created_at=timezone.now() - timedelta(days=30))
+    
+    def _body(self, response):
+        return b''.join(response.streaming_content).decode()
+    
+    def test_csv_export_streams_filtered_rows(self):
+        self.client.force_authenticate(user=self.staff)
+        url = reverse('payments:finance-export', args=['payments', 'csv'])
+        
+        response = self.client.get(url, {'status': 'successful', 'from': (timezone.now() - timedelta(days=1)).date().isoformat()})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = self._body(response).splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['reference', 'created_at', 'processed_at', 'status'])
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['PAY-EXPORT-1'])
+    
+    def test_ndjson_export_and_validation(self):
+        self.client.force_authenticate(user=self.staff)
+        
+        response = self.client.get(reverse('payments:finance-export', args=['payments', 'ndjson']))
+        records = [json.loads(line) for line in self._body(response).splitlines()]
+        self.assertEqual([record['reference'] for record in records], ['PAY-EXPORT-0', 'PAY-EXPORT-1', 'PAY-EXPORT-2'])
+        self.assertEqual(records[0]['user_email'], 'finance@example.com')
+        
+        response = self.client.get(reverse('payments:finance-export', args=['payments', 'csv']), {'to': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('payments:finance-export', args=['ticket_purchases', 'csv']))
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+    
+    def test_export_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'payments.ndjson')
+            call_command('export_finance', 'payments', format='ndjson', status=['failed'], output=path, stderr=StringIO())
+            with open(path) as exported:
+                self.assertEqual([json.loads(line)['reference'] for line in exported], ['PAY-EXPORT-2'])
+    
+    def test_archived_payments_are_merged_into_the_export(self):
+        ArchivedPayment.objects.create(
+            reference='PAY-ARCHIVED', payment_id=uuid.uuid4(), user=self.staff, amount=99, currency='GHS',
+            payment_method='momo', provider_code='mtn_momo', status='successful',
+            created_at=timezone.now() - timedelta(days=400), archive_file='payments-2025-01.ndjson.gz'
+        )
+        
+        records = [json.loads(line) for line in export_lines('payments', 'ndjson', statuses=['successful'])]
+        self.assertEqual([record['reference'] for record in records], ['PAY-ARCHIVED', 'PAY-EXPORT-0', 'PAY-EXPORT-1'])
+        self.assertEqual((records[0]['provider'], records[0]['external_reference']), ('mtn_momo', ''))
+        
+        cutoff = (timezone.now() - timedelta(days=100)).date()
+        self.assertNotIn('PAY-ARCHIVED', ''.join(export_lines('payments', 'csv', date_from=cutoff)))
+    
+    def test_csv_cells_are_not_evaluated_as_formulas(self):
+        Payment.objects.filter(reference='PAY-EXPORT-1').update(description='=HYPERLINK("http://evil.example","x")')
+        Payment.objects.filter(reference='PAY-EXPORT-2').update(description='-2+3')
+        
+        rows = list(csv.reader(export_lines('payments', 'csv')))
+        descriptions = {row[0]: row[-1] for row in rows[1:]}
+        self.assertEqual(descriptions['PAY-EXPORT-1'], '\'=HYPERLINK("http://evil.example","x")')
+        self.assertEqual(descriptions['PAY-EXPORT-2'], "'-2+3")
+        self.assertEqual(rows[1][4], '10.00')
+
+
+class SettlementRollupTest(TestCase):
+    def setUp(self):
+        self.provider = PaymentProvider.objects.create(name='MTN Mobile Money', code='mtn_momo', is_active=True)
+        self.payments = [
+            Payment.objects.create(
+                reference=f'PAY-SETTLE-{i}',
+                amount=amount,
+                currency='GHS',
+                payment_method='mobile_money',
+                provider=self.provider,
+                status='pending'
+            )
+            for i, amount in enumerate([100, 40, 60])
+        ]
+        self.fee = calculate_payment_fees(100, 'mobile_money')['fee']
+    
+    def _rollups(self):
+        return {
+            (row.provider_code, row.status): (row.count, float(row.gross))
+            for row in SettlementRollup.objects.exclude(count=0)
+        }
+    
+    def test_rollup_follows_creation_and_transitions(self):
+        self.assertEqual(self._rollups(), {('mtn_momo', 'pending'): (3, 200.0)})
+        
+        transition(self.payments[0], 'successful')
+        bulk_transition(self.payments[1:], 'failed')
+        transition(self.payments[0], 'refunded')
+        transition(self.payments[0], 'refunded')
+        
+        self.assertEqual(self._rollups(), {('mtn_momo', 'failed'): (2, 100.0), ('mtn_momo', 'refunded'): (1, 100.0)})
+        row = SettlementRollup.objects.get(status='refunded')
+        self.assertEqual((row.day, row.currency), (timezone.localdate(), 'GHS'))
+        self.assertAlmostEqual(float(row.fees), self.fee)
+    
+    def test_rebuild_matches_incremental_rollup_and_keeps_archived_payments(self):
+        transition(self.payments[0], 'successful')
+        expected = self._rollups()
+        
+        # Writes that bypass the state machine drift until the next rebuild
+        Payment.objects.filter(pk=self.payments[1].pk).update(status='cancelled')
+        Payment.objects.filter(pk=self.payments[0].pk).update(created_at=timezone.now() - timedelta(days=400))
+        with tempfile.TemporaryDirectory() as directory, override_settings(PAYMENT_ARCHIVE_DIR=directory):
+            list(archive_payments(days=180))
+        out = StringIO()
+        call_command('rebuild_settlement_rollup', stdout=out)
+        
+        self.assertIn('3 rollup rows', out.getvalue())
+        expected[('mtn_momo', 'pending')] = (1, 60.0)
+        expected[('mtn_momo', 'cancelled')] = (1, 40.0)
+        self.assertEqual(self._rollups(), expected)
+        old_day = timezone.localdate(timezone.now() - timedelta(days=400))
+        self.assertTrue(SettlementRollup.objects.filter(day=old_day, status='successful').exists())
+        
+        # A ranged rebuild only touches its own days
+        self.assertEqual(rebuild_settlement_rollup(date_from=timezone.localdate()), 2)
+        summary = settlement_summary(old_day)
+        self.assertEqual([(row['provider_code'], row['count'], float(row['gross'])) for row in summary], [('mtn_momo', 1, 100.0)])
@@ -12,6 +12,7 @@ urlpatterns = [
     path('list/', views.PaymentListView.as_view(), name='payment-list'),
     path('<str:reference>/', views.PaymentDetailView.as_view(), name='payment-detail'),
     path('<str:reference>/status/', views.payment_status, name='payment-status'),
+    path('<str:reference>/status/stream/', views.payment_status_stream, name='payment-status-stream'),
     path('<str:reference>/complete/', views.complete_payment, name='payment-complete'),
     path('<str:reference>/cancel/', views.cancel_payment, name='payment-cancel'),
     
@@ -21,6 +22,13 @@ urlpatterns = [
     # Checkout
     path('checkout/methods/', views.get_payment_methods, name='payment-methods'),
     path('checkout/create/', views.checkout_payment, name='checkout-payment'),
+    path('fees/quote/', views.quote_payment_fees, name='fee-quote'),
+    
+    # Finance exports
+    path('exports/<str:dataset>.<str:export_format>', views.finance_export, name='finance-export'),
+    
+    # Archive
+    path('archive/<str:reference>/', views.archived_payment_record, name='archived-payment-record'),
     
     # MTN MoMo webhook
     path('mtn-momo/webhook/', views.mtn_momo_webhook, name='mtn-momo-webhook'),
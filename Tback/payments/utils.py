@@ -1,14 +1,11 @@
 import uuid
-import string
-import random
 from typing import Dict, Any
-from django.utils import timezone
+from tback_api.references import payment_reference
+from .fees import quote_fee
 
 def generate_payment_reference() -> str:
-    """Generate a unique payment reference"""
-    timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-    random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"PAY-{timestamp}-{random_part}"
+    """Generate a unique, time-ordered payment reference (PAY-YYYYMMDDHHMMSS-XXXXXX-R...)"""
+    return payment_reference()
 
 def generate_payment_id() -> str:
     """Generate a unique payment ID"""
@@ -85,83 +82,8 @@ def get_payment_method_config(payment_method: str) -> Dict[str, Any]:
     return configs.get(payment_method, {})
 
 def calculate_payment_fees(amount: float, payment_method: str, currency: str = 'GHS') -> Dict[str, Any]:
-    """Calculate payment processing fees"""
-    fee_structures = {
-        'momo': {
-            'GHS': {
-                'type': 'tiered',
-                'tiers': [
-                    {'min': 1, 'max': 100, 'fee': 0},
-                    {'min': 101, 'max': 500, 'fee': 2},
-                    {'min': 501, 'max': 1000, 'fee': 5},
-                    {'min': 1001, 'max': 5000, 'fee': 10},
-                    {'min': 5001, 'max': float('inf'), 'fee': 20}
-                ]
-            }
-        },
-        'mobile_money': {  # Alias for momo
-            'GHS': {
-                'type': 'tiered',
-                'tiers': [
-                    {'min': 1, 'max': 100, 'fee': 0},
-                    {'min': 101, 'max': 500, 'fee': 2},
-                    {'min': 501, 'max': 1000, 'fee': 5},
-                    {'min': 1001, 'max': 5000, 'fee': 10},
-                    {'min': 5001, 'max': float('inf'), 'fee': 20}
-                ]
-            },
-            'KES': {
-                'type': 'tiered',
-                'tiers': [
-                    {'min': 1, 'max': 100, 'fee': 0},
-                    {'min': 101, 'max': 500, 'fee': 5},
-                    {'min': 501, 'max': 1000, 'fee': 10},
-                    {'min': 1001, 'max': 5000, 'fee': 15},
-                    {'min': 5001, 'max': float('inf'), 'fee': 25}
-                ]
-            }
-        },
-        'card': {
-            'GHS': {'type': 'percentage', 'rate': 0.035, 'min_fee': 2},
-            'KES': {'type': 'percentage', 'rate': 0.035, 'min_fee': 10},
-            'USD': {'type': 'percentage', 'rate': 0.029, 'min_fee': 0.30},
-            'EUR': {'type': 'percentage', 'rate': 0.029, 'min_fee': 0.30}
-        },
-        'bank_transfer': {
-            'GHS': {'type': 'flat', 'fee': 5},
-            'KES': {'type': 'flat', 'fee': 50},
-            'USD': {'type': 'flat', 'fee': 1.00},
-            'EUR': {'type': 'flat', 'fee': 1.00}
-        }
-    }
-    
-    method_config = fee_structures.get(payment_method, {})
-    currency_config = method_config.get(currency, {})
-    
-    if not currency_config:
-        return {'fee': 0, 'total': amount}
-    
-    fee_type = currency_config.get('type')
-    
-    if fee_type == 'flat':
-        fee = currency_config.get('fee', 0)
-    elif fee_type == 'percentage':
-        rate = currency_config.get('rate', 0)
-        min_fee = currency_config.get('min_fee', 0)
-        fee = max(amount * rate, min_fee)
-    elif fee_type == 'tiered':
-        fee = 0
-        for tier in currency_config.get('tiers', []):
-            if tier['min'] <= amount <= tier['max']:
-                fee = tier['fee']
-                break
-    else:
-        fee = 0
-    
-    return {
-        'fee': round(fee, 2),
-        'total': round(amount + fee, 2)
-    }
+    """Calculate payment processing fees from the configured fee schedules"""
+    return quote_fee(amount, payment_method, currency)
 
 def mask_sensitive_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """Mask sensitive data in logs and responses"""
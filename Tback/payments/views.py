@@ -6,23 +6,40 @@ from django.shortcuts import get_object_or_404
 from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse, Http404
+from django.views.decorators.http import require_GET
 from datetime import timedelta
+import json
 import logging
-import threading
-import time
 import random
+import time
 
-from .models import Payment, PaymentProvider, PaymentCallback
+from .models import Payment, PaymentProvider, PaymentCallback, ArchivedPayment
 from .serializers import (
     PaymentCreateSerializer, PaymentSerializer, PaymentListSerializer,
-    PaymentProviderSerializer, PaymentCallbackSerializer, CheckoutPaymentSerializer
+    PaymentProviderSerializer, PaymentCallbackSerializer, CheckoutPaymentSerializer,
+    FeeQuoteRequestSerializer, ArchivedPaymentSerializer
 )
 from .services import PaymentService
 from .utils import generate_payment_reference
 from .mtn_momo_service import MTNMoMoService
+from .scheduler import schedule_transition
+from .status_checks import check_payment_status, coalesced_status_check
+from .webhooks import enqueue_webhook
+from .state import transition
+from .idempotency import idempotent
+from .lookups import find_payment, find_archived_payment
+from .archive import load_archived_record
+from .fees import quote_fees
+from .exports import export_lines, FORMATS as EXPORT_FORMATS, DATASETS as EXPORT_DATASETS
+from .booking_utils import attach_booking_details
+from .status_stream import watcher as status_watcher, FINAL_STATUSES as STREAM_FINAL_STATUSES
 
 logger = logging.getLogger(__name__)
 
+TICKET_ORDER_FIELDS = ['ticket_id', 'quantity', 'unit_price', 'customer_name', 'customer_email', 'customer_phone']
+
 class PaymentProviderListView(generics.ListAPIView):
     """List active payment providers"""
     queryset = PaymentProvider.objects.filter(is_active=True)
@@ -50,24 +67,14 @@ class PaymentCreateView(generics.CreateAPIView):
             result = payment_service.initiate_payment(payment)
             
             if result.get('success'):
-                payment.external_reference = result.get('external_reference')
-                payment.status = 'processing'
-                payment.save()
-                
-                # Log successful initiation
-                payment.log('info', 'Payment initiated successfully', result)
+                transition(payment, 'processing', 'Payment initiated successfully', result,
+                           external_reference=result.get('external_reference') or '')
             else:
-                payment.status = 'failed'
-                payment.save()
-                
-                # Log failure
-                payment.log('error', 'Payment initiation failed', result)
+                transition(payment, 'failed', 'Payment initiation failed', result, level='error')
                 
         except Exception as e:
             logger.error(f"Payment initiation error for {payment.reference}: {str(e)}")
-            payment.status = 'failed'
-            payment.save()
-            payment.log('error', f'Payment initiation exception: {str(e)}')
+            transition(payment, 'failed', f'Payment initiation exception: {str(e)}', level='error')
 
 class PaymentDetailView(generics.RetrieveAPIView):
     """Get payment details"""
@@ -79,6 +86,18 @@ class PaymentDetailView(generics.RetrieveAPIView):
         return Payment.objects.filter(user=self.request.user).select_related(
             'provider', 'booking'
         )
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Old payments live in the archive once they have been moved out of the hot table
+            archived = ArchivedPayment.objects.filter(
+                user=request.user, reference=kwargs.get(self.lookup_field)
+            ).first()
+            if archived is None:
+                raise
+            return Response(ArchivedPaymentSerializer(archived).data)
 
 class PaymentListView(generics.ListAPIView):
     """List user's payments"""
@@ -103,11 +122,7 @@ def cancel_payment(request, reference):
         payment_service = PaymentService()
         result = payment_service.cancel_payment(payment)
         
-        if result.get('success'):
-            payment.status = 'cancelled'
-            payment.save()
-            payment.log('info', 'Payment cancelled by user')
-            
+        if result.get('success') and transition(payment, 'cancelled', 'Payment cancelled by user'):
             return Response({
                 'success': True,
                 'message': 'Payment cancelled successfully'
@@ -130,109 +145,173 @@ def cancel_payment(request, reference):
 def payment_callback(request, provider_code):
     """Handle payment provider callbacks"""
     try:
-        provider = get_object_or_404(PaymentProvider, code=provider_code, is_active=True)
+        if not PaymentProvider.objects.filter(code=provider_code, is_active=True).exists():
+            return Response({'status': 'error', 'message': 'Unknown provider'}, 
+                          status=status.HTTP_404_NOT_FOUND)
         
-        # Get payment reference from callback data
-        payment_service = PaymentService()
-        payment_ref = payment_service.extract_payment_reference(provider, request.data)
-        
-        if not payment_ref:
-            logger.warning(f"No payment reference found in callback from {provider_code}")
-            return Response({'status': 'error', 'message': 'Invalid callback data'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
-        
-        payment = get_object_or_404(Payment, reference=payment_ref)
-        
-        # Create callback record
-        with transaction.atomic():
-            callback_serializer = PaymentCallbackSerializer(data={
-                'provider_reference': request.data.get('reference', ''),
-                'status': request.data.get('status', ''),
-                'callback_data': request.data
-            })
-            
-            if callback_serializer.is_valid():
-                callback = callback_serializer.save(payment=payment)
-                
-                # Process the callback
-                result = payment_service.process_callback(payment, callback)
-                
-                if result.get('success'):
-                    # Update payment status
-                    new_status = result.get('status')
-                    if new_status and new_status != payment.status:
-                        payment.status = new_status
-                        if new_status in ['successful', 'failed', 'cancelled']:
-                            payment.processed_at = timezone.now()
-                        payment.save()
-                        
-                        payment.log('info', f'Payment status updated to {new_status}', result)
-                    
-                    callback.processed = True
-                    callback.save()
-                    
-                    return Response({'status': 'success'})
-                else:
-                    payment.log('warning', 'Callback processing failed', result)
-                    return Response({'status': 'error', 'message': 'Processing failed'}, 
-                                  status=status.HTTP_400_BAD_REQUEST)
-            else:
-                logger.error(f"Invalid callback data from {provider_code}: {callback_serializer.errors}")
-                return Response({'status': 'error', 'message': 'Invalid data'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
+        # Acknowledge immediately; the webhook worker applies the callback
+        enqueue_webhook(provider_code, request.data)
+        return Response({'status': 'success'})
                 
     except Exception as e:
         logger.error(f"Payment callback error from {provider_code}: {str(e)}")
         return Response({'status': 'error', 'message': 'Internal error'}, 
                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def archived_payment_record(request, reference):
+    """Full archived record (payment, callbacks and logs) for support staff"""
+    archived = get_object_or_404(ArchivedPayment, reference=reference)
+    record = load_archived_record(archived)
+    if record is None:
+        logger.error(f"Archive file {archived.archive_file} has no record for {reference}")
+        return Response({'error': 'Archived record is unavailable'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({**ArchivedPaymentSerializer(archived).data, 'record': record})
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def finance_export(request, dataset, export_format):
+    """Stream payments or ticket purchases as CSV/NDJSON, filtered by ?status=&from=&to="""
+    if dataset not in EXPORT_DATASETS or export_format not in EXPORT_FORMATS:
+        return Response({'error': 'Unknown export'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        lines = export_lines(
+            dataset,
+            export_format,
+            statuses=request.GET.getlist('status'),
+            date_from=request.GET.get('from'),
+            date_to=request.GET.get('to')
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}-{timezone.now():%Y%m%d%H%M%S}.{export_format}"'
+    return response
+
 @api_view(['GET'])
 @permission_classes([AllowAny])  # Changed to AllowAny for demo purposes
 def payment_status(request, reference):
     """Check payment status"""
-    try:
-        payment = Payment.objects.get(reference=reference)
-    except Payment.DoesNotExist:
-        # Provide helpful debugging information
-        logger.warning(f"Payment not found: {reference}")
-        
-        # Get similar references for debugging
-        similar_payments = Payment.objects.filter(
-            reference__icontains=reference[:10]  # First 10 chars
-        ).values_list('reference', flat=True)[:5]
+    payment = find_payment(reference)
+    if payment is None:
+        archived = find_archived_payment(reference)
+        if archived is not None:
+            return Response(ArchivedPaymentSerializer(archived).data)
         
-        return Response({
+        logger.warning(f"Payment not found: {reference}")
+        data = {
             'error': 'Payment not found',
             'reference': reference,
             'message': f'No payment found with reference: {reference}',
-            'debug_info': {
+        }
+        if request.user.is_staff:
+            # Debugging aids scan the table, so only staff may trigger them
+            data['debug_info'] = {
                 'total_payments': Payment.objects.count(),
-                'similar_references': list(similar_payments),
+                'similar_references': list(Payment.objects.filter(
+                    reference__icontains=reference[:10]  # First 10 chars
+                ).values_list('reference', flat=True)[:5]),
                 'recent_payments': list(Payment.objects.order_by('-created_at')[:5].values_list('reference', flat=True))
             }
-        }, status=status.HTTP_404_NOT_FOUND)
+        return Response(data, status=status.HTTP_404_NOT_FOUND)
     
     # Optionally refresh status from provider
     if payment.status in ['pending', 'processing']:
-        try:
-            payment_service = PaymentService()
-            result = payment_service.check_payment_status(payment)
-            
-            if result.get('success') and result.get('status'):
-                new_status = result.get('status')
-                if new_status != payment.status:
-                    payment.status = new_status
-                    if new_status in ['successful', 'failed', 'cancelled']:
-                        payment.processed_at = timezone.now()
-                    payment.save()
-                    payment.log('info', f'Status updated from provider check: {new_status}')
-                    
-        except Exception as e:
-            logger.error(f"Status check error for {reference}: {str(e)}")
+        refresh_payment_from_provider(payment)
     
     serializer = PaymentSerializer(payment)
     return Response(serializer.data)
 
+def refresh_payment_from_provider(payment):
+    """Ask the provider for the latest status and persist it if it changed"""
+    try:
+        result = check_payment_status(payment)
+        
+        if result.get('success') and result.get('status'):
+            new_status = result.get('status')
+            transition(payment, new_status, f'Status updated from provider check: {new_status}')
+                
+    except Exception as e:
+        logger.error(f"Status check error for {payment.reference}: {str(e)}")
+
+# Every waiting client holds a worker thread (see railway.toml), so keep
+# connections short and let EventSource / the long-poll loop reconnect
+STATUS_STREAM_MAX_SECONDS = 15
+STATUS_STREAM_HEARTBEAT_SECONDS = 5
+STATUS_LONG_POLL_MAX_SECONDS = 10
+STATUS_PROVIDER_REFRESH_SECONDS = 10
+
+def wait_for_payment_status_change(payment, known_status, timeout):
+    """
+    Wait up to ``timeout`` seconds for the payment to leave ``known_status``.
+    
+    Wakes on pushed changes and falls back to an occasional provider check for
+    payments that are still pending. Reloads ``payment`` and returns True on change.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        
+        changed = status_watcher.wait_for_change(
+            payment.reference, known_status, min(remaining, STATUS_PROVIDER_REFRESH_SECONDS)
+        )
+        if changed is None and known_status in ['pending', 'processing']:
+            refresh_payment_from_provider(payment)
+            changed = payment.status if payment.status != known_status else None
+        
+        if changed is not None:
+            payment.refresh_from_db()
+            return True
+
+def _status_event(payment):
+    data = json.dumps(PaymentSerializer(payment).data, cls=DjangoJSONEncoder)
+    return f"event: status\ndata: {data}\n\n"
+
+def _status_events(payment):
+    yield "retry: 3000\n\n"
+    yield _status_event(payment)
+    
+    deadline = time.monotonic() + STATUS_STREAM_MAX_SECONDS
+    while payment.status not in STREAM_FINAL_STATUSES and time.monotonic() < deadline:
+        if wait_for_payment_status_change(payment, payment.status, STATUS_STREAM_HEARTBEAT_SECONDS):
+            yield _status_event(payment)
+        else:
+            yield ": keepalive\n\n"
+
+@require_GET
+def payment_status_stream(request, reference):
+    """
+    Push payment status changes to the client.
+    
+    Streams Server-Sent Events by default. With ``?wait=<seconds>`` it long-polls
+    instead: the response is held until the status differs from ``?since=``
+    (or the status at request time) and then returns the payment as JSON.
+    """
+    payment = find_payment(reference, Payment.objects.select_related('provider'))
+    if payment is None:
+        return JsonResponse({'error': 'Payment not found', 'reference': reference}, status=404)
+    
+    if 'wait' in request.GET:
+        try:
+            wait = min(max(float(request.GET['wait']), 0), STATUS_LONG_POLL_MAX_SECONDS)
+        except ValueError:
+            return JsonResponse({'error': 'wait must be a number of seconds'}, status=400)
+        
+        since = request.GET.get('since', payment.status)
+        if payment.status == since and since not in STREAM_FINAL_STATUSES:
+            wait_for_payment_status_change(payment, since, wait)
+        return JsonResponse(PaymentSerializer(payment).data, encoder=DjangoJSONEncoder)
+    
+    response = StreamingHttpResponse(_status_events(payment), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @api_view(['POST'])
 @permission_classes([AllowAny])  # For demo purposes
 def complete_payment(request, reference):
@@ -244,12 +323,7 @@ def complete_payment(request, reference):
     if desired_status not in ['successful', 'failed', 'cancelled']:
         desired_status = 'successful'
     
-    if payment.status in ['pending', 'processing']:
-        payment.status = desired_status
-        payment.processed_at = timezone.now()
-        payment.save()
-        payment.log('info', f'Payment manually completed via API to {desired_status}')
-        
+    if transition(payment, desired_status, f'Payment manually completed via API to {desired_status}'):
         return Response({
             'success': True,
             'message': f'Payment {desired_status} successfully',
@@ -262,6 +336,20 @@ def complete_payment(request, reference):
             'payment': PaymentSerializer(payment).data
         }, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def quote_payment_fees(request):
+    """Quote processing fees for many amount/method/currency combinations at once"""
+    serializer = FeeQuoteRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    quotes = quote_fees(
+        (item['amount'], item['payment_method'], item['currency'])
+        for item in serializer.validated_data['quotes']
+    )
+    return Response({'success': True, 'quotes': quotes})
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def get_payment_methods(request):
@@ -326,6 +414,7 @@ def get_payment_methods(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])  # Changed for demo purposes
+@idempotent('checkout_payment')
 def checkout_payment(request):
     """Create payment during checkout process"""
     serializer = CheckoutPaymentSerializer(data=request.data)
@@ -353,9 +442,13 @@ def checkout_payment(request):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Create payment (handle anonymous users for demo)
+        # Demo mobile money providers are "initiated" immediately, so the
+        # payment is inserted already processing
+        demo_momo = provider.code in ['mtn_momo', 'vodafone_cash', 'airteltigo_money']
+        
+        # Build the payment (handle anonymous users for demo)
         user = request.user if request.user.is_authenticated else None
-        payment = Payment.objects.create(
+        payment = Payment(
             user=user,
             reference=reference,
             amount=validated_data['amount'],
@@ -366,49 +459,30 @@ def checkout_payment(request):
             description=validated_data.get('description', ''),
             booking=booking
         )
+        if demo_momo:
+            payment.external_reference = f"DEMO_{reference}"
+            payment.status = 'processing'
         
-        # Store appropriate booking details in payment metadata for admin display
+        # Assemble booking details for admin display before the INSERT
+        booking_data = request.data.get('booking_details', {})
         try:
-            booking_data = request.data.get('booking_details', {})
-            
-            # Check if this is a ticket payment
-            is_ticket_payment = (
-                payment.description and "Ticket Purchase:" in payment.description
-            ) or (booking_data and booking_data.get('type') == 'ticket')
-            
-            if is_ticket_payment:
-                # Use ticket-specific details storage
-                from .signals import store_ticket_details_in_payment
-                store_ticket_details_in_payment(payment)
-                logger.info(f"Stored ticket details for payment {payment.reference}")
-            elif booking_data:
+            is_ticket = bool(booking_data) and booking_data.get('type') == 'ticket'
+            converted_data = None
+            if booking_data and not is_ticket:
                 # Convert frontend booking data to backend format for destinations
-                from .booking_utils import store_booking_details_in_payment
                 converted_data = convert_frontend_booking_data(booking_data, payment)
-                store_booking_details_in_payment(payment, converted_data)
-                logger.info(f"Stored real-time booking details for payment {payment.reference}")
-            elif booking:
-                # Extract details from booking model (if available)
-                from .booking_utils import store_booking_details_in_payment, create_sample_booking_details
-                sample_data = create_sample_booking_details()
-                sample_data['final_total'] = float(payment.amount)
-                sample_data['base_total'] = float(payment.amount) * 0.7
-                sample_data['options_total'] = float(payment.amount) * 0.3
-                store_booking_details_in_payment(payment, sample_data)
-                logger.info(f"Stored booking model details for payment {payment.reference}")
-            else:
-                # For demo purposes, add sample destination booking details
-                from .booking_utils import store_booking_details_in_payment, create_sample_booking_details
-                sample_data = create_sample_booking_details()
-                sample_data['final_total'] = float(payment.amount)
-                sample_data['base_total'] = float(payment.amount) * 0.7
-                sample_data['options_total'] = float(payment.amount) * 0.3
-                store_booking_details_in_payment(payment, sample_data)
-                logger.info(f"Stored sample booking details for payment {payment.reference}")
+            attach_booking_details(payment, converted_data, is_ticket=is_ticket)
+            if is_ticket:
+                # Kept for the outbox worker, which creates the purchase once the payment succeeds
+                payment.metadata['ticket_order'] = {
+                    field: booking_data.get(field) for field in TICKET_ORDER_FIELDS if field in booking_data
+                }
         except Exception as e:
-            logger.error(f"Failed to store booking details for payment {payment.reference}: {str(e)}")
+            logger.error(f"Failed to build booking details for payment {payment.reference}: {str(e)}")
             # Continue with payment creation even if booking details fail
         
+        payment.save(force_insert=True)
+        
         # Handle different payment methods
         if provider.code == 'stripe':
             # For Stripe, create a Payment Intent
@@ -425,9 +499,8 @@ def checkout_payment(request):
             )
             
             if stripe_result['success']:
-                payment.external_reference = stripe_result['payment_intent'].stripe_payment_intent_id
-                payment.status = 'processing'
-                payment.save()
+                transition(payment, 'processing',
+                           external_reference=stripe_result['payment_intent'].stripe_payment_intent_id)
                 
                 return Response({
                     'success': True,
@@ -438,8 +511,7 @@ def checkout_payment(request):
                     }
                 }, status=status.HTTP_201_CREATED)
             else:
-                payment.status = 'failed'
-                payment.save()
+                transition(payment, 'failed')
                 return Response({
                     'success': False,
                     'error': stripe_result['error']
@@ -448,16 +520,12 @@ def checkout_payment(request):
         else:
             # For other providers (MTN MoMo, etc.)
             # For demo purposes, simulate successful initiation
-            if provider.code in ['mtn_momo', 'vodafone_cash', 'airteltigo_money']:
-                # Simulate successful mobile money initiation
-                payment.external_reference = f"DEMO_{payment.reference}"
-                payment.status = 'processing'
-                payment.save()
+            if demo_momo:
+                # Simulated mobile money initiation (status was set before the INSERT)
                 payment.log('info', 'Demo payment initiated successfully')
                 
                 # Start auto-completion for demo purposes
-                booking_details = request.data.get('booking_details', {})
-                if booking_details.get('type') == 'ticket':
+                if booking_data.get('type') == 'ticket':
                     # For ticket payments, auto-complete after 5 seconds with high success rate
                     auto_complete_payment_after_delay(payment.reference, delay_seconds=5, success_rate=0.99)
                     logger.info(f"Started auto-completion for ticket payment {payment.reference} (5s delay)")
@@ -477,10 +545,8 @@ def checkout_payment(request):
                 result = payment_service.initiate_payment(payment)
                 
                 if result.get('success'):
-                    payment.external_reference = result.get('external_reference', '')
-                    payment.status = 'processing'
-                    payment.save()
-                    payment.log('info', 'Payment initiated successfully', result)
+                    transition(payment, 'processing', 'Payment initiated successfully', result,
+                               external_reference=result.get('external_reference', ''))
                     
                     return Response({
                         'success': True,
@@ -488,9 +554,7 @@ def checkout_payment(request):
                         'message': result.get('message', 'Payment initiated successfully')
                     }, status=status.HTTP_201_CREATED)
                 else:
-                    payment.status = 'failed'
-                    payment.save()
-                    payment.log('error', 'Payment initiation failed', result)
+                    transition(payment, 'failed', 'Payment initiation failed', result, level='error')
                     
                     return Response({
                         'success': False,
@@ -512,39 +576,13 @@ def mtn_momo_webhook(request):
         webhook_data = request.data
         logger.info(f"MTN MoMo webhook received: {webhook_data}")
         
-        # Process webhook with MTN MoMo service
-        mtn_service = MTNMoMoService()
-        result = mtn_service.process_webhook(webhook_data)
-        
-        if result.get('success'):
-            external_id = result.get('external_id')
-            new_status = result.get('status')
-            
-            # Find payment by reference (external_id should match our payment reference)
-            try:
-                payment = Payment.objects.get(reference=external_id)
-                
-                # Update payment status if changed
-                if payment.status != new_status:
-                    old_status = payment.status
-                    payment.status = new_status
-                    
-                    if new_status in ['successful', 'failed', 'cancelled']:
-                        payment.processed_at = timezone.now()
-                    
-                    payment.save()
-                    payment.log('info', f'Status updated via MTN webhook: {old_status} -> {new_status}', result)
-                    
-                    logger.info(f"Payment {payment.reference} status updated: {old_status} -> {new_status}")
-                
-                return Response({'status': 'success'}, status=status.HTTP_200_OK)
-                
-            except Payment.DoesNotExist:
-                logger.warning(f"Payment not found for MTN webhook: {external_id}")
-                return Response({'status': 'payment_not_found'}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            logger.error(f"MTN webhook processing failed: {result.get('error')}")
+        if not webhook_data.get('externalId'):
+            logger.error("MTN webhook missing external ID")
             return Response({'status': 'error'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Acknowledge immediately; the webhook worker applies the status change
+        enqueue_webhook('mtn_momo', webhook_data)
+        return Response({'status': 'success'}, status=status.HTTP_200_OK)
             
     except Exception as e:
         logger.error(f"MTN MoMo webhook error: {str(e)}")
@@ -560,10 +598,7 @@ def simulate_payment_authorization(request, reference):
             # Simulate random success/failure (90% success rate)
             import random
             if random.random() > 0.1:  # 90% success rate
-                payment.status = 'successful'
-                payment.processed_at = timezone.now()
-                payment.save()
-                payment.log('info', 'Payment completed via demo authorization')
+                transition(payment, 'successful', 'Payment completed via demo authorization')
                 
                 return Response({
                     'success': True,
@@ -571,9 +606,7 @@ def simulate_payment_authorization(request, reference):
                     'payment': PaymentSerializer(payment).data
                 })
             else:
-                payment.status = 'failed'
-                payment.save()
-                payment.log('info', 'Payment failed via demo authorization')
+                transition(payment, 'failed', 'Payment failed via demo authorization')
                 
                 return Response({
                     'success': False,
@@ -607,10 +640,7 @@ def force_complete_payment(request, reference):
             desired_status = 'successful'
         
         old_status = payment.status
-        payment.status = desired_status
-        payment.processed_at = timezone.now()
-        payment.save()
-        payment.log('info', f'Payment force completed via API: {old_status} -> {desired_status}')
+        transition(payment, desired_status, f'Payment force completed via API: {old_status} -> {desired_status}', force=True)
         
         return Response({
             'success': True,
@@ -627,63 +657,16 @@ def force_complete_payment(request, reference):
 
 def auto_complete_payment_after_delay(payment_reference, delay_seconds=30, success_rate=0.9):
     """
-    Background task to auto-complete a payment after a delay (for demo purposes)
+    Schedule a payment to auto-complete after a delay (for demo purposes)
     """
-    def complete_payment_task():
-        try:
-            # Import Django modules inside the thread to ensure proper setup
-            from django.db import connection
-            from django.utils import timezone
-            import random
-            
-            # Wait for the specified delay
-            time.sleep(delay_seconds)
-            
-            # Close any existing database connections to avoid issues
-            connection.close()
-            
-            # Get the payment and check if it's still pending
-            try:
-                payment = Payment.objects.get(reference=payment_reference)
-                
-                if payment.status in ['pending', 'processing']:
-                    # Simulate success/failure based on success rate
-                    if random.random() < success_rate:
-                        # Success
-                        payment.status = 'successful'
-                        payment.processed_at = timezone.now()
-                        payment.save()
-                        payment.log('info', f'Auto-completed successfully after {delay_seconds}s delay')
-                        logger.info(f"Auto-completed payment {payment_reference} successfully")
-                    else:
-                        # Failure
-                        payment.status = 'failed'
-                        payment.processed_at = timezone.now()
-                        payment.save()
-                        payment.log('info', f'Auto-failed after {delay_seconds}s delay')
-                        logger.info(f"Auto-failed payment {payment_reference}")
-                else:
-                    logger.info(f"Payment {payment_reference} already processed, skipping auto-completion")
-                    
-            except Payment.DoesNotExist:
-                logger.warning(f"Payment {payment_reference} not found for auto-completion")
-                
-        except Exception as e:
-            logger.error(f"Error in auto-completion task for {payment_reference}: {str(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-        finally:
-            # Ensure database connection is closed
-            try:
-                from django.db import connection
-                connection.close()
-            except:
-                pass
+    try:
+        payment = Payment.objects.get(reference=payment_reference)
+    except Payment.DoesNotExist:
+        logger.warning(f"Payment {payment_reference} not found for auto-completion")
+        return
     
-    # Start the background task
-    thread = threading.Thread(target=complete_payment_task, daemon=True)
-    thread.start()
-    logger.info(f"Started auto-completion task for payment {payment_reference} (delay: {delay_seconds}s)")
+    schedule_transition(payment, delay_seconds=delay_seconds, success_rate=success_rate)
+    logger.info(f"Scheduled auto-completion for payment {payment_reference} (delay: {delay_seconds}s)")
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -747,36 +730,6 @@ def debug_payments(request):
         'payments': payments_data
     })
 
-def schedule_auto_completion_via_command(payment_reference, delay_seconds=30):
-    """
-    Alternative approach using management command (more reliable)
-    """
-    import subprocess
-    import os
-    
-    def run_command():
-        try:
-            time.sleep(delay_seconds)
-            # Run the management command
-            result = subprocess.run([
-                'python', 'manage.py', 'auto_complete_demo_payments',
-                '--timeout', '0',  # Process immediately
-                '--success-rate', '0.9'
-            ], cwd=os.path.dirname(os.path.dirname(__file__)), capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                logger.info(f"Auto-completion command completed for {payment_reference}")
-            else:
-                logger.error(f"Auto-completion command failed: {result.stderr}")
-                
-        except Exception as e:
-            logger.error(f"Error running auto-completion command: {str(e)}")
-    
-    # Start the background task
-    thread = threading.Thread(target=run_command, daemon=True)
-    thread.start()
-    logger.info(f"Scheduled auto-completion command for payment {payment_reference} (delay: {delay_seconds}s)")
-
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def add_booking_details_to_payment(request, reference):
@@ -887,77 +840,18 @@ def ensure_all_booking_details(request):
     API endpoint to ensure all payments have booking details
     """
     try:
-        # Find payments without booking details
-        payments_without_details = []
-        for payment in Payment.objects.all():
-            if not payment.metadata or 'booking_details' not in payment.metadata:
-                payments_without_details.append(payment)
+        from .backfill import backfill_booking_details
         
-        if not payments_without_details:
+        # Stream payments missing booking details in chunks and bulk-write them
+        updated_count = sum(backfill_booking_details(checkpoint=None))
+        
+        if not updated_count:
             return Response({
                 'success': True,
                 'message': 'All payments already have booking details',
                 'updated_count': 0
             })
         
-        # Add booking details to each payment
-        updated_count = 0
-        for payment in payments_without_details:
-            try:
-                # Use the same logic as the individual endpoint
-                from .booking_utils import store_booking_details_in_payment, create_sample_booking_details
-                
-                sample_data = create_sample_booking_details()
-                sample_data['final_total'] = float(payment.amount)
-                sample_data['base_total'] = float(payment.amount) * 0.65
-                sample_data['options_total'] = float(payment.amount) * 0.35
-                
-                # Customize based on amount
-                amount = float(payment.amount) if payment.amount else 0
-                if amount >= 1000:
-                    sample_data['destination_name'] = 'Northern Ghana Safari Experience'
-                    sample_data['destination_location'] = 'Northern Region, Ghana'
-                    sample_data['duration'] = '5 Days / 4 Nights'
-                    sample_data['adults'] = 3
-                    sample_data['children'] = 2
-                elif amount >= 500:
-                    sample_data['destination_name'] = 'Cape Coast Castle Heritage Tour'
-                    sample_data['destination_location'] = 'Cape Coast, Ghana'
-                    sample_data['duration'] = '3 Days / 2 Nights'
-                    sample_data['adults'] = 2
-                    sample_data['children'] = 1
-                elif amount >= 100:
-                    sample_data['destination_name'] = 'Kakum National Park Adventure'
-                    sample_data['destination_location'] = 'Central Region, Ghana'
-                    sample_data['duration'] = '2 Days / 1 Night'
-                    sample_data['adults'] = 2
-                    sample_data['children'] = 0
-                else:
-                    sample_data['destination_name'] = 'Local Cultural Experience'
-                    sample_data['destination_location'] = 'Accra, Ghana'
-                    sample_data['duration'] = '1 Day'
-                    sample_data['adults'] = 1
-                    sample_data['children'] = 0
-                
-                # Use actual user info if available
-                if payment.user:
-                    user_name = f"{payment.user.first_name} {payment.user.last_name}".strip()
-                    if not user_name:
-                        user_name = payment.user.username or "User"
-                    sample_data['user_name'] = user_name
-                    sample_data['user_email'] = payment.user.email or ''
-                
-                # Use actual phone number
-                if payment.phone_number:
-                    sample_data['user_phone'] = payment.phone_number
-                
-                # Store the booking details
-                store_booking_details_in_payment(payment, sample_data)
-                updated_count += 1
-                
-            except Exception as e:
-                logger.error(f"Failed to add booking details to payment {payment.reference}: {str(e)}")
-        
         return Response({
             'success': True,
             'message': f'Added booking details to {updated_count} payments',
@@ -1151,7 +1045,13 @@ def paystack_verify_payment(request, reference):
     """Verify a Paystack payment"""
     try:
         paystack_service = PaystackService()
-        result = paystack_service.verify_payment(reference)
+        result = coalesced_status_check('paystack', reference, lambda: paystack_service.verify_payment(reference))
+        
+        if result.get('rate_limited'):
+            return Response({
+                'success': False,
+                'error': result['error']
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
         
         if result['success']:
             # Update local payment status
@@ -1159,17 +1059,14 @@ def paystack_verify_payment(request, reference):
                 payment = Payment.objects.get(reference=reference)
                 transaction_data = result['data']
                 
-                if transaction_data['status'] == 'success':
-                    payment.status = 'successful'
-                    payment.processed_at = timezone.now()
-                elif transaction_data['status'] == 'failed':
-                    payment.status = 'failed'
-                    payment.processed_at = timezone.now()
-                
                 payment.metadata.update({
                     'paystack_verification': transaction_data
                 })
-                payment.save()
+                payment.save(update_fields=['metadata', 'updated_at'])
+                if transaction_data['status'] == 'success':
+                    transition(payment, 'successful')
+                elif transaction_data['status'] == 'failed':
+                    transition(payment, 'failed')
                 
                 payment.log('info', 'Payment verified with Paystack', transaction_data)
                 
@@ -1205,14 +1102,14 @@ def paystack_webhook(request):
             logger.warning("Paystack webhook received without signature")
             return Response({'status': 'error'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Process webhook
         paystack_service = PaystackService()
-        result = paystack_service.handle_webhook(request.data, signature)
-        
-        if result['success']:
-            return Response({'status': 'success'})
-        else:
+        if not paystack_service.verify_webhook_signature(request.data, signature):
+            logger.warning("Invalid Paystack webhook signature")
             return Response({'status': 'error'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Acknowledge immediately; the webhook worker applies the event
+        enqueue_webhook('paystack', request.data)
+        return Response({'status': 'success'})
             
     except Exception as e:
         logger.error(f"Paystack webhook error: {str(e)}")
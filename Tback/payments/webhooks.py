@@ -0,0 +1,189 @@
+"""
+Fast-ack ingestion and batched processing of provider webhooks.
+
+Webhook views only verify the request, derive a provider event id and append
+the raw payload to the WebhookEvent inbox with a single INSERT that ignores
+duplicates, then answer 200. A worker drains the inbox in batches, claiming
+rows with ``SELECT ... FOR UPDATE SKIP LOCKED``, and applies the status
+changes. Provider retries of an event that was already received are dropped
+by the (provider_code, event_id) unique constraint.
+"""
+import hashlib
+import json
+import logging
+import threading
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from .log_buffer import buffered_payment_logs
+from .models import Payment, PaymentProvider, WebhookEvent
+from .state import transition
+from .serializers import PaymentCallbackSerializer
+from .services import PaymentService
+from .mtn_momo_service import MTNMoMoService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_POLL_INTERVAL = 5.0
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def payload_digest(payload):
+    """Stable id for payloads that carry no event id of their own"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def webhook_event_id(provider_code, payload):
+    """Derive the provider's event id for a webhook payload"""
+    if provider_code == 'paystack':
+        data = payload.get('data') or {}
+        if data.get('id'):
+            return f"{payload.get('event')}:{data['id']}"
+    elif provider_code == 'mtn_momo':
+        if payload.get('externalId'):
+            return f"{payload['externalId']}:{payload.get('status', '')}:{payload.get('financialTransactionId', '')}"
+    return payload_digest(payload)
+
+
+def enqueue_webhook(provider_code, payload, event_id=None):
+    """Append a webhook to the inbox; duplicates of a received event are ignored"""
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(
+            provider_code=provider_code,
+            event_id=event_id or webhook_event_id(provider_code, payload),
+            payload=payload
+        )
+    ], ignore_conflicts=True)
+    transaction.on_commit(_wakeup.set)
+    ensure_worker()
+
+
+def _update_payment_status(payment, new_status, message, data):
+    if new_status:
+        transition(payment, new_status, message.format(old=payment.status, new=new_status), data)
+
+
+def handle_mtn_momo_event(event):
+    result = MTNMoMoService().process_webhook(event.payload)
+    if not result.get('success'):
+        return result
+    
+    try:
+        payment = Payment.objects.get(reference=result.get('external_id'))
+    except Payment.DoesNotExist:
+        return {'success': False, 'error': f"Payment not found: {result.get('external_id')}"}
+    
+    _update_payment_status(payment, result.get('status'), 'Status updated via MTN webhook: {old} -> {new}', result)
+    return {'success': True}
+
+
+def handle_paystack_event(event):
+    from .paystack_service import PaystackService
+    return PaystackService().process_event(event.payload)
+
+
+def handle_provider_callback(event):
+    """Generic provider callback (``callback/<provider_code>/``)"""
+    try:
+        provider = PaymentProvider.objects.get(code=event.provider_code, is_active=True)
+    except PaymentProvider.DoesNotExist:
+        return {'success': False, 'error': f'Unknown provider: {event.provider_code}'}
+    
+    payment_service = PaymentService()
+    payment_ref = payment_service.extract_payment_reference(provider, event.payload)
+    if not payment_ref:
+        return {'success': False, 'error': 'No payment reference in callback data'}
+    
+    try:
+        payment = Payment.objects.get(reference=payment_ref)
+    except Payment.DoesNotExist:
+        return {'success': False, 'error': f'Payment not found: {payment_ref}'}
+    
+    callback_serializer = PaymentCallbackSerializer(data={
+        'provider_reference': event.payload.get('reference', ''),
+        'status': event.payload.get('status', ''),
+        'callback_data': event.payload
+    })
+    if not callback_serializer.is_valid():
+        return {'success': False, 'error': str(callback_serializer.errors)}
+    callback = callback_serializer.save(payment=payment)
+    
+    result = payment_service.process_callback(payment, callback)
+    if not result.get('success'):
+        payment.log('warning', 'Callback processing failed', result)
+        return result
+    
+    _update_payment_status(payment, result.get('status'), 'Payment status updated to {new}', result)
+    callback.processed = True
+    callback.save(update_fields=['processed'])
+    return {'success': True}
+
+
+WEBHOOK_HANDLERS = {
+    'mtn_momo': handle_mtn_momo_event,
+    'paystack': handle_paystack_event,
+}
+
+
+def process_webhook_events(batch_size=DEFAULT_BATCH_SIZE):
+    """Claim and process one batch of pending webhook events, returning how many were claimed"""
+    with transaction.atomic(), buffered_payment_logs():
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+        
+        for event in events:
+            handler = WEBHOOK_HANDLERS.get(event.provider_code, handle_provider_callback)
+            event.attempts += 1
+            try:
+                with transaction.atomic():
+                    result = handler(event)
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            
+            if result.get('success'):
+                event.status = 'processed'
+                event.error = ''
+            else:
+                event.status = 'failed'
+                event.error = str(result.get('error') or result.get('message') or 'Processing failed')
+                logger.warning(f"Webhook event {event.pk} from {event.provider_code} failed: {event.error}")
+            event.processed_at = timezone.now()
+        
+        WebhookEvent.objects.bulk_update(events, ['status', 'attempts', 'error', 'processed_at'])
+    return len(events)
+
+
+def run_worker(stop_event=None, batch_size=DEFAULT_BATCH_SIZE, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Drain the webhook inbox until ``stop_event`` is set"""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        close_old_connections()
+        try:
+            if process_webhook_events(batch_size) >= batch_size:
+                continue
+        except Exception as e:
+            logger.error(f"Webhook worker error: {str(e)}")
+        
+        _wakeup.wait(poll_interval)
+        _wakeup.clear()
+
+
+def ensure_worker():
+    """Start the in-process inbox worker once, if autostart is enabled"""
+    global _worker
+    if not getattr(settings, 'PAYMENT_WEBHOOK_WORKER_AUTOSTART', True):
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run_worker, name='payment-webhook-worker', daemon=True)
+            _worker.start()
+            logger.info("Started payment webhook worker")
@@ -13,7 +13,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tback_api.settings')
 django.setup()
 
 from payments.models import Payment
-from django.utils import timezone
+from payments.state import transition
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,17 +33,11 @@ def auto_complete_single_payment(payment_reference, delay_seconds=30, success_ra
             # Simulate success/failure
             if random.random() < success_rate:
                 # Success
-                payment.status = 'successful'
-                payment.processed_at = timezone.now()
-                payment.save()
-                payment.log('info', f'Auto-completed successfully after {delay_seconds}s delay')
+                transition(payment, 'successful', f'Auto-completed successfully after {delay_seconds}s delay')
                 print(f"✅ Payment {payment_reference} completed successfully")
             else:
                 # Failure
-                payment.status = 'failed'
-                payment.processed_at = timezone.now()
-                payment.save()
-                payment.log('info', f'Auto-failed after {delay_seconds}s delay')
+                transition(payment, 'failed', f'Auto-failed after {delay_seconds}s delay')
                 print(f"❌ Payment {payment_reference} failed")
         else:
             print(f"⚠️ Payment {payment_reference} already processed ({payment.status})")
@@ -0,0 +1,125 @@
+"""
+Time-ordered, collision-free reference generator shared by payments and bookings.
+
+References are built Snowflake-style from the current time in milliseconds,
+a node id and a per-millisecond sequence, so they need no database
+round-trip or uniqueness retry, and later references sort after earlier ones
+(both as strings and in the unique index, which keeps inserts appending).
+
+That prefix is predictable, and public endpoints look payments up by
+reference alone, so every reference ends with random characters from
+``secrets``: 80 bits for payments and 25 for bookings (all that fits the
+20-character column). They come after the time-ordered part, so they do not
+affect ordering.
+
+Uniqueness across processes relies on every process having a distinct node
+id. Set REFERENCE_NODE_ID (0-1023) per process where that matters; otherwise
+one is derived from the host name and process id.
+"""
+import os
+import secrets
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+
+# Crockford base32: no ambiguous letters and ASCII order matches numeric order
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 10
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+PAYMENT_RANDOM_CHARS = 16
+BOOKING_RANDOM_CHARS = 5
+
+
+def encode_base32(value, width):
+    """Fixed-width Crockford base32 encoding of a non-negative integer"""
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    if value:
+        raise ValueError('Value does not fit in the requested width')
+    return ''.join(reversed(chars))
+
+
+def random_base32(width):
+    """Unpredictable Crockford base32 string of ``width`` characters"""
+    return ''.join(secrets.choice(ALPHABET) for _ in range(width))
+
+
+def default_node_id():
+    configured = getattr(settings, 'REFERENCE_NODE_ID', None)
+    if configured is not None:
+        return int(configured) & MAX_NODE
+    return (zlib.crc32(socket.gethostname().encode()) ^ os.getpid()) & MAX_NODE
+
+
+class ReferenceGenerator:
+    """Produces (millisecond, sequence) pairs that never repeat for a given node"""
+
+    def __init__(self, node_id=None, clock=None):
+        self.node_id = default_node_id() if node_id is None else node_id & MAX_NODE
+        self.pid = os.getpid()
+        self.clock = clock or (lambda: time.time_ns() // 1_000_000)
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            # Never step backwards if the wall clock does
+            now = max(self.clock(), self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond; wait for the next one
+                    while now <= self._last_ms:
+                        now = self.clock()
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return now, self._sequence
+
+    def _low_bits(self, sequence):
+        return (self.node_id << SEQUENCE_BITS) | sequence
+
+    def payment_reference(self):
+        """PAY-YYYYMMDDHHMMSS-XXXXXX-R..., where XXXXXX encodes millisecond, node and sequence and R... is random"""
+        ms, sequence = self.next_id()
+        stamp = datetime.fromtimestamp(ms // 1000, tz=dt_timezone.utc).strftime('%Y%m%d%H%M%S')
+        suffix = encode_base32(((ms % 1000) << (NODE_BITS + SEQUENCE_BITS)) | self._low_bits(sequence), 6)
+        return f"PAY-{stamp}-{suffix}-{random_base32(PAYMENT_RANDOM_CHARS)}"
+
+    def booking_reference(self):
+        """TN followed by 13 base32 characters of time, node and sequence and 5 random ones"""
+        ms, sequence = self.next_id()
+        value = ((ms - EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS)) | self._low_bits(sequence)
+        return f"TN{encode_base32(value, 13)}{random_base32(BOOKING_RANDOM_CHARS)}"
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    """Process-wide generator, created lazily so settings are read after startup"""
+    global _generator
+    if _generator is None or _generator.pid != os.getpid():
+        with _generator_lock:
+            if _generator is None or _generator.pid != os.getpid():
+                # Forked workers must not inherit the parent's node id and sequence
+                _generator = ReferenceGenerator()
+    return _generator
+
+
+def payment_reference():
+    return get_generator().payment_reference()
+
+
+def booking_reference():
+    return get_generator().booking_reference()
@@ -73,7 +73,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'payments.middleware.BookingDetailsMiddleware',
+    'payments.middleware.PaymentLogBufferMiddleware',
 ]
 
 ROOT_URLCONF = 'tback_api.urls'
@@ -106,6 +106,18 @@ DATABASES = {
     }
 }
 
+# Cache
+# Without REDIS_URL each process has its own in-memory cache, so nothing
+# cached is shared between worker processes
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -157,7 +169,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'authentication.token_cache.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -200,7 +212,9 @@ CORS_ALLOWED_HEADERS = [
     'pragma',
     'x-forwarded-for',
     'x-forwarded-proto',
+    'idempotency-key',
 ]
+CORS_ALLOW_HEADERS = CORS_ALLOWED_HEADERS  # Name read by django-cors-headers
 
 # Additional settings to prevent OpaqueResponseBlocking
 CORS_PREFLIGHT_MAX_AGE = 86400
@@ -208,6 +222,7 @@ CORS_EXPOSE_HEADERS = [
     'content-type',
     'x-csrftoken',
     'authorization',
+    'idempotent-replayed',
 ]
 
 # CSRF trusted origins for cross-domain requests
@@ -234,11 +249,29 @@ CSRF_FAILURE_VIEW = 'django.views.csrf.csrf_failure'  # Default CSRF failure vie
 # Custom user model
 AUTH_USER_MODEL = 'authentication.User'
 
+# Authentication caching
+AUTH_TOKEN_LOCAL_CACHE_SECONDS = int(os.getenv('AUTH_TOKEN_LOCAL_CACHE_SECONDS', '5'))  # How long each process trusts its own copy of a snapshot
+AUTH_TOKEN_CACHE_SECONDS = int(os.getenv('AUTH_TOKEN_CACHE_SECONDS', '300' if REDIS_URL else str(AUTH_TOKEN_LOCAL_CACHE_SECONDS)))  # How long token/user snapshots stay in the cache; only long when the cache is shared
+AUTH_TOKEN_LOCAL_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_LOCAL_CACHE_SIZE', '1024'))  # Snapshots kept per process (LRU)
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db' if REDIS_URL else 'django.contrib.sessions.backends.db')  # Cache-backed sessions need a shared cache, or logouts only reach one process
+
 # Payment settings
 PAYMENT_TIMEOUT = 30  # seconds
+PAYMENT_SCHEDULER_AUTOSTART = os.getenv('PAYMENT_SCHEDULER_AUTOSTART', 'True').lower() == 'true'  # In-process worker for scheduled transitions
+PAYMENT_WEBHOOK_WORKER_AUTOSTART = os.getenv('PAYMENT_WEBHOOK_WORKER_AUTOSTART', 'True').lower() == 'true'  # In-process webhook inbox worker
+PAYMENT_OUTBOX_WORKER_AUTOSTART = os.getenv('PAYMENT_OUTBOX_WORKER_AUTOSTART', 'True').lower() == 'true'  # In-process worker for payment fulfillment
+PAYMENT_LOG_MIN_LEVEL = os.getenv('PAYMENT_LOG_MIN_LEVEL', 'debug' if DEBUG else 'info')  # PaymentLog entries below this level are dropped
+PAYMENT_LOG_BUFFER_SIZE = int(os.getenv('PAYMENT_LOG_BUFFER_SIZE', '500'))  # Flush buffered PaymentLog entries early past this many
+PAYMENT_NOT_FOUND_CACHE_SECONDS = int(os.getenv('PAYMENT_NOT_FOUND_CACHE_SECONDS', '30'))  # How long unknown payment references are remembered
+PAYMENT_ARCHIVE_DIR = os.getenv('PAYMENT_ARCHIVE_DIR')  # Durable storage (e.g. a mounted volume) for monthly NDJSON archives; archiving refuses to run while unset
+PAYMENT_ARCHIVE_AFTER_DAYS = int(os.getenv('PAYMENT_ARCHIVE_AFTER_DAYS', '180'))  # Finalized payments older than this are archived
+REFERENCE_NODE_ID = os.getenv('REFERENCE_NODE_ID')  # Unique 0-1023 per process for payment/booking references; derived from host and pid when unset
 BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
 SITE_NAME = os.getenv('SITE_NAME', 'Trails & Trails')
 
+# Tickets settings
+TICKETS_DASHBOARD_CACHE_SECONDS = int(os.getenv('TICKETS_DASHBOARD_CACHE_SECONDS', '60'))  # How long the tickets admin dashboard figures are cached
+
 # Stripe settings removed - using MTN MoMo only
 
 # MTN Mobile Money settings
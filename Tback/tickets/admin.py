@@ -5,13 +5,16 @@ from django.utils.safestring import mark_safe
 from django.http import HttpResponse
 from django.template.response import TemplateResponse
 from django.db.models import Count, Sum, Q
-from django.utils import timezone
-from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from .revenue import revenue_since
 from .models import (
     TicketCategory, Venue, Ticket, TicketPurchase, 
     TicketCode, TicketReview, TicketPromoCode
 )
 
+DASHBOARD_CACHE_KEY = 'tickets:admin_dashboard'
+
 @admin.register(TicketCategory)
 class TicketCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'category_type', 'tickets_count', 'is_active', 'order', 'created_at')
@@ -34,9 +37,13 @@ class TicketCategoryAdmin(admin.ModelAdmin):
         })
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(ticket_count=Count('tickets'))
+    
     def tickets_count(self, obj):
-        return obj.tickets.count()
+        return obj.ticket_count
     tickets_count.short_description = 'Tickets'
+    tickets_count.admin_order_field = 'ticket_count'
 
 @admin.register(Venue)
 class VenueAdmin(admin.ModelAdmin):
@@ -68,9 +75,13 @@ class VenueAdmin(admin.ModelAdmin):
         })
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(ticket_count=Count('tickets'))
+    
     def tickets_count(self, obj):
-        return obj.tickets.count()
+        return obj.ticket_count
     tickets_count.short_description = 'Tickets'
+    tickets_count.admin_order_field = 'ticket_count'
 
 class TicketCodeInline(admin.TabularInline):
     model = TicketCode
@@ -188,7 +199,9 @@ class TicketPurchaseAdmin(admin.ModelAdmin):
     )
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('ticket', 'user').prefetch_related('ticket_codes')
+        return super().get_queryset(request).select_related('ticket', 'user').annotate(
+            ticket_code_count=Count('ticket_codes')
+        )
     
     def purchase_id_short(self, obj):
         return f"{str(obj.purchase_id)[:8]}..."
@@ -240,7 +253,7 @@ class TicketPurchaseAdmin(admin.ModelAdmin):
     payment_status_badge.short_description = 'Payment'
     
     def ticket_codes_count(self, obj):
-        count = obj.ticket_codes.count()
+        count = obj.ticket_code_count
         if count > 0:
             return format_html(
                 '<span style="background-color: #3498db; color: white; padding: 2px 6px; border-radius: 10px; font-size: 10px;">{}</span>',
@@ -248,6 +261,7 @@ class TicketPurchaseAdmin(admin.ModelAdmin):
             )
         return '-'
     ticket_codes_count.short_description = 'Codes'
+    ticket_codes_count.admin_order_field = 'ticket_code_count'
     
     def mark_as_confirmed(self, request, queryset):
         updated = queryset.update(status='confirmed')
@@ -415,6 +429,53 @@ class TicketPromoCodeAdmin(admin.ModelAdmin):
         else:
             return f"GH₵{obj.discount_value}"
     discount_display.short_description = 'Discount'
+
+def dashboard_stats():
+    """
+    Ticket dashboard figures, cached for TICKETS_DASHBOARD_CACHE_SECONDS.
+    
+    Each model is summarised with a single conditional-aggregation query and
+    weekly revenue is read from the daily revenue rollup.
+    """
+    stats = cache.get(DASHBOARD_CACHE_KEY)
+    if stats is not None:
+        return stats
+    
+    purchases = TicketPurchase.objects.aggregate(
+        total_purchases=Count('id'),
+        confirmed_purchases=Count('id', filter=Q(status='confirmed')),
+        pending_purchases=Count('id', filter=Q(status='pending')),
+        total_revenue=Sum('total_amount', filter=Q(payment_status='completed')),
+    )
+    tickets = Ticket.objects.aggregate(
+        total_tickets=Count('id'),
+        active_tickets=Count('id', filter=Q(status='published')),
+        sold_out_tickets=Count('id', filter=Q(available_quantity=0)),
+    )
+    codes = TicketCode.objects.aggregate(
+        total_codes=Count('id'),
+        used_codes=Count('id', filter=Q(status='used')),
+        active_codes=Count('id', filter=Q(status='active')),
+    )
+    
+    stats = {
+        **purchases,
+        **tickets,
+        **codes,
+        'total_revenue': purchases['total_revenue'] or 0,
+        'weekly_revenue': revenue_since(7),
+        'popular_tickets': list(
+            Ticket.objects.select_related('category').annotate(
+                purchase_count=Count('purchases')
+            ).order_by('-purchase_count')[:5]
+        ),
+        'recent_purchases': list(
+            TicketPurchase.objects.select_related('ticket', 'user').order_by('-created_at')[:10]
+        ),
+    }
+    cache.set(DASHBOARD_CACHE_KEY, stats, getattr(settings, 'TICKETS_DASHBOARD_CACHE_SECONDS', 60))
+    return stats
+
 # Custom Admin Site for Tickets
 class TicketsAdminSite(admin.AdminSite):
     site_header = "Tickets Administration"
@@ -430,61 +491,9 @@ class TicketsAdminSite(admin.AdminSite):
     
     def dashboard_view(self, request):
         """Custom dashboard view with ticket statistics"""
-        # Get date ranges
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        # Purchase statistics
-        total_purchases = TicketPurchase.objects.count()
-        confirmed_purchases = TicketPurchase.objects.filter(status='confirmed').count()
-        pending_purchases = TicketPurchase.objects.filter(status='pending').count()
-        
-        # Revenue statistics
-        total_revenue = TicketPurchase.objects.filter(
-            payment_status='completed'
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        weekly_revenue = TicketPurchase.objects.filter(
-            payment_status='completed',
-            created_at__gte=week_ago
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        # Ticket statistics
-        total_tickets = Ticket.objects.count()
-        active_tickets = Ticket.objects.filter(status='active').count()
-        sold_out_tickets = Ticket.objects.filter(available_quantity=0).count()
-        
-        # Popular tickets
-        popular_tickets = Ticket.objects.annotate(
-            purchase_count=Count('ticketpurchase')
-        ).order_by('-purchase_count')[:5]
-        
-        # Recent purchases
-        recent_purchases = TicketPurchase.objects.select_related(
-            'ticket', 'user'
-        ).order_by('-created_at')[:10]
-        
-        # Ticket codes statistics
-        total_codes = TicketCode.objects.count()
-        used_codes = TicketCode.objects.filter(status='used').count()
-        active_codes = TicketCode.objects.filter(status='active').count()
-        
         context = {
             'title': 'Tickets Dashboard',
-            'total_purchases': total_purchases,
-            'confirmed_purchases': confirmed_purchases,
-            'pending_purchases': pending_purchases,
-            'total_revenue': total_revenue,
-            'weekly_revenue': weekly_revenue,
-            'total_tickets': total_tickets,
-            'active_tickets': active_tickets,
-            'sold_out_tickets': sold_out_tickets,
-            'popular_tickets': popular_tickets,
-            'recent_purchases': recent_purchases,
-            'total_codes': total_codes,
-            'used_codes': used_codes,
-            'active_codes': active_codes,
+            **dashboard_stats(),
         }
         
         return TemplateResponse(request, 'admin/tickets/dashboard.html', context)
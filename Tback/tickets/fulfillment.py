@@ -0,0 +1,104 @@
+"""
+Ticket fulfillment for successful payments.
+
+Run by the payments outbox worker once a ticket payment becomes successful,
+and safe to run more than once: the purchase is found by its payment
+reference (or created from the order stored on the payment at checkout),
+confirmed if it is not already, and given codes only if it has none.
+Purchase payment references are unique, so when the direct purchase
+endpoint creates the purchase first, fulfillment picks up that one. A
+ticket that is no longer on sale or has too few tickets left raises
+TicketUnavailable, which no retry can fix.
+"""
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Ticket, TicketPurchase, TicketCode
+
+logger = logging.getLogger(__name__)
+
+
+class TicketUnavailable(Exception):
+    """The ordered tickets can no longer be issued"""
+
+
+def generate_ticket_codes(purchase):
+    """Generate ticket codes for a purchase"""
+    codes = []
+    for i in range(purchase.quantity):
+        code = TicketCode.objects.create(
+            purchase=purchase,
+            status='active'
+        )
+        codes.append(code)
+    return codes
+
+
+def create_purchase_for_payment(payment, order):
+    """
+    Create the pending TicketPurchase described by a checkout ``ticket_order``.
+    
+    If another request created the payment's purchase first, that one is
+    returned and ticket availability is left alone. Raises TicketUnavailable,
+    creating nothing, when the ticket is unpublished or sold out.
+    """
+    ticket = Ticket.objects.filter(id=order['ticket_id']).first()
+    quantity = max(int(order.get('quantity') or 1), 1)
+    if ticket is None or ticket.status != 'published':
+        raise TicketUnavailable(f"Ticket {order['ticket_id']} is not on sale")
+
+    with transaction.atomic():
+        try:
+            # Only the duplicate insert is treated as "created by someone else"
+            with transaction.atomic():
+                purchase = TicketPurchase.objects.create(
+                    ticket=ticket,
+                    user=payment.user,
+                    quantity=quantity,
+                    unit_price=payment.amount / quantity,
+                    total_amount=payment.amount,
+                    customer_name=order.get('customer_name', ''),
+                    customer_email=order.get('customer_email', ''),
+                    customer_phone=order.get('customer_phone', ''),
+                    payment_method=payment.payment_method,
+                    payment_reference=payment.reference,
+                    status='pending'
+                )
+        except IntegrityError:
+            return TicketPurchase.objects.get(payment_reference=payment.reference)
+
+        reserved = Ticket.objects.filter(pk=ticket.pk, available_quantity__gte=quantity).update(
+            available_quantity=F('available_quantity') - quantity
+        )
+        if not reserved:
+            # Rolls back the purchase created above
+            raise TicketUnavailable(f"Not enough tickets left for {ticket.title} (ordered {quantity})")
+    return purchase
+
+
+def fulfill_ticket_payment(payment):
+    """
+    Confirm the TicketPurchase for a successful payment and issue its codes.
+
+    Returns the purchase, or None when the payment carries no ticket order
+    and no purchase references it. Call inside a transaction holding the
+    payment row so concurrent fulfillment of one payment is serialized.
+    """
+    purchase = TicketPurchase.objects.filter(payment_reference=payment.reference).first()
+    if purchase is None:
+        order = (payment.metadata or {}).get('ticket_order') or {}
+        if not order.get('ticket_id') or payment.user_id is None:
+            logger.warning(f"No ticket order to fulfil for payment {payment.reference}")
+            return None
+        purchase = create_purchase_for_payment(payment, order)
+
+    if purchase.status != 'confirmed' or purchase.payment_status != 'completed':
+        purchase.status = 'confirmed'
+        purchase.payment_status = 'completed'
+        purchase.payment_date = payment.processed_at or timezone.now()
+        purchase.save()
+
+    if not purchase.ticket_codes.exists():
+        generate_ticket_codes(purchase)
+    return purchase
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from tickets.revenue import rebuild_revenue_rollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily ticket revenue rollup from ticket purchases'
+    
+    def handle(self, *args, **options):
+        self.stdout.write('🔄 Rebuilding daily ticket revenue...')
+        days = rebuild_revenue_rollup()
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt ticket revenue for {days} days'))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0002_ticketrevenuedaily'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticketpurchase',
+            index=models.Index(fields=['status', 'created_at'], name='tickets_tic_status_1b7c03_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_duplicate_payment_references(apps, schema_editor):
+    """Keep the first purchase per payment reference and suffix the others so they stay traceable"""
+    TicketPurchase = apps.get_model('tickets', 'TicketPurchase')
+    duplicated = (
+        TicketPurchase.objects.exclude(payment_reference='').values('payment_reference')
+        .annotate(count=Count('id')).filter(count__gt=1).values_list('payment_reference', flat=True)
+    )
+    for reference in list(duplicated):
+        for purchase in TicketPurchase.objects.filter(payment_reference=reference).order_by('id')[1:]:
+            suffix = f':dup:{purchase.pk}'
+            purchase.payment_reference = reference[:100 - len(suffix)] + suffix
+            purchase.save(update_fields=['payment_reference'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0003_ticketpurchase_status_created_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_duplicate_payment_references, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ticketpurchase',
+            constraint=models.UniqueConstraint(condition=models.Q(('payment_reference', ''), _negated=True), fields=('payment_reference',), name='unique_ticket_purchase_payment_reference'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from decimal import Decimal
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def seed_ticket_revenue_daily(apps, schema_editor):
+    """Roll up completed purchases made before the rollup was maintained by signals"""
+    TicketPurchase = apps.get_model('tickets', 'TicketPurchase')
+    TicketRevenueDaily = apps.get_model('tickets', 'TicketRevenueDaily')
+    rows = TicketPurchase.objects.filter(payment_status='completed').order_by().annotate(
+        day=TruncDate('created_at')
+    ).values('day').annotate(revenue=Sum('total_amount'), purchases=Count('id'))
+
+    TicketRevenueDaily.objects.all().delete()
+    TicketRevenueDaily.objects.bulk_create([
+        TicketRevenueDaily(date=row['day'], revenue=row['revenue'] or Decimal('0'), purchases=row['purchases'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_ticketpurchase_unique_payment_reference'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_ticket_revenue_daily, migrations.RunPython.noop),
+    ]
@@ -241,6 +241,15 @@ class TicketPurchase(models.Model):
             models.Index(fields=['ticket', 'status']),
             models.Index(fields=['payment_status']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            # One purchase per payment, however many paths try to fulfil it
+            models.UniqueConstraint(
+                fields=['payment_reference'],
+                condition=~models.Q(payment_reference=''),
+                name='unique_ticket_purchase_payment_reference'
+            ),
         ]
     
     def __str__(self):
@@ -397,4 +406,18 @@ class TicketPromoCode(models.Model):
         else:
             discount = self.discount_value
         
-        return min(discount, amount)  # Discount cannot exceed the total amount
\ No newline at end of file
+        return min(discount, amount)  # Discount cannot exceed the total amount
+
+class TicketRevenueDaily(models.Model):
+    """Completed ticket revenue rolled up per purchase day, maintained incrementally by signals"""
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    purchases = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Ticket revenue (daily)'
+    
+    def __str__(self):
+        return f"{self.date}: GH₵{self.revenue} ({self.purchases} purchases)"
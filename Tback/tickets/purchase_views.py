@@ -3,7 +3,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.conf import settings
 from datetime import timedelta
@@ -12,12 +12,29 @@ import uuid
 
 from .models import Ticket, TicketPurchase, TicketCode
 from .serializers import TicketPurchaseSerializer, TicketListSerializer
+from .fulfillment import generate_ticket_codes
 from authentication.models import User
+from payments.idempotency import idempotent
 
 logger = logging.getLogger(__name__)
 
+def _existing_purchase_response(purchase, user):
+    if purchase.user_id != user.pk:
+        # Payment references are shared with the browser; never hand out another customer's purchase
+        return Response({
+            'success': False,
+            'error': 'Purchase not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'success': True,
+        'message': 'Ticket purchase completed successfully',
+        'purchase': TicketPurchaseSerializer(purchase).data,
+        'payment_reference': purchase.payment_reference
+    }, status=status.HTTP_201_CREATED)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])  # Require authentication for purchases
+@idempotent('create_ticket_purchase')
 def create_ticket_purchase(request):
     """Create a ticket purchase directly (separate from Payment model)"""
     try:
@@ -33,6 +50,13 @@ def create_ticket_purchase(request):
         
         ticket = get_object_or_404(Ticket, id=ticket_id, status='published')
         
+        # Paid checkouts are fulfilled by the payments outbox worker; return its purchase
+        payment_reference = data.get('payment_reference')
+        if payment_reference:
+            existing = TicketPurchase.objects.filter(payment_reference=payment_reference).first()
+            if existing is not None:
+                return _existing_purchase_response(existing, request.user)
+        
         # Validate quantity
         quantity = int(data.get('quantity', 1))
         if quantity < ticket.min_purchase or quantity > ticket.max_purchase:
@@ -71,20 +95,28 @@ def create_ticket_purchase(request):
         
         # Create ticket purchase
         with transaction.atomic():
-            purchase = TicketPurchase.objects.create(
-                ticket=ticket,
-                user=user,
-                quantity=quantity,
-                unit_price=unit_price,
-                total_amount=total_amount - discount_applied,
-                discount_applied=discount_applied,
-                customer_name=data.get('customer_name', ''),
-                customer_email=data.get('customer_email', ''),
-                customer_phone=data.get('customer_phone', ''),
-                payment_method=data.get('payment_method', 'momo'),
-                special_requests=data.get('special_requests', ''),
-                status='pending'  # Start as pending
-            )
+            try:
+                # The reference is unique, so this fails if the outbox worker created the purchase meanwhile
+                with transaction.atomic():
+                    purchase = TicketPurchase.objects.create(
+                        ticket=ticket,
+                        user=user,
+                        quantity=quantity,
+                        unit_price=unit_price,
+                        total_amount=total_amount - discount_applied,
+                        discount_applied=discount_applied,
+                        customer_name=data.get('customer_name', ''),
+                        customer_email=data.get('customer_email', ''),
+                        customer_phone=data.get('customer_phone', ''),
+                        payment_method=data.get('payment_method', 'momo'),
+                        payment_reference=payment_reference or '',
+                        special_requests=data.get('special_requests', ''),
+                        status='pending'  # Start as pending
+                    )
+            except IntegrityError:
+                return _existing_purchase_response(
+                    TicketPurchase.objects.get(payment_reference=payment_reference), request.user
+                )
             
             # Update ticket availability
             ticket.available_quantity -= quantity
@@ -92,7 +124,6 @@ def create_ticket_purchase(request):
             
             # Handle payment reference and processing
             payment_method = data.get('payment_method', 'momo')
-            payment_reference = data.get('payment_reference')
             
             if payment_method in ['momo', 'mtn_momo', 'vodafone_cash', 'airteltigo_money']:
                 # Use provided payment reference if available, otherwise create one
@@ -155,17 +186,6 @@ def create_ticket_purchase(request):
             'error': 'An error occurred while processing your ticket purchase'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def generate_ticket_codes(purchase):
-    """Generate ticket codes for a purchase"""
-    codes = []
-    for i in range(purchase.quantity):
-        code = TicketCode.objects.create(
-            purchase=purchase,
-            status='active'
-        )
-        codes.append(code)
-    return codes
-
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def ticket_purchase_status(request, purchase_id):
@@ -0,0 +1,71 @@
+"""
+Maintenance of the daily ticket revenue rollup
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Sum, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import TicketPurchase, TicketRevenueDaily
+
+RevenueState = namedtuple('RevenueState', ['date', 'amount'])
+
+
+def _as_decimal(value):
+    # Views sometimes assign floats to amount fields before saving
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+
+def revenue_state(purchase):
+    """The (day, amount) a purchase contributes to the rollup, or None if it contributes nothing"""
+    if purchase.payment_status != 'completed' or purchase.created_at is None:
+        return None
+    return RevenueState(timezone.localdate(purchase.created_at), _as_decimal(purchase.total_amount))
+
+
+def add_to_day(date, revenue, purchases):
+    """Apply a revenue/purchase-count delta to one day's rollup row"""
+    changes = {
+        'revenue': F('revenue') + revenue,
+        'purchases': F('purchases') + purchases,
+        'updated_at': timezone.now()
+    }
+    if not TicketRevenueDaily.objects.filter(date=date).update(**changes):
+        TicketRevenueDaily.objects.bulk_create([TicketRevenueDaily(date=date)], ignore_conflicts=True)
+        TicketRevenueDaily.objects.filter(date=date).update(**changes)
+
+
+def apply_revenue_change(old, new):
+    """Update the rollup for a purchase moving from state ``old`` to ``new`` (either may be None)"""
+    if old == new:
+        return
+    if old:
+        add_to_day(old.date, -old.amount, -1)
+    if new:
+        add_to_day(new.date, new.amount, 1)
+
+
+def revenue_since(days):
+    """Completed ticket revenue over the last ``days`` days, read from the rollup"""
+    start = timezone.localdate() - timedelta(days=days)
+    return TicketRevenueDaily.objects.filter(date__gte=start).aggregate(
+        total=Sum('revenue')
+    )['total'] or Decimal('0')
+
+
+def rebuild_revenue_rollup():
+    """Recompute every rollup row from TicketPurchase, returning the number of days written"""
+    rows = TicketPurchase.objects.filter(payment_status='completed').order_by().annotate(
+        day=TruncDate('created_at')
+    ).values('day').annotate(revenue=Sum('total_amount'), purchases=Count('id'))
+    
+    days = [
+        TicketRevenueDaily(date=row['day'], revenue=row['revenue'] or Decimal('0'), purchases=row['purchases'])
+        for row in rows
+    ]
+    with transaction.atomic():
+        TicketRevenueDaily.objects.all().delete()
+        TicketRevenueDaily.objects.bulk_create(days)
+    return len(days)
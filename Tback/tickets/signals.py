@@ -0,0 +1,26 @@
+"""
+Django signals that keep the daily ticket revenue rollup up to date
+"""
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from .models import TicketPurchase
+from .revenue import revenue_state, apply_revenue_change
+
+
+@receiver(post_init, sender=TicketPurchase)
+def remember_revenue_state(sender, instance, **kwargs):
+    instance._revenue_state = revenue_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=TicketPurchase)
+def update_revenue_for_purchase(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = revenue_state(instance)
+    apply_revenue_change(None if created else instance._revenue_state, new_state)
+    instance._revenue_state = new_state
+
+
+@receiver(post_delete, sender=TicketPurchase)
+def update_revenue_for_deleted_purchase(sender, instance, **kwargs):
+    apply_revenue_change(instance._revenue_state, None)
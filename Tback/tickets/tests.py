@@ -1,3 +1,159 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .admin import dashboard_stats
+from .models import TicketCategory, Venue, Ticket, TicketPurchase, TicketCode, TicketRevenueDaily
+from .revenue import rebuild_revenue_rollup
 
-# Create your tests here.
+User = get_user_model()
+
+
+class AdminChangelistQueryBudgetTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpass123'
+        )
+        self.client.force_login(self.admin)
+        self.sequence = 0
+    
+    def _add_rows(self, count):
+        now = timezone.now()
+        for _ in range(count):
+            self.sequence += 1
+            n = self.sequence
+            category = TicketCategory.objects.create(name=f'Category {n}', slug=f'category-{n}', category_type='event')
+            venue = Venue.objects.create(
+                name=f'Venue {n}', slug=f'venue-{n}', address='Accra', city='Accra', region='Greater Accra'
+            )
+            ticket = Ticket.objects.create(
+                title=f'Event {n}',
+                slug=f'event-{n}',
+                category=category,
+                venue=venue,
+                description='Live show',
+                price=Decimal('50.00'),
+                total_quantity=100,
+                available_quantity=100,
+                event_date=now + timedelta(days=10),
+                sale_start_date=now - timedelta(days=1),
+                sale_end_date=now + timedelta(days=9),
+                status='published'
+            )
+            purchase = TicketPurchase.objects.create(
+                ticket=ticket,
+                user=self.admin,
+                quantity=2,
+                unit_price=Decimal('50.00'),
+                total_amount=Decimal('100.00'),
+                customer_name='Admin',
+                customer_email='admin@example.com'
+            )
+            TicketCode.objects.create(purchase=purchase, code=f'CODE-{n}-A')
+            TicketCode.objects.create(purchase=purchase, code=f'CODE-{n}-B')
+    
+    def _changelist_queries(self, url_name, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+    
+    def test_count_columns_do_not_query_per_row(self):
+        url_names = [
+            'admin:tickets_ticketcategory_changelist',
+            'admin:tickets_venue_changelist',
+            'admin:tickets_ticketpurchase_changelist',
+        ]
+        self._add_rows(2)
+        small = {url_name: self._changelist_queries(url_name) for url_name in url_names}
+        
+        self._add_rows(10)
+        for url_name in url_names:
+            self.assertEqual(self._changelist_queries(url_name), small[url_name], url_name)
+    
+    def test_count_columns_are_sortable(self):
+        self._add_rows(3)
+        busiest = TicketCategory.objects.get(name='Category 2')
+        Ticket.objects.filter(category__name='Category 3').update(category=busiest)
+        url = reverse('admin:tickets_ticketcategory_changelist')
+        
+        column = self.client.get(url).context['cl'].list_display.index('tickets_count')
+        response = self.client.get(url, {'o': f'-{column}'})
+        
+        counts = [category.ticket_count for category in response.context['cl'].result_list]
+        self.assertEqual(counts, [2, 1, 0])
+
+
+class TicketsDashboardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpass123')
+        now = timezone.now()
+        category = TicketCategory.objects.create(name='Concerts', slug='concerts', category_type='event')
+        self.ticket = Ticket.objects.create(
+            title='Highlife Evening',
+            slug='highlife-evening',
+            category=category,
+            description='Live band',
+            price=Decimal('80.00'),
+            total_quantity=50,
+            available_quantity=50,
+            event_date=now + timedelta(days=5),
+            sale_start_date=now - timedelta(days=1),
+            sale_end_date=now + timedelta(days=4),
+            status='published'
+        )
+    
+    def _purchase(self, amount, payment_status='completed'):
+        return TicketPurchase.objects.create(
+            ticket=self.ticket,
+            user=self.user,
+            quantity=1,
+            unit_price=Decimal(amount),
+            total_amount=Decimal(amount),
+            customer_name='Buyer',
+            customer_email='buyer@example.com',
+            payment_status=payment_status
+        )
+    
+    def test_rollup_tracks_purchase_changes(self):
+        self._purchase('80.00')
+        pending = self._purchase('40.00', payment_status='pending')
+        pending.payment_status = 'completed'
+        pending.save()
+        
+        day = TicketRevenueDaily.objects.get()
+        self.assertEqual(day.revenue, Decimal('120.00'))
+        self.assertEqual(day.purchases, 2)
+        
+        pending.delete()
+        day.refresh_from_db()
+        self.assertEqual(day.revenue, Decimal('80.00'))
+        
+        TicketRevenueDaily.objects.all().delete()
+        self.assertEqual(rebuild_revenue_rollup(), 1)
+        self.assertEqual(TicketRevenueDaily.objects.get().revenue, Decimal('80.00'))
+    
+    def test_dashboard_is_one_query_per_model_and_cached(self):
+        self._purchase('80.00')
+        self._purchase('40.00', payment_status='pending')
+        
+        # Purchases, tickets, codes, weekly rollup, popular and recent lists
+        with self.assertNumQueries(6):
+            stats = dashboard_stats()
+        with self.assertNumQueries(0):
+            dashboard_stats()
+        
+        self.assertEqual(stats['total_purchases'], 2)
+        self.assertEqual(stats['pending_purchases'], 2)
+        self.assertEqual(stats['total_revenue'], Decimal('80.00'))
+        self.assertEqual(stats['weekly_revenue'], Decimal('80.00'))
+        self.assertEqual(stats['active_tickets'], 1)
+        self.assertEqual(stats['popular_tickets'][0].purchase_count, 2)
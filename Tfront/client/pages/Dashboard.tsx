@@ -45,6 +45,8 @@ const Dashboard: React.FC = () => {
   const { user, logout } = useAuth();
   const [overview, setOverview] = useState<DashboardOverview | null>(null);
   const [bookings, setBookings] = useState<DashboardBooking[]>([]);
+  const [bookingsCursor, setBookingsCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [activities, setActivities] = useState<DashboardActivity[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
@@ -84,7 +86,8 @@ const Dashboard: React.FC = () => {
 
       if (bookingsRes.ok) {
         const bookingsData = await bookingsRes.json();
-        setBookings(bookingsData);
+        setBookings(bookingsData.results);
+        setBookingsCursor(bookingsData.next_cursor);
       }
 
       if (activitiesRes.ok) {
@@ -100,6 +103,36 @@ const Dashboard: React.FC = () => {
     }
   };
 
+  const loadMoreBookings = async () => {
+    const token = localStorage.getItem('token');
+    if (!token || !bookingsCursor) {
+      return;
+    }
+
+    try {
+      setLoadingMore(true);
+      const response = await fetch(
+        `http://localhost:8000/api/dashboard/bookings/?cursor=${encodeURIComponent(bookingsCursor)}`,
+        {
+          headers: {
+            'Authorization': `Bearer ${token}`,
+            'Content-Type': 'application/json',
+          },
+        }
+      );
+
+      if (response.ok) {
+        const data = await response.json();
+        setBookings((previous) => [...previous, ...data.results]);
+        setBookingsCursor(data.next_cursor);
+      }
+    } catch (err) {
+      console.error('Error loading more bookings:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (!user) {
     return null;
   }
@@ -330,6 +363,13 @@ const Dashboard: React.FC = () => {
                       </div>
                     </div>
                   )}
+                  {bookingsCursor && (
+                    <div className="text-center">
+                      <Button variant="outline" onClick={loadMoreBookings} disabled={loadingMore}>
+                        {loadingMore ? 'Loading...' : 'Load more bookings'}
+                      </Button>
+                    </div>
+                  )}
                 </div>
               </CardContent>
             </Card>
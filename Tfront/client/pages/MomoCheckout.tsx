@@ -148,6 +148,58 @@ export default function MomoCheckout() {
     setStatusMessage('Checking payment status...');
     setPollingAttempts(0);
     
+    // Returns true once the payment has reached a final status
+    const handlePaymentUpdate = (payment: any): boolean => {
+      if (payment.status === 'successful') {
+        // Payment completed successfully
+        setStatusMessage('Payment completed successfully! 🎉');
+        
+        // Wait a moment then redirect
+        setTimeout(() => {
+          navigate('/payment-success', {
+            state: {
+              ...paymentData,
+              paymentDetails: {
+                method: 'Mobile Money',
+                provider: momoProvider,
+                phone: phoneNumber,
+                transactionId: paymentReference,
+                status: 'completed',
+                timestamp: payment.processed_at || new Date().toISOString()
+              }
+            }
+          });
+          sessionStorage.removeItem('paymentReference');
+        }, 2000);
+        return true;
+        
+      } else if (payment.status === 'failed') {
+        setStatusMessage('Payment failed. Please try again.');
+        setTimeout(() => {
+          setStep('details');
+          sessionStorage.removeItem('paymentReference');
+        }, 3000);
+        return true;
+        
+      } else if (payment.status === 'cancelled') {
+        setStatusMessage('Payment was cancelled.');
+        setTimeout(() => {
+          setStep('details');
+          sessionStorage.removeItem('paymentReference');
+        }, 3000);
+        return true;
+      }
+      return false;
+    };
+    
+    const showWaitingMessage = (seconds: number) => {
+      if (seconds < 60) {
+        setStatusMessage(`Waiting for payment authorization... (${seconds}s)`);
+      } else {
+        setStatusMessage(`Waiting for payment authorization... (${Math.floor(seconds / 60)}m ${seconds % 60}s)`);
+      }
+    };
+    
     const pollPaymentStatus = async () => {
       try {
         const authToken = localStorage.getItem('auth_token');
@@ -164,50 +216,11 @@ export default function MomoCheckout() {
         
         setPollingAttempts(prev => prev + 1);
         
-        if (payment.status === 'successful') {
-          // Payment completed successfully
-          setStatusMessage('Payment completed successfully! 🎉');
-          
-          // Wait a moment then redirect
-          setTimeout(() => {
-            navigate('/payment-success', {
-              state: {
-                ...paymentData,
-                paymentDetails: {
-                  method: 'Mobile Money',
-                  provider: momoProvider,
-                  phone: phoneNumber,
-                  transactionId: paymentReference,
-                  status: 'completed',
-                  timestamp: payment.processed_at || new Date().toISOString()
-                }
-              }
-            });
-            sessionStorage.removeItem('paymentReference');
-          }, 2000);
-          
-        } else if (payment.status === 'failed') {
-          setStatusMessage('Payment failed. Please try again.');
-          setTimeout(() => {
-            setStep('details');
-            sessionStorage.removeItem('paymentReference');
-          }, 3000);
-          
-        } else if (payment.status === 'cancelled') {
-          setStatusMessage('Payment was cancelled.');
-          setTimeout(() => {
-            setStep('details');
-            sessionStorage.removeItem('paymentReference');
-          }, 3000);
-          
+        if (handlePaymentUpdate(payment)) {
+          return;
         } else if (pollingAttempts < 40) { // Poll for up to 2 minutes (40 attempts * 3 seconds)
           // Still processing, continue polling
-          const seconds = pollingAttempts * 3;
-          if (seconds < 60) {
-            setStatusMessage(`Waiting for payment authorization... (${seconds}s)`);
-          } else {
-            setStatusMessage(`Waiting for payment authorization... (${Math.floor(seconds / 60)}m ${seconds % 60}s)`);
-          }
+          showWaitingMessage(pollingAttempts * 3);
           setTimeout(pollPaymentStatus, 3000); // Check every 3 seconds
           
         } else {
@@ -225,8 +238,41 @@ export default function MomoCheckout() {
       }
     };
     
-    // Start polling after 2 seconds
-    setTimeout(pollPaymentStatus, 2000);
+    // Fall back to polling when server-sent events are unavailable
+    if (typeof EventSource === 'undefined') {
+      setTimeout(pollPaymentStatus, 2000);
+      return;
+    }
+    
+    // Let the server push status changes as they happen
+    const startedAt = Date.now();
+    const source = new EventSource(`http://localhost:8000/api/payments/${paymentReference}/status/stream/`);
+    const waitingTimer = setInterval(() => {
+      showWaitingMessage(Math.floor((Date.now() - startedAt) / 1000));
+    }, 1000);
+    const stopStream = () => {
+      source.close();
+      clearInterval(waitingTimer);
+      clearTimeout(streamTimeout);
+    };
+    const streamTimeout = setTimeout(() => {
+      // Timeout after 2 minutes - offer manual completion
+      stopStream();
+      setStatusMessage('Payment is taking longer than expected. You can complete it manually if you have authorized the payment.');
+    }, 120000);
+    
+    source.addEventListener('status', (event) => {
+      if (handlePaymentUpdate(JSON.parse((event as MessageEvent).data))) {
+        stopStream();
+      }
+    });
+    source.onerror = () => {
+      // The browser reconnects on its own unless the stream was refused
+      if (source.readyState === EventSource.CLOSED) {
+        stopStream();
+        setTimeout(pollPaymentStatus, 2000);
+      }
+    };
   };
 
   const handleConfirmPayment = async () => {
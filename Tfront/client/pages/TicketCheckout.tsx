@@ -142,13 +142,16 @@ export default function TicketCheckout() {
                 const paymentReference = paymentResult.payment.reference;
                 setStatusMessage('Payment request sent to your phone. Please check your mobile money app and authorize the payment.');
 
-                // Step 2: Poll for payment status
+                // Step 2: Long-poll for payment status; the server answers as soon as it changes
                 let attempts = 0;
-                const maxAttempts = 60; // 5 minutes (5 second intervals)
+                const maxAttempts = 60; // Retries after errors (5 second intervals)
+                const maxWaitSeconds = 300; // 5 minutes
+                const startedAt = Date.now();
+                let lastStatus = 'pending';
 
                 const pollPaymentStatus = async () => {
                     try {
-                        const statusResponse = await fetch(`http://localhost:8000/api/payments/${paymentReference}/status/`);
+                        const statusResponse = await fetch(`http://localhost:8000/api/payments/${paymentReference}/status/stream/?wait=10&since=${lastStatus}`);
                         const statusResult = await statusResponse.json();
 
                         if (statusResult.status === 'successful') {
@@ -158,6 +161,8 @@ export default function TicketCheckout() {
                                 method: 'POST',
                                 headers: {
                                     'Content-Type': 'application/json',
+                                    // One purchase per payment, even if this request is retried
+                                    'Idempotency-Key': `ticket-purchase-${paymentReference}`,
                                 },
                                 body: JSON.stringify({
                                     ticket_id: purchaseData.ticketId,
@@ -201,12 +206,13 @@ export default function TicketCheckout() {
                             setIsProcessing(false);
                             setStep('details');
                         } else if (statusResult.status === 'pending' || statusResult.status === 'processing') {
-                            attempts++;
-                            if (attempts < maxAttempts) {
-                                const minutes = Math.floor(attempts * 5 / 60);
-                                const seconds = attempts * 5 % 60;
+                            lastStatus = statusResult.status;
+                            const elapsed = Math.floor((Date.now() - startedAt) / 1000);
+                            if (elapsed < maxWaitSeconds) {
+                                const minutes = Math.floor(elapsed / 60);
+                                const seconds = elapsed % 60;
                                 setStatusMessage(`Waiting for payment authorization... (${minutes}:${String(seconds).padStart(2, '0')})`);
-                                setTimeout(pollPaymentStatus, 5000); // Poll every 5 seconds
+                                pollPaymentStatus(); // Held open by the server until the status changes
                             } else {
                                 setError('Payment timeout. Please try again or contact support if money was deducted.');
                                 setIsProcessing(false);
@@ -226,8 +232,8 @@ export default function TicketCheckout() {
                     }
                 };
 
-                // Start polling after 2 seconds
-                setTimeout(pollPaymentStatus, 2000);
+                // Start waiting for the payment status
+                pollPaymentStatus();
 
             } else {
                 setError(paymentResult.error || 'Failed to initiate payment');